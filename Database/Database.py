@@ -1,85 +1,321 @@
 import json
+import logging
+import queue
 import sqlite3
+import threading
+from concurrent.futures import Future
 from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
 
 import arrow
 from peewee import SqliteDatabase
+from Utils.Metrics import metrics
 from .Models.Event import Event, EventType, EventData
 
 class Dbase:
+    logger = logging.getLogger()
     db = SqliteDatabase(None)
     connection: sqlite3.Connection = None
+    tuned: bool = False
+    writerBatch: int = 100
+    _listeners: List[Callable[[EventData], None]] = []
+    defaultController: str = "boiler"
+    _latest: Dict[Tuple[str, EventType], Optional[EventData]] = {}  # Latest event per controller and type, written through by _addEvent
+    _queue: queue.Queue = None
+    _writer: threading.Thread = None
+    # Schema migrations applied in order, tracked with PRAGMA user_version
+    _migrations = [
+        "CREATE INDEX IF NOT EXISTS event_eventtype_ts ON event (eventType, ts)",
+        "ALTER TABLE event ADD COLUMN controller VARCHAR(50) NOT NULL DEFAULT 'boiler'",
+        "CREATE INDEX IF NOT EXISTS event_controller_eventtype_ts ON event (controller, eventType, ts)",
+        # Every lookup filters on the controller now, and fresh tables never had this one
+        "DROP INDEX IF EXISTS event_eventtype_ts",
+    ]
 
-    def __init__(self, database_name):
-        self.db.init(database_name)
+    def __init__(self, database_name, tuned: bool = False):
+        """
+        With `tuned` the database runs in WAL mode and events are written by a background thread in batched transactions.
+        """
+        self.tuned = tuned
+        if tuned:
+            self.db.init(database_name, pragmas={'journal_mode': 'wal', 'synchronous': 'normal'})
+        else:
+            self.db.init(database_name)
 
     def connect(self):
         self.db.connect()
         self.connection = self.db.connection()
         self.db.bind([Event])
+        if Event.table_exists():
+            self._migrate()
+            self.warm()
+
+        if self.tuned:
+            Dbase._queue = queue.Queue()
+            Dbase._writer = threading.Thread(target=self._writeEvents, name="DbaseWriter", daemon=True)
+            Dbase._writer.start()
 
     def create_tables(self):
         self.db.create_tables([Event])
+        # New tables already have the latest schema
+        self.db.pragma('user_version', len(self._migrations))
+        self.warm()
+
+    def close(self):
+        """Write out queued events and close the database."""
+        if self._writer is not None:
+            self._queue.put(None)
+            self._writer.join()
+            Dbase._writer = None
+            Dbase._queue = None
+        self.db.close()
+
+    def _migrate(self):
+        version = self.db.pragma('user_version')
+        for i, sql in enumerate(self._migrations[version:], start=version + 1):
+            self.logger.info(f"Database migration {i}: {sql}")
+            with self.db.atomic():
+                self.db.execute_sql(sql)
+                self.db.pragma('user_version', i)
+
+    @classmethod
+    def flush(cls):
+        """Block until every queued event is written."""
+        if cls._queue is not None:
+            cls._queue.join()
+
+    @classmethod
+    def _writeEvents(cls):
+        while True:
+            item = cls._queue.get()
+            batch: List[Tuple[dict, Future]] = []
+            stop = item is None
+            if not stop:
+                batch.append(item)
+
+            # Drain whatever else is waiting into the same transaction
+            while not stop and len(batch) < cls.writerBatch:
+                try:
+                    item = cls._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                else:
+                    batch.append(item)
+
+            if batch:
+                try:
+                    with metrics.timer("boiler_db_seconds", op="write_batch"), cls.db.atomic():
+                        rows = [Event.create(**fields) for fields, _ in batch]
+                    for (_, future), row in zip(batch, rows):
+                        future.set_result(row)
+                except Exception as e:
+                    cls.logger.error(f"Failed to write {len(batch)} events: {e}")
+                    for _, future in batch:
+                        future.set_exception(e)
+
+            for _ in range(len(batch) + (1 if stop else 0)):
+                cls._queue.task_done()
+
+            if stop:
+                cls.db.close()
+                return
+
+    @classmethod
+    def invalidate(cls, event: EventType = None, controller: str = None):
+        """
+        Drop the cached latest event of `event`, or of every type when None, so the next read reloads it.
+        Without `controller` the cache of every controller is dropped.
+        Call this after the event table was written by something other than this class.
+        """
+        cls.flush()
+        for key in list(cls._latest):
+            if (controller is None or key[0] == controller) and (event is None or key[1] == event):
+                del cls._latest[key]
+
+    @classmethod
+    def warm(cls):
+        """
+        Load the latest event of every controller and type in one query, so reads after connect() hit the cache.
+        Types a known controller never logged are cached as missing, other controllers are loaded on first read.
+        """
+        cls.flush()
+        cls._latest.clear()
+        types = {t.value: t for t in EventType}
+        with metrics.timer("boiler_db_seconds", op="select_latest"):
+            # SQLite fills the bare columns from the row holding MAX(ts)
+            rows = cls.db.execute_sql("SELECT controller, eventType, MAX(ts), value FROM event GROUP BY controller, eventType").fetchall()
+
+        for controller in {row[0] for row in rows}:
+            for event in EventType:
+                cls._latest[(controller, event)] = None
+        for controller, eventType, ts, value in rows:
+            event = types.get(eventType)
+            if event is not None:
+                cls._latest[(controller, event)] = EventData(eventType=event, ts=arrow.get(Event.ts.python_value(ts)), value=json.loads(value), controller=controller)
+
+    @classmethod
+    def _lastEvent(cls, event: EventType, controller: str = None) -> EventData or None:
+        controller = controller or cls.defaultController
+        key = (controller, event)
+        if key not in cls._latest:
+            cls.flush()
+            with metrics.timer("boiler_db_seconds", op="select_latest"):
+                x = Event.select().where((Event.controller == controller) & (Event.eventType == event.value)).order_by(Event.ts.desc()).limit(1).first()  # type: Event
+            if x is not None:
+                cls._latest[key] = EventData(eventType=event, ts=arrow.get(x.ts), value=json.loads(x.value), controller=controller)
+            else:
+                cls._latest[key] = None
+
+        return cls._latest[key]
 
     @classmethod
-    def _addEvent(cls, event: EventType, value: str = None, ts: arrow.Arrow = None):
+    def addListener(cls, listener: Callable[[EventData], None]):
+        """Call `listener` with every event added through this class."""
+        cls._listeners.append(listener)
+
+    @classmethod
+    def removeListener(cls, listener: Callable[[EventData], None]):
+        if listener in cls._listeners:
+            cls._listeners.remove(listener)
+
+    @classmethod
+    def _addEvent(cls, event: EventType, value: str = None, ts: arrow.Arrow = None, controller: str = None) -> Future:
+        """Returns a future for the created `Event` row, already resolved unless the background writer is running."""
         if ts is None:
             ts = datetime.now()
         else:
             ts = ts.naive
 
-        Event.create(ts=ts, eventType=event.value, value=value)
+        controller = controller or cls.defaultController
+        fields = dict(ts=ts, eventType=event.value, value=value, controller=controller)
+        future = Future()
+        if cls._queue is not None:
+            cls._queue.put((fields, future))
+        else:
+            with metrics.timer("boiler_db_seconds", op="insert"):
+                future.set_result(Event.create(**fields))
 
-    @classmethod
-    def eventWoodFilled(cls, ts: arrow.Arrow = None):
-        cls._addEvent(event=EventType.WoodFilled, ts=ts, value=json.dumps(True))
+        # Same timestamp a read back from the database would give
+        data = EventData(eventType=event, ts=arrow.get(ts), value=json.loads(value), controller=controller)
+        key = (controller, event)
+        latest = cls._latest.get(key)
+        if key in cls._latest and (latest is None or data.ts >= latest.ts):
+            cls._latest[key] = data
+
+        for listener in cls._listeners:
+            listener(data)
+
+        return future
 
     @classmethod
-    def eventShutdown(cls, value: bool, ts: arrow.Arrow = None):
-        cls._addEvent(event=EventType.Shutdown, ts=ts, value=json.dumps(value))
+    def eventWoodFilled(cls, ts: arrow.Arrow = None, controller: str = None) -> Future:
+        return cls._addEvent(event=EventType.WoodFilled, ts=ts, value=json.dumps(True), controller=controller)
 
     @classmethod
-    def eventBypassOpened(cls, value: bool, ts: arrow.Arrow = None):
-        cls._addEvent(event=EventType.Bypass, ts=ts, value=json.dumps(value))
+    def eventShutdown(cls, value: bool, ts: arrow.Arrow = None, controller: str = None) -> Future:
+        return cls._addEvent(event=EventType.Shutdown, ts=ts, value=json.dumps(value), controller=controller)
 
     @classmethod
-    def eventColdStart(cls, value: bool, ts: arrow.Arrow = None):
-        cls._addEvent(event=EventType.ColdStart, ts=ts, value=json.dumps(value))
+    def eventBypassOpened(cls, value: bool, ts: arrow.Arrow = None, controller: str = None) -> Future:
+        return cls._addEvent(event=EventType.Bypass, ts=ts, value=json.dumps(value), controller=controller)
 
     @classmethod
-    def eventHeating(cls, value: bool, ts: arrow.Arrow):
-        cls._addEvent(event=EventType.Heating, ts=ts, value=json.dumps(value))
+    def eventColdStart(cls, value: bool, ts: arrow.Arrow = None, controller: str = None) -> Future:
+        return cls._addEvent(event=EventType.ColdStart, ts=ts, value=json.dumps(value), controller=controller)
 
     @classmethod
-    def lastBypassOpened(cls) -> EventData:
-        x = Event.select().where(Event.eventType == EventType.Bypass.value).order_by(Event.ts.desc()).limit(1).first()  # type: Event
-        try:
-            ts = arrow.get(x.ts)
-        except AttributeError:
-            ts = arrow.get(0)
+    def eventHeating(cls, value: bool, ts: arrow.Arrow, controller: str = None) -> Future:
+        return cls._addEvent(event=EventType.Heating, ts=ts, value=json.dumps(value), controller=controller)
 
+    @classmethod
+    def lastBypassOpened(cls, controller: str = None) -> EventData:
+        x = cls._lastEvent(EventType.Bypass, controller)
         if x is not None:
-            return EventData(eventType=EventType(x.eventType), ts=ts, value=json.loads(x.value))
+            return x
         else:
-            return EventData(eventType=EventType.Bypass, ts=ts, value=True)
+            return EventData(eventType=EventType.Bypass, ts=arrow.get(0), value=True)
 
     @classmethod
-    def lastHeating(cls) -> EventData or None:
-        x = Event.select().where(Event.eventType == EventType.Heating.value).order_by(Event.ts.desc()).limit(1).first()  # type: Event
-        if x is not None:
-            return EventData(eventType=EventType(x.eventType), ts=arrow.get(x.ts), value=json.loads(x.value))
-
-        return None
+    def lastHeating(cls, controller: str = None) -> EventData or None:
+        return cls._lastEvent(EventType.Heating, controller)
 
     @classmethod
-    def lastWoodFilled(cls) -> EventData:
-        x = Event.select().where(Event.eventType == EventType.WoodFilled.value).order_by(Event.ts.desc()).limit(1).first()  # type: Event
-        try:
-            ts = arrow.get(x.ts)
-        except AttributeError:
-            ts = arrow.get(0)
-
+    def lastWoodFilled(cls, controller: str = None) -> EventData:
+        x = cls._lastEvent(EventType.WoodFilled, controller)
         if x is not None:
-            return EventData(eventType=EventType(x.eventType), ts=ts, value=json.loads(x.value))
+            return x
         else:
-            return EventData(eventType=EventType.WoodFilled, ts=ts, value=True)
+            return EventData(eventType=EventType.WoodFilled, ts=arrow.get(0), value=True)
+
+    @classmethod
+    def events(cls, event: EventType, start: arrow.Arrow = None, end: arrow.Arrow = None, controller: str = None) -> List[EventData]:
+        """Events of one type with start <= ts < end, oldest first."""
+        controller = controller or cls.defaultController
+        cls.flush()
+        query = Event.select().where((Event.controller == controller) & (Event.eventType == event.value))
+        if start is not None:
+            query = query.where(Event.ts >= start.naive)
+        if end is not None:
+            query = query.where(Event.ts < end.naive)
+        return [EventData(eventType=event, ts=arrow.get(x.ts), value=json.loads(x.value), controller=controller) for x in query.order_by(Event.ts)]
+
+    def scoped(self, controller: str) -> "ControllerDb":
+        """Event access bound to one controller."""
+        return ControllerDb(self, controller)
+
+class ControllerDb:
+    """
+    The events of one controller in a shared `Dbase`.
+    Has the same event and lookup methods as `Dbase` without the controller argument.
+    """
+
+    def __init__(self, db: Dbase, controller: str):
+        self.db = db
+        self.controller = controller
+
+    def flush(self):
+        self.db.flush()
+
+    def invalidate(self, event: EventType = None):
+        self.db.invalidate(event, controller=self.controller)
+
+    def addListener(self, listener: Callable[[EventData], None]) -> Callable[[EventData], None]:
+        """Call `listener` with every event added for this controller. Returns what to pass to `removeListener`."""
+        def _filtered(event: EventData):
+            if event.controller == self.controller:
+                listener(event)
+
+        self.db.addListener(_filtered)
+        return _filtered
+
+    def removeListener(self, listener: Callable[[EventData], None]):
+        self.db.removeListener(listener)
+
+    def eventWoodFilled(self, ts: arrow.Arrow = None) -> Future:
+        return self.db.eventWoodFilled(ts=ts, controller=self.controller)
+
+    def eventShutdown(self, value: bool, ts: arrow.Arrow = None) -> Future:
+        return self.db.eventShutdown(value, ts=ts, controller=self.controller)
+
+    def eventBypassOpened(self, value: bool, ts: arrow.Arrow = None) -> Future:
+        return self.db.eventBypassOpened(value, ts=ts, controller=self.controller)
+
+    def eventColdStart(self, value: bool, ts: arrow.Arrow = None) -> Future:
+        return self.db.eventColdStart(value, ts=ts, controller=self.controller)
+
+    def eventHeating(self, value: bool, ts: arrow.Arrow) -> Future:
+        return self.db.eventHeating(value, ts=ts, controller=self.controller)
+
+    def events(self, event: EventType, start: arrow.Arrow = None, end: arrow.Arrow = None) -> List[EventData]:
+        return self.db.events(event, start, end, controller=self.controller)
+
+    def lastBypassOpened(self) -> EventData:
+        return self.db.lastBypassOpened(self.controller)
+
+    def lastHeating(self) -> EventData or None:
+        return self.db.lastHeating(self.controller)
+
+    def lastWoodFilled(self) -> EventData:
+        return self.db.lastWoodFilled(self.controller)
@@ -26,8 +26,15 @@ class EventData:
     eventType: EventType
     ts: arrow.Arrow
     value: bool
+    controller: str = "boiler"
 
 class Event(BaseModel):
     eventType = CharField(max_length=50)
     ts = DateTimeField(default=datetime.now)
     value = CharField(max_length=50)
+    controller = CharField(max_length=50, default="boiler")  # Name of the controller the event came from
+
+    class Meta:
+        indexes = (
+            (('controller', 'eventType', 'ts'), False),
+        )
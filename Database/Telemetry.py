@@ -0,0 +1,167 @@
+from __future__ import annotations
+
+__all__ = [
+    "TelemetryStore",
+]
+
+import logging
+import os
+from typing import BinaryIO, Dict, List, Tuple
+
+import arrow
+import numpy as np
+
+from Models.BoilerData import BoilerData, BoilerStatus
+
+class TelemetryStore:
+    """
+    Append-only columnar history of every BoilerData sample.
+    Each day is a directory holding one fixed-width little-endian file per column, read back with `np.memmap`.
+    """
+    logger = logging.getLogger()
+    columns: List[Tuple[str, str]] = [
+        ("ts", "<i8"),  # Microseconds since epoch
+        ("status", "u1"),  # Index into BoilerStatus
+        ("waterTemp", "<f4"),
+        ("o2", "<f4"),
+        ("topAir", "<f4"),
+        ("botAir", "<f4"),
+        ("topAirPct", "<f4"),
+        ("botAirPct", "<f4"),
+        ("waterSlope", "<f4"),
+        ("o2Slope", "<f4"),
+        ("tempAvg", "<f4"),
+        ("o2Avg", "<f4"),
+        ("fan", "u1"),
+        ("bypass", "u1"),
+        ("shutdown", "u1"),
+        ("coldStart", "u1"),
+        ("highLimit", "u1"),
+        ("lowWater", "u1"),
+        ("alarmLt", "u1"),
+        ("woodLow", "u1"),
+        ("woodEmpty", "u1"),
+        ("condensing", "u1"),
+    ]
+    statuses: List[BoilerStatus] = list(BoilerStatus)
+
+    def __init__(self, path: str):
+        self.path = path
+        self._day: str or None = None
+        self._files: Dict[str, BinaryIO] = {}
+        self._dtypes = {name: np.dtype(dtype) for name, dtype in self.columns}
+
+    def _dayPath(self, day: str) -> str:
+        return os.path.join(self.path, day)
+
+    def _open(self, day: str):
+        self.close()
+        dayPath = self._dayPath(day)
+        os.makedirs(dayPath, exist_ok=True)
+        self._day = day
+
+        # Trim a partial row left by a crash so the columns stay aligned
+        files = {name: os.path.join(dayPath, f"{name}.bin") for name in self._dtypes}
+        rows = min((os.path.getsize(f) if os.path.exists(f) else 0) // self._dtypes[name].itemsize for name, f in files.items())
+        for name, f in files.items():
+            if os.path.exists(f) and os.path.getsize(f) != rows * self._dtypes[name].itemsize:
+                self.logger.warning(f"Trimming telemetry column {f} to {rows} rows")
+                os.truncate(f, rows * self._dtypes[name].itemsize)
+
+        self._files = {name: open(f, "ab") for name, f in files.items()}
+
+    def _row(self, bd: BoilerData) -> Dict[str, object]:
+        return {
+            "ts": self._micros(bd.ts),
+            "status": self.statuses.index(bd.status),
+            "waterTemp": bd.waterTemp,
+            "o2": bd.o2,
+            "topAir": bd.topAir,
+            "botAir": bd.botAir,
+            "topAirPct": bd.topAirPct,
+            "botAirPct": bd.botAirPct,
+            "waterSlope": bd.waterSlope,
+            "o2Slope": bd.o2Slope,
+            "tempAvg": bd.tempAvg,
+            "o2Avg": bd.o2Avg,
+            "fan": bool(bd.fan),
+            "bypass": bool(bd.bypass),
+            "shutdown": bool(bd.shutdown),
+            "coldStart": bool(bd.coldStart),
+            "highLimit": bool(bd.highLimit),
+            "lowWater": bool(bd.lowWater),
+            "alarmLt": bool(bd.alarmLt),
+            "woodLow": bool(bd.woodLow),
+            "woodEmpty": bool(bd.woodEmpty),
+            "condensing": bool(bd.condensing),
+        }
+
+    def append(self, bd: BoilerData):
+        if bd is None or bd.ts is None:
+            return
+
+        day = bd.ts.to('UTC').format('YYYY-MM-DD')
+        if day != self._day:
+            self._open(day)
+
+        for name, value in self._row(bd).items():
+            f = self._files[name]
+            f.write(np.array(value, dtype=self._dtypes[name]).tobytes())
+            f.flush()
+
+    def _readDay(self, day: str) -> Dict[str, np.ndarray] or None:
+        dayPath = self._dayPath(day)
+        if not os.path.isdir(dayPath):
+            return None
+
+        arrays = {}
+        for name, dtype in self._dtypes.items():
+            file = os.path.join(dayPath, f"{name}.bin")
+            rows = os.path.getsize(file) // dtype.itemsize if os.path.exists(file) else 0
+            if rows == 0:
+                return None
+            # Only whole records, a crash can leave a partial one at the end
+            arrays[name] = np.memmap(file, dtype=dtype, mode="r", shape=(rows,))
+
+        # A crash mid-append can leave columns one row apart
+        rows = min(a.shape[0] for a in arrays.values())
+        return {name: a[:rows] for name, a in arrays.items()}
+
+    def read(self, start: arrow.Arrow, end: arrow.Arrow) -> Dict[str, np.ndarray]:
+        """
+        Columns for samples with start <= ts < end.
+        A range inside a single day returns views onto the memory-mapped files without copying.
+        """
+        startUs = self._micros(start)
+        endUs = self._micros(end)
+        parts: List[Dict[str, np.ndarray]] = []
+
+        for day in arrow.Arrow.range('day', start.to('UTC').floor('day'), end.to('UTC')):
+            arrays = self._readDay(day.format('YYYY-MM-DD'))
+            if arrays is None:
+                continue
+
+            ts = arrays["ts"]
+            lo = np.searchsorted(ts, startUs, side="left")
+            hi = np.searchsorted(ts, endUs, side="left")
+            if hi > lo:
+                parts.append({name: a[lo:hi] for name, a in arrays.items()})
+
+        if len(parts) == 1:
+            return parts[0]
+
+        if not parts:
+            return {name: np.empty(0, dtype=dtype) for name, dtype in self._dtypes.items()}
+
+        return {name: np.concatenate([p[name] for p in parts]) for name in self._dtypes}
+
+    @staticmethod
+    def _micros(ts: arrow.Arrow) -> int:
+        delta = ts - arrow.get(0)
+        return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+    def close(self):
+        for f in self._files.values():
+            f.close()
+        self._files = {}
+        self._day = None
@@ -6,10 +6,10 @@ __all__ = [
     "TrackedBool"
 ]
 
-from typing import Optional
+from typing import Dict, Optional
 
 import arrow
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from enum import Enum
 
 class BoilerStatus(Enum):
@@ -48,12 +48,12 @@ class TrackedBool:
 
 class BoilerData(BaseModel):
     ts: Optional[arrow.Arrow] = None
-    coldStart: TrackedBool = TrackedBool(False)  # ON = cold start pressed
+    coldStart: TrackedBool = Field(default_factory=lambda: TrackedBool(False))  # ON = cold start pressed
     highLimit: bool = None  # ON = temp to high
     lowWater: bool = None  # ON = water low
-    bypass: TrackedBool = TrackedBool(False)  # ON = bypass lever open
+    bypass: TrackedBool = Field(default_factory=lambda: TrackedBool(False))  # ON = bypass lever open
     fan: bool = None  # ON = fan running
-    shutdown: TrackedBool = TrackedBool(False)  # ON = boiler shutdown, OFF = boiler ok
+    shutdown: TrackedBool = Field(default_factory=lambda: TrackedBool(False))  # ON = boiler shutdown, OFF = boiler ok
     alarmLt: bool = None  # ON = alarm light on
     waterTemp: float = 0.0
     o2: float = 0.0
@@ -74,6 +74,14 @@ class BoilerData(BaseModel):
     lastBypassOpenedHuman: str = ""
     lastWoodFilled: Optional[arrow.Arrow] = arrow.get(0)
     lastWoodFilledHuman: str = ""
+    fieldTs: Dict[str, arrow.Arrow] = {}  # When each controller variable and the status were last read
 
     class Config:
         arbitrary_types_allowed = True
+
+    def age(self, field: str, now: arrow.Arrow = None) -> Optional[float]:
+        """Seconds since `field` was last read from the controller, None when it never was."""
+        ts = self.fieldTs.get(field)
+        if ts is None:
+            return None
+        return ((now or arrow.utcnow()) - ts).total_seconds()
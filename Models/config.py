@@ -2,23 +2,61 @@ __all__ = [
     "Config",
 ]
 
+import re
+from typing import Dict, Literal
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
-from pydantic import Field, computed_field
+from pydantic import Field, computed_field, model_validator
 from urllib.parse import urljoin
 
+_CONTROLLER_NAME = re.compile(r'^[a-z0-9][a-z0-9-]*$')
+
 class Config(BaseSettings):
     model_config = SettingsConfigDict(env_ignore_empty=True)
 
-    hmUrlBase: str = Field(alias='HM_URL')
+    hmUrlBase: str = Field(alias='HM_URL', default="")
+    hmControllers: str = Field(alias='HM_CONTROLLERS', default="")  # Comma separated name=url pairs to poll several controllers. Empty polls HM_URL as "boiler"
+    hmPollWorkers: int = Field(alias='HM_POLL_WORKERS', default=4)  # How many controllers are polled at the same time
     hmPassword: str = Field(alias='HM_PASSWORD', default="heatmaster")
+    hmTokenMaxAgeSecs: int = Field(alias='HM_TOKEN_MAX_AGE_SECS', default=0)  # Log in again after this many seconds even if the token is still accepted. 0 disables
+    hmMaxConcurrentRequests: int = Field(alias='HM_MAX_CONCURRENT_REQUESTS', default=2)  # Requests the async client keeps in flight at once
+    hmClickDelaySecs: float = Field(alias='HM_CLICK_DELAY_SECS', default=2.0)  # Wait after a menu click before reading the screen
+    hmClickDownCmd: str = Field(alias='HM_CLICK_DOWN_CMD', default="")  # MSGCLICK command for the down arrow. Empty only navigates up
+    hmBatchReads: bool = Field(alias='HM_BATCH_READS', default=True)  # Merge neighbouring controller variables into one GETVARS request
+    hmSlowVars: str = Field(alias='HM_SLOW_VARS', default="lowWater,coldStart,highLimit")  # Comma separated variables that rarely change and are read every HM_SLOW_VARS_EVERY cycles
+    hmSlowVarsEvery: int = Field(alias='HM_SLOW_VARS_EVERY', default=4)  # Cycles between reads of the slow variables. 1 reads everything every cycle
 
     mqttServer: str = Field(alias='MQTT_BROKER')
+    mqttPort: int = Field(alias='MQTT_PORT', default=1883)
     mqttUser: str = Field(alias='MQTT_USER')
     mqttPasswd: str = Field(alias='MQTT_PASSWORD')
     mqttBaseTopic: str = Field(alias='MQTT_BASE_TOPIC', default='homie/')
+    mqttStateTopic: str = Field(alias='MQTT_STATE_TOPIC', default="")  # Topic for one aggregate message with every boiler field per cycle. {id} is the controller name. Empty disables
+    mqttStateFormat: Literal['json', 'msgpack'] = Field(alias='MQTT_STATE_FORMAT', default='json')  # Encoding of the aggregate state message
+    mqttStateOnly: bool = Field(alias='MQTT_STATE_ONLY', default=False)  # Publish only the aggregate state message, not the Homie property values
+    mqttSpoolEnabled: bool = Field(alias='MQTT_SPOOL_ENABLED', default=True)  # Spool publishes while the broker is unreachable
+    mqttSpoolPath: str = Field(alias='MQTT_SPOOL_PATH', default='./Store/mqtt_spool.jsonl')  # File publishes go to while the broker is unreachable
+    mqttSpoolMaxMb: float = Field(alias='MQTT_SPOOL_MAX_MB', default=16.0)  # Size the spool is compacted at
+    mqttSpoolHistory: str = Field(alias='MQTT_SPOOL_HISTORY', default="")  # Comma separated topic filters that keep every spooled value instead of only the newest
+    mqttSpoolDrainRate: float = Field(alias='MQTT_SPOOL_DRAIN_RATE', default=200.0)  # Spooled messages per second sent after reconnecting
+    mqttSpoolDrainBatch: int = Field(alias='MQTT_SPOOL_DRAIN_BATCH', default=100)  # Spooled messages sent per batch
 
+    telemetryEnabled: bool = Field(alias='TELEMETRY_ENABLED', default=True)  # Store every boiler sample in the telemetry history
+    telemetryPath: str = Field(alias='TELEMETRY_PATH', default='./Store/telemetry')
+    recordPath: str = Field(alias='RECORD_PATH', default="")  # Directory to record every poll cycle to for replay. Empty disables
+    dbTuned: bool = Field(alias='DB_TUNED', default=True)  # WAL journal and batched background writes for the event database
+    metricsPort: int = Field(alias='METRICS_PORT', default=0)  # Serve Prometheus metrics on this port. 0 disables
+    metricsHost: str = Field(alias='METRICS_HOST', default='127.0.0.1')  # Address the metrics endpoint listens on
+    homieStats: bool = Field(alias='HOMIE_STATS', default=False)  # Publish latency and counter summaries as Homie $stats with the heartbeat
     homiePublishStatusSeconds: int = Field(alias='PUBLISH_STATUS_SECS', default=15)  # How often to publish the homie status
+    homieFullRefreshSecs: int = Field(alias='PUBLISH_FULL_REFRESH_SECS', default=300)  # Republish unchanged properties after this many seconds. 0 only publishes changes
     updateBoilerSeconds: int = Field(alias='UPDATE_BOILER_SECS', default=15)  # How often to update the boiler data in seconds
+    pollAdaptive: bool = Field(alias='POLL_ADAPTIVE', default=False)  # Pick each poll interval from the boiler state instead of always using UPDATE_BOILER_SECS
+    pollMinSecs: int = Field(alias='POLL_MIN_SECS', default=5)  # Shortest adaptive poll interval, used during transitions
+    pollMaxSecs: int = Field(alias='POLL_MAX_SECS', default=120)  # Longest adaptive poll interval, reached while the boiler stays quiet
+    pollBackoff: float = Field(alias='POLL_BACKOFF', default=1.5)  # Interval multiplier for each quiet poll
+    pollWaterRate: float = Field(alias='POLL_WATER_RATE', default=1.0)  # Water temp change in °F per minute that counts as a transition
+    pollO2Rate: float = Field(alias='POLL_O2_RATE', default=0.5)  # O2 change in percent per minute that counts as a transition
     shutdownTemp: float = Field(alias='SHUTDOWN_TEMP', default=119.0)  # Temp where boiler shuts down
     woodEmptyO2: float = Field(alias='WOOD_EMPTY_O2', default=15.0)  # O2 percent when no wood in boiler or wood is not burning
     woodLowO2: float = Field(alias='WOOD_LOW_O2', default=10.0)  # O2 percent when just coals are in boiler
@@ -28,6 +66,8 @@ class Config(BaseSettings):
     bypassOpenedWoodCheckMins: int = Field(alias='BYPASS_OPENED_WOOD_CHECK_MINS', default=30)  # How many minutes to wait before checking if wood is low or empty
     bypassWoodFilledMins: int = Field(alias='BYPASS_WOOD_FILLED_MINS', default=120)  # How many minutes between bypass open to count as a wood fill event
     woodLowCalcOffsetHours: int = Field(alias='WOOD_LOW_CALC_OFFSET_HRS', default=-3)  # How many hours to offset the calculated next wood fill needed
+    waterTempWindowLen: int = Field(alias='WATER_TEMP_WINDOW_LEN', default=8)  # Samples in the water temp slope / average window
+    o2WindowLen: int = Field(alias='O2_WINDOW_LEN', default=8)  # Samples in the O2 slope / average window
     woodCalcLimit: int = Field(alias='WOOD_CALC_LIMIT', default=20)  # Select the last n wood fills for calc
 
     # These should match the boiler settings
@@ -40,3 +80,35 @@ class Config(BaseSettings):
     @property
     def hmUrl(self) -> str:
         return urljoin(self.hmUrlBase, "/AJAX")
+
+    @property
+    def controllerUrls(self) -> Dict[str, str]:
+        """Controller name -> base url. The name is also the Homie device id."""
+        if not self.hmControllers.strip():
+            return {"boiler": self.hmUrlBase}
+
+        urls = {}
+        for entry in self.hmControllers.split(','):
+            name, _, url = entry.strip().partition('=')
+            name = name.strip()
+            url = url.strip()
+            if not _CONTROLLER_NAME.match(name) or not url:
+                raise ValueError(f"HM_CONTROLLERS entry '{entry}' must be name=url with a lowercase name of letters, digits and dashes")
+            if name in urls:
+                raise ValueError(f"HM_CONTROLLERS has controller '{name}' more than once")
+            urls[name] = url
+
+        return urls
+
+    @model_validator(mode='after')
+    def _checkControllers(self) -> "Config":
+        if not self.hmUrlBase and not self.hmControllers.strip():
+            raise ValueError("Either HM_URL or HM_CONTROLLERS must be set")
+        self.controllerUrls  # noqa Raises on a bad HM_CONTROLLERS
+        if self.hmControllers.strip() and self.mqttStateTopic and '{id}' not in self.mqttStateTopic:
+            raise ValueError("MQTT_STATE_TOPIC must contain {id} when polling several controllers")
+        return self
+
+    def controllerConfigs(self) -> Dict[str, "Config"]:
+        """A copy of this config for every controller, each pointing at its own url."""
+        return {name: self.model_copy(update={'hmUrlBase': url, 'hmControllers': ''}) for name, url in self.controllerUrls.items()}
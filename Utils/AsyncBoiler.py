@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+__all__ = [
+    "AsyncBoiler",
+]
+
+import asyncio
+from typing import Awaitable, TypeVar
+
+from Database.Database import Dbase
+from Models.BoilerData import BoilerData
+from Models.config import Config
+from Utils.AsyncController import AsyncController
+from Utils.Boiler import Boiler
+from Utils.Clock import Clock
+from Utils.Decoder import Screen
+from Utils.Metrics import metrics
+from Utils.Navigator import Navigator
+
+T = TypeVar("T")
+
+class AsyncBoiler(Boiler):
+    """
+    asyncio poll engine. Runs the same decoding and wood checks as `Boiler`
+    but talks to the controller through `AsyncController`, so waiting on the controller never blocks the event loop.
+    """
+    _client: AsyncController
+
+    def __init__(self, db: Dbase, config: Config = None, name: str = Dbase.defaultController, clock: Clock = None, seed: int = None):
+        super().__init__(db, config=config, name=name, clock=clock, seed=seed)
+        self._client = AsyncController(self.config, name=self.name, clock=self.clock)
+        # Serializes cycles between coroutines, `lock` is re-entrant for the loop thread so it can not
+        self._cycleLock = asyncio.Lock()
+
+    async def _findStatusScreenAsync(self) -> Screen:
+        # Check for main page, the first read is enough when the status screen is already up
+        start = self.clock.monotonic()
+        clicks = 0
+        el = await self._client.msgGet()
+        for _ in range(0, 49):
+            if self._isStatusScreen(el):
+                break
+
+            # Click towards the status screen and try again
+            title = self._screenTitle(el)
+            move = self._nav.nextMove(title)
+            if move == Navigator.DOWN:
+                await self._client.msgClickDown()
+            else:
+                await self._client.msgClickUp()
+            clicks += 1
+            await asyncio.sleep(self.config.hmClickDelaySecs)
+
+            el = await self._client.msgGet()
+            self._nav.observe(title, move, self._screenTitle(el))
+
+        self._nav.record(clicks, self.clock.monotonic() - start)
+        self.logger.debug(f"Navigation: {clicks} clicks. {self._nav.stats}")
+        return el
+
+    async def _updateBoilerAsync(self):
+        bd = self.boilerData
+        if bd is None:
+            bd = BoilerData()
+            self.logger.debug("NEW BOILER DATA CREATED")
+
+        with metrics.timer("boiler_phase_seconds", controller=self.name, phase="login"):
+            if not await self._client.ensureLogin():
+                self.boilerData = None
+                return
+
+        # `lock` is only taken around the synchronous steps, a command thread holding it would otherwise stall the loop for a whole cycle
+        with self.lock:
+            bd.ts = self.clock.utcnow()
+            bd.lastWoodFilled = self._db.lastWoodFilled().ts
+            bd.lastWoodFilledHuman = bd.lastWoodFilled.humanize(self.clock.utcnow())
+
+        """ Status / Variables """
+        # Screen navigation and variable reads do not depend on each other
+        # The status is not known before the reads start, so a change pulls in the slow variables afterwards
+        plan, full = self._planForCycle()
+        el, vals = await asyncio.gather(
+            self._timed("navigate", self._findStatusScreenAsync()),
+            self._timed("read", plan.executeAsync(self._client.getVars)),
+        )
+        if self._needsFullRefresh(el, vals) and not full:
+            vals.update(await self._timed("read", self._slowPlan.executeAsync(self._client.getVars)))
+
+        with metrics.timer("boiler_phase_seconds", controller=self.name, phase="apply"), self.lock:
+            self._applyUpdate(bd, el, vals)
+
+    async def _timed(self, phase: str, coro: Awaitable[T]) -> T:
+        with metrics.timer("boiler_phase_seconds", controller=self.name, phase=phase):
+            return await coro
+
+    async def getData(self, force: bool = False) -> BoilerData:
+        if force or self.timeToUpdate():
+            # Same cycle framing as Boiler.getData
+            async with self._cycleLock:
+                if self.recorder is not None:
+                    self.recorder.beginCycle()
+                try:
+                    with metrics.timer("boiler_cycle_seconds", controller=self.name):
+                        await self._updateBoilerAsync()
+                finally:
+                    if self.recorder is not None:
+                        self.recorder.endCycle()
+        self.logger.info(f"Boiler {self.name} last updated at {self.lastUpdate}")
+
+        return self.boilerData
+
+    async def close(self):
+        self._db.removeListener(self._listener)
+        await self._client.close()
@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+__all__ = [
+    "AsyncController",
+]
+
+import asyncio
+
+import aiohttp
+
+from Models.config import Config
+from Utils.Clock import Clock
+from Utils.Controller import Controller, Reply
+from Utils.Decoder import Screen, parseScreen, parseVar
+from Utils.Metrics import metrics
+
+class AsyncController(Controller):
+    """
+    asyncio version of the HeatMaster controller client built on aiohttp.
+    Shares the login handshake and parsing with `Controller`. At most `hmMaxConcurrentRequests` requests are in flight at once.
+    """
+    _asyncSession: aiohttp.ClientSession = None
+    _active: int = 0  # Requests currently using the session
+    _broken: bool = False  # A connection failed, the session is replaced once no request uses it
+
+    def __init__(self, config: Config, name: str = "boiler", clock: Clock = None):
+        super().__init__(config, name=name, clock=clock)
+        self._limit = asyncio.Semaphore(config.hmMaxConcurrentRequests)
+
+    def _newAsyncSession(self):
+        self._asyncSession = aiohttp.ClientSession(headers={
+            'Cache-Control': 'no-cache,no-store,must-revalidate',
+            'Pragma': 'no-cache',
+            'Content-Encoding': 'gzip',
+            'Accept': '*/*',
+            'Accept-Encoding': 'gzip, deflate',
+            'App-Language': '1'
+        })
+        self._sessionRequests = 0
+
+    async def _postAsync(self, data: str, hint: str or None) -> Reply:
+        try:
+            reply = await self._sendAsync(data, hint)
+        except aiohttp.ClientConnectionError as e:
+            if self.recorder is not None:
+                self.recorder.exchange(data, hint, None, error=e)
+            raise
+
+        if self.recorder is not None:
+            self.recorder.exchange(data, hint, reply)
+        return reply
+
+    async def _sendAsync(self, data: str, hint: str or None) -> Reply:
+        if self._asyncSession is None or self._asyncSession.closed:
+            self._newAsyncSession()
+
+        if self._sessionRequests > 0:
+            self.reusedConnections += 1
+        self._sessionRequests += 1
+
+        headers = {'Security-Hint': hint} if hint is not None else None
+        self._active += 1
+        try:
+            async with self._limit:
+                with metrics.timer("boiler_request_seconds", controller=self.name, command=data.split(':', 1)[0]):
+                    async with self._asyncSession.post(url=self.config.hmUrl, headers=headers, data=data) as resp:
+                        return Reply(resp.status, await resp.text())
+        except aiohttp.ClientConnectionError:
+            # Gathered requests may still be using the session, so it is only dropped once they finish
+            self._broken = True
+            raise
+        finally:
+            self._active -= 1
+            if self._broken and self._active == 0:
+                await self._dropSession()
+
+    async def _dropSession(self):
+        """Close the broken session so the next request starts clean."""
+        session = self._asyncSession
+        self._asyncSession = None
+        self._broken = False
+        self.reconnects += 1
+        metrics.inc("boiler_reconnects_total", controller=self.name)
+        if session is not None:
+            await session.close()
+
+    async def login(self) -> bool:
+        _, challenge = await self._postAsync(data=self._challengeCommand(), hint='p')
+        cmd = self._loginCommand(challenge)
+        if cmd is None:
+            self.logger.error(f"Login failed: {challenge}")
+            return False
+
+        _, response = await self._postAsync(data=cmd[1], hint=cmd[0])
+        return self._loginResult(challenge, response)
+
+    async def _loginRetry(self) -> bool:
+        for _ in range(0, 4):
+            if await self.login():
+                return True
+
+        return False
+
+    async def ensureLogin(self) -> bool:
+        if self._token is None:
+            return await self._loginRetry()
+
+        if self._tokenExpired():
+            self.logger.info("Refreshing controller token")
+            return await self._loginRetry()
+
+        text = await self.post("GETSTDG")
+        if "Running" not in text:
+            self.logger.info("Logging in after timeout")
+            return await self._loginRetry()
+
+        return True
+
+    async def post(self, data: str) -> str:
+        status, text = await self._postAsync(data=data, hint=self._token)
+        if status in (401, 403):
+            self.logger.info(f"Controller rejected token with {status}. Logging in again")
+            metrics.inc("boiler_relogins_total", controller=self.name)
+            if await self._loginRetry():
+                status, text = await self._postAsync(data=data, hint=self._token)
+
+        return text
+
+    async def getVars(self, command: str) -> int or None:
+        return parseVar(await self.post(command))
+
+    async def msgGet(self) -> Screen:
+        text = await self.post("MSGGET:bm,-1")
+        self.logger.debug(f"Request Response: {text}")
+        return parseScreen(text)
+
+    async def msgClickUp(self):
+        await self.post("MSGCLICK:bm,1,1")
+
+    async def msgClickDown(self):
+        await self.post(self.config.hmClickDownCmd)
+
+    async def close(self):
+        if self._asyncSession is not None:
+            await self._asyncSession.close()
+            self._asyncSession = None
@@ -0,0 +1,253 @@
+from __future__ import annotations
+
+__all__ = [
+    "Backtest",
+    "parseAxis",
+    "product",
+    "sweep",
+    "sweepable",
+]
+
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from Database.Telemetry import TelemetryStore
+from Models.BoilerData import BoilerStatus
+from Models.config import Config
+
+# Config fields the backtest can sweep
+sweepable: List[str] = [
+    "woodEmptyO2",
+    "woodLowO2",
+    "condensingTemp",
+    "woodLowHeatingMins",
+    "woodEmptyCheckMins",
+    "bypassOpenedWoodCheckMins",
+    "waterTempWindowLen",
+    "o2WindowLen",
+]
+
+_MINUTE = 60 * 1000000  # Telemetry timestamps are microseconds
+_NEVER = np.iinfo(np.int64).min // 2
+
+def parseAxis(spec: str) -> Tuple[str, np.ndarray]:
+    """
+    Parse `name=start:stop:step` (stop included) or `name=a,b,c` into a sweep axis.
+    """
+    name, _, values = spec.partition('=')
+    name = name.strip()
+    if name not in sweepable:
+        raise ValueError(f"Can not sweep {name}. Pick one of {', '.join(sweepable)}")
+
+    if ':' in values:
+        start, stop, step = (float(x) for x in values.split(':'))
+        axis = np.arange(start, stop + step / 2, step)
+    else:
+        axis = np.array([float(x) for x in values.split(',') if x.strip()])
+
+    if axis.size == 0:
+        raise ValueError(f"No values for {name}")
+    if name.endswith("WindowLen") and axis.min() < 2:
+        # Same limit as RollingStats, the poller can not run with a shorter window
+        raise ValueError(f"{name} must be at least 2")
+    return name, axis
+
+def product(config: Config, axes: Dict[str, Sequence[float]]) -> Dict[str, np.ndarray]:
+    """Every combination of `axes` as one column per sweepable field. Fields without an axis keep the config value."""
+    grids = np.meshgrid(*[np.asarray(v, dtype=np.float64) for v in axes.values()], indexing='ij') if axes else []
+    size = grids[0].size if grids else 1
+    combos = {name: np.full(size, float(getattr(config, name))) for name in sweepable}
+    for name, grid in zip(axes, grids):
+        combos[name] = grid.ravel()
+    return combos
+
+class Backtest:
+    """
+    Replays the wood low / empty rules of `Boiler._updateBoiler` over a telemetry series for many threshold
+    combinations at once. Each rule becomes a (combinations x samples) boolean array.
+
+    Alerts are scored against the logged wood fills. A fill counts as a hit when wood low was raised within
+    `horizonMins` before it and was still raised. Every other rise is a false alarm.
+
+    Unlike the live poller, the empty check cadence is modelled as fixed buckets of `woodEmptyCheckMins`,
+    and "wood low by time" from the fill forecaster is left out, so only the sensor rules are tuned.
+    """
+    logger = logging.getLogger()
+    # Samples the poller never pushes into its rolling windows
+    skipped = [BoilerStatus.OFFLINE, BoilerStatus.ERROR, BoilerStatus.PUB_SHUTDOWN, BoilerStatus.NONE]
+
+    def __init__(self, series: Dict[str, np.ndarray], fills: Sequence[int], horizonMins: float = 180.0):
+        statuses = TelemetryStore.statuses
+        status = np.asarray(series["status"])
+        keep = ~np.isin(status, [statuses.index(s) for s in self.skipped])
+
+        self.ts = np.asarray(series["ts"], dtype=np.int64)[keep]
+        self.size = self.ts.size
+        status = status[keep]
+        self.waterTemp = np.asarray(series["waterTemp"], dtype=np.float64)[keep]
+        self.o2 = np.asarray(series["o2"], dtype=np.float64)[keep]
+        self.bypass = np.asarray(series["bypass"], dtype=bool)[keep]
+        self.shutdown = np.asarray(series["shutdown"], dtype=bool)[keep]
+        self.heating = status == statuses.index(BoilerStatus.HEATING)
+        self.lowTemp = status == statuses.index(BoilerStatus.LOW_TEMP)
+        self.horizon = int(horizonMins * _MINUTE)
+
+        # Sample indexes fit in 32 bits, which halves the work of the (combinations x samples) scans
+        idx = np.arange(self.size, dtype=np.int32)
+        self._idx = idx
+        fills = np.sort(np.asarray(fills, dtype=np.int64))
+        if self.size:
+            fills = fills[(fills > self.ts[0]) & (fills <= self.ts[-1])]
+        self.fills = fills
+        # First sample at or after each fill, the flags are cleared there
+        self._fillAt = np.searchsorted(self.ts, fills, side='left')
+
+        # Time references each sample compares against
+        started = self.heating & ~np.concatenate(([False], self.heating[:-1]))
+        self._heatingStart = np.maximum.accumulate(np.where(started, self.ts, _NEVER)) if self.size else self.ts
+        last = np.searchsorted(fills, self.ts, side='right') - 1
+        self._lastFill = np.where(last >= 0, fills[np.maximum(last, 0)], _NEVER) if fills.size else np.full(self.size, _NEVER)
+        self._lastBypass = np.maximum.accumulate(np.where(self.bypass, self.ts, _NEVER)) if self.size else self.ts
+
+        # Latest reset at or before each sample. A fill clears the flags before its sample is checked
+        resets = np.where(self.bypass, idx, -1)
+        fillAt = self._fillAt[self._fillAt < self.size]
+        resets[fillAt] = np.maximum(resets[fillAt], fillAt - 1)
+        self._reset = np.maximum.accumulate(resets) if self.size else resets
+
+        self._windows: Dict[Tuple[str, int], Tuple[np.ndarray, np.ndarray]] = {}
+        self._schedules: Dict[Tuple[float, float], np.ndarray] = {}
+
+    def _rolling(self, values: np.ndarray, length: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Rolling mean and least-squares slope per sample, the window starts filled with the first sample like the poller's."""
+        if length < 2:
+            raise ValueError("Window length must be at least 2")
+        padded = np.concatenate((np.full(length - 1, values[0]), values))
+        windows = sliding_window_view(padded, length)
+        x = np.arange(length) - (length - 1) / 2
+        return windows.mean(axis=1), windows @ x / np.dot(x, x)
+
+    def _window(self, kind: str, length: int) -> Tuple[np.ndarray, np.ndarray]:
+        key = (kind, length)
+        if key not in self._windows:
+            self._windows[key] = self._rolling(self.waterTemp if kind == "water" else self.o2, length)
+        return self._windows[key]
+
+    def _checked(self, checkMins: float, bypassMins: float) -> np.ndarray:
+        """Samples where the empty check runs: every `checkMins`, and not until the bypass was closed long enough."""
+        key = (checkMins, bypassMins)
+        if key not in self._schedules:
+            checkUs = max(int(checkMins * _MINUTE), 1)
+            bucket = (self.ts - self.ts[0]) // checkUs
+            checked = np.concatenate(([True], bucket[1:] != bucket[:-1]))
+            self._schedules[key] = checked & ((self.ts - self._lastBypass) > bypassMins * _MINUTE + checkUs)
+        return self._schedules[key]
+
+    def _alerts(self, combos: Dict[str, np.ndarray]) -> np.ndarray:
+        """Wood low flag per combination and sample. Wood empty always raises wood low too."""
+        count = combos["woodLowO2"].size
+        low = np.zeros((count, self.size), dtype=bool)
+        groups = np.stack((combos["waterTempWindowLen"], combos["o2WindowLen"]), axis=1).astype(np.int64)
+        for waterLen, o2Len in np.unique(groups, axis=0):
+            rows = np.flatnonzero((groups[:, 0] == waterLen) & (groups[:, 1] == o2Len))
+            tempAvg, waterSlope = self._window("water", waterLen)
+            o2Avg, _ = self._window("o2", o2Len)
+            c = {name: combos[name][rows][:, None] for name in sweepable}
+
+            cooling = (waterSlope <= 0.0)[None, :]
+            heating = self.heating[None, :]
+            condensing = tempAvg[None, :] <= c["condensingTemp"]
+
+            schedules = np.stack((c["woodEmptyCheckMins"][:, 0], c["bypassOpenedWoodCheckMins"][:, 0]), axis=1)
+            checked = np.stack([self._checked(checkMins, bypassMins) for checkMins, bypassMins in schedules])
+            empty = checked & ((self.shutdown | self.lowTemp)[None, :] | ((o2Avg[None, :] >= c["woodEmptyO2"]) & cooling & condensing & heating))
+
+            heatingUs = c["woodLowHeatingMins"] * _MINUTE
+            lowNow = (o2Avg[None, :] >= c["woodLowO2"]) & cooling & ~condensing & heating
+            lowNow &= ((self.ts - self._lastFill)[None, :] > heatingUs) & ((self.ts - self._heatingStart)[None, :] > heatingUs)
+
+            raised = (empty | lowNow) & ~self.bypass[None, :]
+            # A raised flag holds until the bypass opens or wood is filled
+            lastRaised = np.maximum.accumulate(np.where(raised, self._idx[None, :], -1), axis=1)
+            low[rows] = lastRaised > self._reset[None, :]
+
+        return low
+
+    def evaluate(self, combos: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        """Score every combination. All result arrays line up with the combination columns."""
+        count = combos["woodLowO2"].size
+        if self.size < 2:
+            zeros = np.zeros(count)
+            return {"hits": zeros, "falseAlarms": zeros, "misses": zeros + self.fills.size, "precision": zeros, "recall": zeros, "f1": zeros, "leadMins": zeros, "alertPct": zeros}
+
+        low = self._alerts(combos)
+        idx = self._idx
+        rises = low & ~np.concatenate((np.zeros((count, 1), dtype=bool), low[:, :-1]), axis=1)
+        lastRise = np.maximum.accumulate(np.where(rises, idx[None, :], -1), axis=1)
+
+        # The last sample before each fill and the first sample of its fill window
+        before = self._fillAt - 1
+        valid = before >= 0
+        before = before[valid]
+        windowStart = np.concatenate(([0], self._fillAt[:-1]))[valid]
+        fillTs = self.fills[valid]
+
+        rise = lastRise[:, before]
+        lead = fillTs[None, :] - self.ts[np.maximum(rise, 0)]
+        hit = low[:, before] & (rise >= windowStart[None, :]) & (lead <= self.horizon)
+
+        hits = hit.sum(axis=1).astype(np.float64)
+        falseAlarms = rises.sum(axis=1) - hits
+        misses = self.fills.size - hits
+        precision = np.divide(hits, hits + falseAlarms, out=np.zeros(count), where=hits + falseAlarms > 0)
+        recall = np.divide(hits, float(self.fills.size), out=np.zeros(count), where=self.fills.size > 0)
+        f1 = np.divide(2 * precision * recall, precision + recall, out=np.zeros(count), where=precision + recall > 0)
+        leadMins = np.divide(np.where(hit, lead, 0).sum(axis=1) / _MINUTE, hits, out=np.zeros(count), where=hits > 0)
+
+        return {
+            "hits": hits,
+            "falseAlarms": falseAlarms.astype(np.float64),
+            "misses": misses,
+            "precision": precision,
+            "recall": recall,
+            "f1": f1,
+            "leadMins": leadMins,
+            "alertPct": low.mean(axis=1) * 100,
+        }
+
+# Each worker process keeps one Backtest so the series is only sent once
+_worker: Optional[Backtest] = None
+
+def _initWorker(series: Dict[str, np.ndarray], fills: Sequence[int], horizonMins: float):
+    global _worker
+    _worker = Backtest(series, fills, horizonMins)
+
+def _evaluateChunk(combos: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    return _worker.evaluate(combos)
+
+def _chunks(combos: Dict[str, np.ndarray], size: int) -> Iterable[Dict[str, np.ndarray]]:
+    total = next(iter(combos.values())).size
+    for start in range(0, total, size):
+        yield {name: column[start:start + size] for name, column in combos.items()}
+
+def sweep(series: Dict[str, np.ndarray], fills: Sequence[int], combos: Dict[str, np.ndarray], horizonMins: float = 180.0,
+          workers: int = None, chunk: int = 32) -> Dict[str, np.ndarray]:
+    """
+    Score every combination on a process pool.
+    Chunks keep each worker's (combinations x samples) arrays small. `workers` 0 runs in this process.
+    """
+    series = {name: np.ascontiguousarray(column) for name, column in series.items()}
+    if workers == 0:
+        backtest = Backtest(series, fills, horizonMins)
+        parts = [backtest.evaluate(c) for c in _chunks(combos, chunk)]
+    else:
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers, initializer=_initWorker, initargs=(series, list(fills), horizonMins)) as pool:
+            parts = list(pool.map(_evaluateChunk, _chunks(combos, chunk)))
+
+    return {name: np.concatenate([p[name] for p in parts]) for name in parts[0]} if parts else {}
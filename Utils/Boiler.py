@@ -5,53 +5,82 @@ __all__ = [
 ]
 
 import logging
+import random
 import re
-import time
-import zlib
-from random import randint
-import numpy as np
-from scipy.constants import minute
-from scipy.stats import linregress
-from typing import TYPE_CHECKING
+import threading
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
 
 import arrow
-import requests
-# noinspection PyPep8Naming
-import xml.etree.ElementTree as ET
-import pandas as pd
 
-from Database.Database import Dbase
+from Database.Database import ControllerDb, Dbase
 from Models.BoilerData import BoilerData, BoilerStatus, TrackedBool
 from Models.config import Config
+from Utils.Clock import Clock
+from Utils.Controller import Controller
+from Utils.Decoder import Screen
+from Utils.Metrics import metrics
+from Utils.Navigator import Navigator
+from Utils.ReadPlan import ReadPlan, PlanVar
+from Utils.RollingStats import RollingStats
+from Utils.WoodForecaster import WoodForecaster
 
 if TYPE_CHECKING:
-    # noinspection PyProtectedMember
-    from scipy.stats._stats_mstats_common import LinregressResult
     from Database.Models.Event import EventData
 
 class Boiler:
     logger = logging.getLogger()
     lastUpdate = arrow.get(0)
     boilerData = BoilerData()
-    _token = None
-    _secA1 = None
-    _secA2 = None
-    _secB1 = None
-    _secB2 = None
-    _slopeArrayLen = 8
-    # noinspection PyArgumentList
-    _lastXs = np.arange(stop=_slopeArrayLen)
-    _lastO2s = np.full(shape=(_slopeArrayLen,), fill_value=6.0, dtype=np.float64)
-    _lastTemps = np.full(shape=(_slopeArrayLen,), fill_value=180.0, dtype=np.float64)
     _firstFun = True
-    _session = requests.Session()
     _lastWoodCheck: arrow.Arrow = arrow.get(0)
     _lastBypassWoodFill: arrow.Arrow = arrow.get(0)
-    _db: Dbase = None
-
-    def __init__(self, db: Dbase):
-        self.config = Config()
-        self._db = db
+    _db: ControllerDb = None
+    _readVars = [
+        PlanVar(name="fan", group=130, index=0),
+        PlanVar(name="shutdown", group=130, index=1),
+        PlanVar(name="alarmLt", group=130, index=2),
+        PlanVar(name="lowWater", group=129, index=0),
+        PlanVar(name="bypass", group=129, index=1),
+        PlanVar(name="coldStart", group=129, index=2),
+        PlanVar(name="highLimit", group=129, index=3),
+        PlanVar(name="topAir", group=19, index=0, size=2),
+        PlanVar(name="botAir", group=19, index=1, size=2),
+        PlanVar(name="waterTemp", group=18, index=0, size=2),
+        PlanVar(name="o2", group=18, index=1, size=2),
+    ]
+
+    recorder = None  # Told where each poll cycle starts and ends, see Utils.Replay
+
+    def __init__(self, db: Dbase, config: Config = None, name: str = Dbase.defaultController, clock: Clock = None, seed: int = None):
+        """
+        `name` keeps this controller's events apart from other controllers sharing `db`.
+        `config` defaults to the environment config.
+        All time reads go through `clock` and the wood fill seeding draws from `seed`, so a run can be replayed exactly.
+        """
+        self.config = config or Config()
+        self.name = name
+        self.clock = clock or Clock()
+        self.seed = seed if seed is not None else random.randrange(2 ** 32)
+        self._random = random.Random(self.seed)
+        self._db = db.scoped(name)
+        # Held for a whole poll cycle. Commands from other threads take it before touching the boiler state
+        self.lock = threading.RLock()
+        # Per instance state so several controllers can be polled in one process
+        self.lastUpdate = arrow.get(0)
+        self.boilerData = BoilerData()
+        self._firstFun = True
+        self._lastWoodCheck = arrow.get(0)
+        self._lastBypassWoodFill = arrow.get(0)
+        self._client = Controller(self.config, name=name, clock=self.clock)
+        self._nav = Navigator(useDown=bool(self.config.hmClickDownCmd), controller=self.name)
+        self._lastO2s = RollingStats(self.config.o2WindowLen, fill=6.0)
+        self._lastTemps = RollingStats(self.config.waterTempWindowLen, fill=180.0)
+        self._readPlan = ReadPlan(self._readVars, batched=self.config.hmBatchReads)
+        self._initTiers()
+        self._forecaster = WoodForecaster(self._db, limit=self.config.woodCalcLimit)
+        self._forecaster.load()
+        # Dbase keeps listeners on the class, close() removes this one again
+        self._listener = self._db.addListener(self._forecaster.onEvent)
         self._initBoilerData()
 
     @staticmethod
@@ -107,100 +136,121 @@ class Boiler:
             x = 100.0
         return x
 
+    def _initTiers(self):
+        """Split the read plan into variables read every cycle and slow ones read every `hmSlowVarsEvery` cycles."""
+        names = {v.name for v in self._readVars}
+        slow = {n.strip() for n in self.config.hmSlowVars.split(',') if n.strip()}
+        for unknown in slow - names:
+            self.logger.warning(f"Unknown slow variable {unknown} ignored")
+        slow &= names
+
+        self._fastPlan = self._readPlan.subset(names - slow)
+        self._slowPlan = self._readPlan.subset(slow)
+        self._cycle = 0
+        self._fullRefresh = True
+        self._lastStatusText: Optional[str] = None
+
+    def requestFullRefresh(self):
+        """Read every variable on the next cycle."""
+        self._fullRefresh = True
+
+    def _planForCycle(self) -> Tuple[ReadPlan, bool]:
+        """Read plan for this cycle and whether it covers every variable."""
+        full = self._fullRefresh or not self._slowPlan.reads or self._cycle % max(1, self.config.hmSlowVarsEvery) == 0
+        # When batching already packs the slow variables into the fast requests, reading them costs nothing extra
+        full = full or len(self._fastPlan.reads) >= len(self._readPlan.reads)
+        self._cycle += 1
+        self._fullRefresh = False
+        return (self._readPlan, True) if full else (self._fastPlan, False)
+
+    def _needsFullRefresh(self, el: Screen, vals: Dict[str, Optional[int]]) -> bool:
+        """A status change or an alarm means the slow variables should not wait for their turn."""
+        statusText = (el.text(1) or "").strip().lower()
+        changed = self._lastStatusText is not None and statusText != self._lastStatusText
+        self._lastStatusText = statusText
+
+        alarm = '*alarm*' in (el.text(0) or "").lower() or bool(vals.get("alarmLt"))
+        if changed or alarm:
+            self.logger.debug(f"Full refresh: status changed {changed}, alarm {alarm}")
+            return True
+        return False
+
     def _initBoilerData(self):
         self.boilerData.lastBypassOpened = self._db.lastBypassOpened().ts
         self.logger.debug(f"Boiler bypass last opened: {self.boilerData.lastBypassOpened}")
         self.boilerData.lastWoodFilled = self._db.lastWoodFilled().ts
         self.logger.debug(f"Boiler wood last filled: {self.boilerData.lastWoodFilled}")
 
-    def _login(self) -> bool:
-        self._session = requests.Session()
-        self._session.headers = {
-            'Security-Hint': self._token,
-            'Cache-Control': 'no-cache,no-store,must-revalidate',
-            'Pragma': 'no-cache',
-            'Content-Encoding': 'gzip',
-            'Accept': '*/*',
-            'Accept-Encoding': 'gzip, deflate',
-            'App-Language': '1'
-        }
-
-        if self._secA1 is None:
-            self._secA1 = randint(0, 4294967296)
-        if self._secA2 is None:
-            self._secA2 = randint(0, 4294967296)
-        if self._secB1 is None:
-            self._secB1 = randint(0, 4294967296)
-        if self._secB2 is None:
-            self._secB2 = randint(0, 4294967296)
-
-        req1 = self._session.post(url=self.config.hmUrl, headers={'Security-Hint': 'p'}, data=f"UAMCHAL:3,4,{self._secA1},{self._secA2},{self._secB1},{self._secB2}")
-        self.logger.debug(f"Login response = {req1.text}")
-        ret = req1.text.split(',')
-        if len(ret) == 3 and ret[0] == "700":
-            pwToken = f"{self.config.hmPassword}+{ret[2]}"
-            pwToken = pwToken[0:32]
-            self.logger.debug(f"pwToken = {pwToken}")
-            pwTokenCrc = zlib.crc32(pwToken.encode())
-            iPWToken = pwTokenCrc ^ int(ret[2])
-            self.logger.debug(f"iPWToken = {iPWToken}")
-            iServerChallenge = (((self._secA1 ^ self._secA2) ^ self._secB1) ^ self._secB2) ^ int(ret[2])
-            self.logger.debug(f"iServerChallenge = {iServerChallenge}")
-            req2 = self._session.post(url=self.config.hmUrl, headers={'Security-Hint': f'{ret[1]}'}, data=f"UAMLOGIN:Web User,{iPWToken},{iServerChallenge}")
-            self.logger.debug(f"Login response = {req2.text}")
-            data = req2.text.split(',')
-            if len(data) == 2 and data[0] == '700':
-                self._token = data[1]
-                return True
-            else:
-                self.logger.error(f"Login failed: {req1.text}")
-                return False
-
-    def _parseXml(self, xml: str) -> int or None:
-        try:
-            root = ET.fromstring(xml)
-        except ET.ParseError:
-            self.logger.error(f"Failed to parse: {xml}")
-            return None
-        val = root.find('r').get('v', default=None)
-        if val is None:
-            return val
-        return int(val, 16)
-
-    def _parseXmlData(self, xml: str) -> ET.Element or None:
-        try:
-            root = ET.fromstring(xml)
-        except ET.ParseError:
-            self.logger.error(f"Failed to parse: {xml}")
-            return None
-
-        return root
-
     def _addWaterTemp(self, val: float):
-        self._lastTemps = np.append(self._lastTemps, val)
-        self._lastTemps = np.delete(self._lastTemps, 0)
+        self._lastTemps.push(val)
         self.logger.debug(f"LastWaterTemps: {self._lastTemps}")
 
     def _addO2(self, val: float):
-        self._lastO2s = np.append(self._lastO2s, val)
-        self._lastO2s = np.delete(self._lastO2s, 0)
+        self._lastO2s.push(val)
         self.logger.debug(f"LastO2s: {self._lastO2s}")
 
     def _slopeWater(self) -> float:
-        lr = linregress(self._lastXs, self._lastTemps)  # type: LinregressResult
-        self.logger.debug(f"Water linear regression: {lr}")
-        return lr.slope
+        return self._lastTemps.slope
 
     def _slopeO2(self) -> float:
-        lr = linregress(self._lastXs, self._lastO2s)  # type: LinregressResult
-        self.logger.debug(f"O2 linear regression: {lr}")
-        return lr.slope
+        return self._lastO2s.slope
 
     def _avgO2(self) -> float:
-        return np.average(self._lastO2s)
+        return self._lastO2s.mean
 
     def _avgTemp(self) -> float:
-        return np.average(self._lastTemps)
+        return self._lastTemps.mean
+
+    def _isStatusScreen(self, el: Screen) -> bool:
+        elType = el.type
+        if elType is not None and elType.strip().lower() == 's':
+            elVal = el.text(0) or ""
+            self.logger.debug(f"EL Val: {elVal}")
+            if '*alarm*' in elVal.strip().lower():
+                self.logger.warning("Alarm status found")
+                return True
+            elif 'furnace status' not in elVal.strip().lower():
+                self.logger.debug("Not status click up arrow")
+                return False
+            else:
+                # found status screen
+                self.logger.debug("Found status screen")
+                return True
+        else:
+            self.logger.debug("Not data s click up arrow")
+            return False
+
+    @staticmethod
+    def _screenTitle(el: Screen) -> str or None:
+        if el.type is None or el.type.strip().lower() != 's' or el.text(0) is None:
+            return None
+        return el.text(0).strip().lower()
+
+    def _findStatusScreen(self) -> Screen:
+        # Check for main page, the first read is enough when the status screen is already up
+        start = self.clock.monotonic()
+        clicks = 0
+        el = self._client.msgGet()
+        for _ in range(0, 49):
+            if self._isStatusScreen(el):
+                break
+
+            # Click towards the status screen and try again
+            title = self._screenTitle(el)
+            move = self._nav.nextMove(title)
+            if move == Navigator.DOWN:
+                self._client.msgClickDown()
+            else:
+                self._client.msgClickUp()
+            clicks += 1
+            self.clock.sleep(self.config.hmClickDelaySecs)
+
+            el = self._client.msgGet()
+            self._nav.observe(title, move, self._screenTitle(el))
+
+        self._nav.record(clicks, self.clock.monotonic() - start)
+        self.logger.debug(f"Navigation: {clicks} clicks. {self._nav.stats}")
+        return el
 
     def _updateBoiler(self):
         bd = self.boilerData
@@ -208,62 +258,33 @@ class Boiler:
             bd = BoilerData()
             self.logger.debug("NEW BOILER DATA CREATED")
 
-        if self._token is None:
-            for _ in range(0, 4):
-                if self._login():
-                    break
-            else:
+        with metrics.timer("boiler_phase_seconds", controller=self.name, phase="login"):
+            if not self._client.ensureLogin():
                 self.boilerData = None
                 return
 
-        bd.ts = arrow.utcnow()
+        bd.ts = self.clock.utcnow()
         bd.lastWoodFilled = self._db.lastWoodFilled().ts
-        bd.lastWoodFilledHuman = bd.lastWoodFilled.humanize()
-
-        req = self._session.post(url=self.config.hmUrl, data="GETSTDG")
-        if "Running" not in req.text:
-            self.logger.info("Logging in after timeout")
-            for _ in range(0, 4):
-                if self._login():
-                    break
-            else:
-                self.boilerData = None
-                return
+        bd.lastWoodFilledHuman = bd.lastWoodFilled.humanize(self.clock.utcnow())
 
         """ Status """
-        # Check for main page
-        el = ET.Element("")
-        for _ in range(0, 50):
-            req = self._session.post(url=self.config.hmUrl, data="MSGGET:bm,-1")
-            el = self._parseXmlData(req.text)
-            self.logger.debug(f"Request Response: {req.text}")
-            elType = el.get('type')
-            if elType is not None and elType.strip().lower() == 's':
-                elVal = el.find("./t[@id='0']").get('v')
-                self.logger.debug(f"EL Val: {elVal}")
-                if '*alarm*' in elVal.strip().lower():
-                    self.logger.warning("Alarm status found")
-                    break
-                elif 'furnace status' not in elVal.strip().lower():
-                    # Click up arrow and try again
-                    self.logger.debug("Not status click up arrow")
-                    self._session.post(url=self.config.hmUrl, data="MSGCLICK:bm,1,1")
-                    time.sleep(2)
-                    continue
-                else:
-                    # found status screen
-                    self.logger.debug("Found status screen")
-                    break
-            else:
-                # Click up arrow and try again
-                self.logger.debug("Not data s click up arrow")
-                self._session.post(url=self.config.hmUrl, data="MSGCLICK:bm,1,1")
-                time.sleep(2)
-                continue
+        with metrics.timer("boiler_phase_seconds", controller=self.name, phase="navigate"):
+            el = self._findStatusScreen()
+
+        """ Variables """
+        with metrics.timer("boiler_phase_seconds", controller=self.name, phase="read"):
+            plan, full = self._planForCycle()
+            vals = plan.execute(self._client.getVars)
+            if self._needsFullRefresh(el, vals) and not full:
+                vals.update(self._slowPlan.execute(self._client.getVars))
 
+        with metrics.timer("boiler_phase_seconds", controller=self.name, phase="apply"):
+            self._applyUpdate(bd, el, vals)
+
+    def _applyUpdate(self, bd: BoilerData, el: Screen, vals: Dict[str, Optional[int]]):
         # Get furnace status
         self.logger.debug("Getting status")
-        elVal = el.find("./t[@id='1']").get('v')
+        elVal = el.text(1) or ""
         statusTemporary = elVal.strip().lower()
         statusTemporary = re.sub(r'[^a-z0-9 ]', '', statusTemporary)
         try:
@@ -273,6 +294,12 @@ class Boiler:
             bd.status = BoilerStatus.ERROR
         self.logger.debug(f"DATA: Status: {bd.status}")
 
+        # Variables left out by the read tier keep their value and timestamp
+        bd.fieldTs["status"] = bd.ts
+        for name, val in vals.items():
+            if val is not None:
+                bd.fieldTs[name] = bd.ts
+
         """ Check heating cycle started """
         # First run check
         if bd.status == BoilerStatus.HEATING and self._firstFun:
@@ -285,17 +312,16 @@ class Boiler:
 
         # Normal checks
         if bd.status == BoilerStatus.HEATING and bd.heatingStart is None:
-            bd.heatingStart = arrow.utcnow()
-            self._db.eventHeating(True, arrow.utcnow())
+            bd.heatingStart = self.clock.utcnow()
+            self._db.eventHeating(True, self.clock.utcnow())
         elif bd.status != BoilerStatus.HEATING and bd.heatingStart is not None:
             bd.heatingStart = None
-            self._db.eventHeating(False, arrow.utcnow())
+            self._db.eventHeating(False, self.clock.utcnow())
 
         self.logger.debug(f"Heating start: {bd.heatingStart}")
 
         """ Fan """
-        req = self._session.post(url=self.config.hmUrl, data="GETVARS:v0,130,0,0,1,1")
-        val = self._parseXml(req.text)
+        val = vals.get("fan")
         if val is not None:
             if val > 0:
                 bd.fan = True
@@ -304,8 +330,7 @@ class Boiler:
             self.logger.debug(f"DATA: Fan: {bd.fan}")
 
         """ Shutdown """
-        req = self._session.post(url=self.config.hmUrl, headers={'Security-Hint': self._token}, data="GETVARS:v0,130,0,1,1,1")
-        val = self._parseXml(req.text)
+        val = vals.get("shutdown")
         if val is not None:
             if val > 0:
                 bd.shutdown.value = False
@@ -313,13 +338,12 @@ class Boiler:
                 bd.shutdown.value = True
 
             if bd.shutdown.changed:
-                self._db.eventShutdown(bd.shutdown.value)
+                self._db.eventShutdown(bd.shutdown.value, ts=self.clock.now())
 
             self.logger.debug(f"DATA: Shutdown: {bd.shutdown.value}")
 
         """ Alarm Lt """
-        req = self._session.post(url=self.config.hmUrl, headers={'Security-Hint': self._token}, data="GETVARS:v0,130,0,2,1,1")
-        val = self._parseXml(req.text)
+        val = vals.get("alarmLt")
         if val is not None:
             if val > 0:
                 bd.alarmLt = True
@@ -328,8 +352,7 @@ class Boiler:
             self.logger.debug(f"DATA: Alarm LT: {bd.alarmLt}")
 
         """ Low Water """
-        req = self._session.post(url=self.config.hmUrl, headers={'Security-Hint': self._token}, data="GETVARS:v0,129,0,0,1,1")
-        val = self._parseXml(req.text)
+        val = vals.get("lowWater")
         if val is not None:
             if val > 0:
                 bd.lowWater = False
@@ -338,25 +361,23 @@ class Boiler:
             self.logger.debug(f"DATA: Low Water: {bd.lowWater}")
 
         """ Bypass """
-        req = self._session.post(url=self.config.hmUrl, headers={'Security-Hint': self._token}, data="GETVARS:v0,129,0,1,1,1")
-        val = self._parseXml(req.text)
-        self.logger.debug(f"DATA: Bypass request resp = {req.text}  val = {val}")
+        val = vals.get("bypass")
+        self.logger.debug(f"DATA: Bypass val = {val}")
         if val is not None:
             if val > 0:
                 bd.bypass.value = False
             else:
                 bd.bypass.value = True
-                bd.lastBypassOpened = arrow.utcnow()
+                bd.lastBypassOpened = self.clock.utcnow()
 
             if bd.bypass.changed:
-                self._db.eventBypassOpened(bd.bypass.value)
+                self._db.eventBypassOpened(bd.bypass.value, ts=self.clock.now())
 
-            bd.lastBypassOpenedHuman = bd.lastBypassOpened.humanize()
+            bd.lastBypassOpenedHuman = bd.lastBypassOpened.humanize(self.clock.utcnow())
             self.logger.debug(f"DATA: Bypass: {bd.bypass.value}")
 
         """ Cold Start """
-        req = self._session.post(url=self.config.hmUrl, headers={'Security-Hint': self._token}, data="GETVARS:v0,129,0,2,1,1")
-        val = self._parseXml(req.text)
+        val = vals.get("coldStart")
         if val is not None:
             if val > 0:
                 bd.coldStart.value = True
@@ -364,13 +385,12 @@ class Boiler:
                 bd.coldStart.value = False
 
             if bd.coldStart.changed:
-                self._db.eventColdStart(bd.coldStart.value)
+                self._db.eventColdStart(bd.coldStart.value, ts=self.clock.now())
 
             self.logger.debug(f"DATA: Cold Start: {bd.coldStart.value}")
 
         """ High Limit """
-        req = self._session.post(url=self.config.hmUrl, headers={'Security-Hint': self._token}, data="GETVARS:v0,129,0,3,1,1")
-        val = self._parseXml(req.text)
+        val = vals.get("highLimit")
         if val is not None:
             if val > 0:
                 bd.highLimit = False
@@ -379,23 +399,19 @@ class Boiler:
             self.logger.debug(f"DATA: High Limit: {bd.highLimit}")
 
         """ Bot / Top Air """
-        req = self._session.post(url=self.config.hmUrl, headers={'Security-Hint': self._token}, data="GETVARS:v0,19,0,0,4,2")
-        val = self._parseXml(req.text)
-        if val is not None:
-            val1 = float(int(f"{val:0{8}x}"[0:4], 16)) * 0.1
-            val2 = float(int(f"{val:0{8}x}"[4:8], 16)) * 0.1
-            bd.topAir = val1
+        val1 = vals.get("topAir")
+        val2 = vals.get("botAir")
+        if val1 is not None and val2 is not None:
+            bd.topAir = float(val1) * 0.1
             bd.topAirPct = self._rangePercent(bd.topAir, self.config.topAirMin, self.config.topAirMax)
-            bd.botAir = val2
+            bd.botAir = float(val2) * 0.1
             bd.botAirPct = self._rangePercent(bd.botAir, self.config.botAirMin, self.config.botAirMax)
             self.logger.debug(f"DATA: Top Air: {bd.topAirPct}  Bottom Air: {bd.botAirPct}")
 
         """ Water Temp / O2 """
-        req = self._session.post(url=self.config.hmUrl, headers={'Security-Hint': self._token}, data="GETVARS:v0,18,0,0,4,2")
-        val = self._parseXml(req.text)
-        if val is not None:
-            val1 = int(f"{val:0{8}x}"[0:4], 16)
-            val2 = int(f"{val:0{8}x}"[4:8], 16)
+        val1 = vals.get("waterTemp")
+        val2 = vals.get("o2")
+        if val1 is not None and val2 is not None:
             self.logger.debug(f"DATA: Water Temp: {val1}")
             self.logger.debug(f"DATA: O2: {val2}")
 
@@ -411,14 +427,14 @@ class Boiler:
 
             # Check for first run
             if self._firstFun:
-                self._lastO2s = np.full(shape=(self._slopeArrayLen,), fill_value=bd.o2, dtype=np.float64)
-                self._lastTemps = np.full(shape=(self._slopeArrayLen,), fill_value=bd.waterTemp, dtype=np.float64)
+                self._lastO2s.fill(bd.o2)
+                self._lastTemps.fill(bd.waterTemp)
 
             self._addWaterTemp(bd.waterTemp)
             self._addO2(bd.o2)
 
         if self._firstFun and bd.status == BoilerStatus.HEATING:
-            bd.heatingStart = arrow.utcnow().shift(minutes=-(self.config.woodEmptyCheckMins + 1)).replace(second=0)
+            bd.heatingStart = self.clock.utcnow().shift(minutes=-(self.config.woodEmptyCheckMins + 1)).replace(second=0)
 
         """ Calc Values"""
         bd.waterSlope = self._slopeWater()
@@ -438,11 +454,12 @@ class Boiler:
         self.logger.debug(f"Condensing: {bd.condensing}")
 
         """ Check wood """
-        self._calcNextWoodFill()
+        with metrics.timer("boiler_phase_seconds", controller=self.name, phase="forecast"):
+            self._calcNextWoodFill()
 
         if not bd.bypass:  # Bypass closed
             self.logger.debug("Wood Check Bypass Closed")
-            if arrow.utcnow().shift(minutes=-self.config.woodEmptyCheckMins).replace(second=0) > self._lastWoodCheck:
+            if self.clock.utcnow().shift(minutes=-self.config.woodEmptyCheckMins).replace(second=0) > self._lastWoodCheck:
                 self.logger.debug("Time to check wood")
                 if bd.shutdown:
                     self.logger.warning("Wood off by shutdown")
@@ -462,22 +479,22 @@ class Boiler:
                     bd.woodLow = True
 
                 # Update last wood check
-                self._lastWoodCheck = arrow.utcnow()
+                self._lastWoodCheck = self.clock.utcnow()
 
             # Check wood low
             if bd.o2Avg >= self.config.woodLowO2 and \
                     bd.waterSlope <= 0.0 and \
                     not bd.condensing and \
                     bd.status == BoilerStatus.HEATING and \
-                    arrow.utcnow().shift(minutes=-self.config.woodLowHeatingMins).replace(second=0) > bd.lastWoodFilled:
+                    self.clock.utcnow().shift(minutes=-self.config.woodLowHeatingMins).replace(second=0) > bd.lastWoodFilled:
 
-                if arrow.utcnow().shift(minutes=-self.config.woodLowHeatingMins).replace(second=0) > bd.heatingStart or self._firstFun:
+                if self.clock.utcnow().shift(minutes=-self.config.woodLowHeatingMins).replace(second=0) > bd.heatingStart or self._firstFun:
                     # High O2 and cooling-off while heating for some time means low wood
                     bd.woodLow = True
                     self.logger.debug("Wood low")
                 else:
                     self.logger.debug("Wood low. Not set because it is not time yet")
-            elif arrow.utcnow() > self._calcNextWoodFill():
+            elif self.clock.utcnow() > self._calcNextWoodFill():
                 bd.woodLow = True
                 self.logger.debug("Wood low by time")
 
@@ -486,13 +503,13 @@ class Boiler:
             bd.woodEmpty = False
             bd.woodLow = False
             # Update last wood check plus some extra time
-            self._lastWoodCheck = arrow.utcnow().shift(minutes=+self.config.bypassOpenedWoodCheckMins)
+            self._lastWoodCheck = self.clock.utcnow().shift(minutes=+self.config.bypassOpenedWoodCheckMins)
             # Check if time to count as a wood fill event
-            if arrow.utcnow().shift(minutes=-self.config.bypassWoodFilledMins).replace(second=0) > self._lastBypassWoodFill:
-                self._lastBypassWoodFill = arrow.utcnow()
-                self._db.eventWoodFilled(ts=arrow.utcnow())
+            if self.clock.utcnow().shift(minutes=-self.config.bypassWoodFilledMins).replace(second=0) > self._lastBypassWoodFill:
+                self._lastBypassWoodFill = self.clock.utcnow()
+                self._db.eventWoodFilled(ts=self.clock.utcnow())
                 bd.lastWoodFilled = self._db.lastWoodFilled().ts
-                bd.lastWoodFilledHuman = bd.lastWoodFilled.humanize()
+                bd.lastWoodFilledHuman = bd.lastWoodFilled.humanize(self.clock.utcnow())
 
         self.logger.debug(f"Wood: Empty = {bd.woodEmpty} Low = {bd.woodLow}")
 
@@ -510,28 +527,26 @@ class Boiler:
             bd.alarmLt = False
 
         """ Finish """
-        self.lastUpdate = arrow.utcnow()
-        self.logger.info(f"Boiler updated. < {self.lastUpdate} >")
-        self.logger.info(f"Boiler Data: {bd}")
+        self.lastUpdate = self.clock.utcnow()
+        self.logger.info(f"Boiler {self.name} updated. < {self.lastUpdate} >")
+        self.logger.info(f"Boiler {self.name} Data: {bd}")
         self.boilerData = bd
-        self._session.close()
+        self.logger.debug(f"Controller client: {self._client.stats}")
 
         """ First run done """
         if self._firstFun:
             self._firstFun = False
 
     def _calcNextWoodFill(self) -> arrow.Arrow:
-        # Read sqlite query results into a pandas DataFrame
-        df = pd.read_sql_query(f"SELECT ts as ds FROM event WHERE eventType == 'wood_filled' ORDER BY id DESC LIMIT {self.config.woodCalcLimit}", self._db.connection)
-        if df.size == 0:
-            nextFill = arrow.now().shift(hours=self.config.woodLowCalcOffsetHours)
+        if self._forecaster.count == 0:
+            nextFill = self.clock.now().shift(hours=self.config.woodLowCalcOffsetHours)
             self.logger.warning(f"Database is empty! Calculated next fill is {nextFill}")
 
             # Fill the db with previous wood fill events
             prevFills = []
-            prevFill = arrow.now()
+            prevFill = self.clock.now()
             for _ in range(self.config.woodCalcLimit):
-                seconds = (60*60*8) + (randint(0, 50)*60) + randint(0, 59)
+                seconds = (60*60*8) + (self._random.randint(0, 50)*60) + self._random.randint(0, 59)
                 prevFill = prevFill.shift(seconds=-seconds)
                 prevFills.append(prevFill)
             for prevFillIter in reversed(prevFills):
@@ -539,69 +554,44 @@ class Boiler:
 
             return nextFill
 
-        # Add a y column
-        df.insert(1, 'y', 0, True)
-
-        # Convert column ds to datetimes
-        for idx, row in df.iterrows():
-            df.loc[idx, 'ds'] = arrow.get(row['ds']).naive
-
-        df['ds'] = pd.DatetimeIndex(df['ds'])
-
-        # Convert y to floats
-        df = df.astype({"y": float})
-
-        # Calculate total seconds between events
-        for idx, row in df.iterrows():
-            if idx != 0:
-                cur = arrow.get(row['ds'])
-                # noinspection PyTypeChecker
-                prev = arrow.get(df.iloc[idx - 1]['ds'])
-                secs = (prev - cur).total_seconds()
-                df.loc[idx, 'y'] = secs / 60
-
-        # Index 0's y value
-        df.loc[0, 'y'] = df.loc[1, 'y']
-
-        # Drop the upper and lower 1% outliers
-        df_sub = df.loc[:, ['ds', 'y']]
-        lim = np.logical_and(df_sub['y'] < df_sub['y'].quantile(0.99),
-                             df_sub['y'] > df_sub['y'].quantile(0.01))
-
-        df.loc[:, ['y']] = df_sub.where(lim, np.nan)
-        df.dropna(inplace=True)
-
-        # Calculate the mean of y
-        meanMins = np.mean(df.loc[:, 'y'])
-        self.logger.debug(f"Calculated fill mean mins: {meanMins}")
-
-        # Get last wood fill
-        lastFill = self._db.lastWoodFilled().ts
-        # Shift if forward meanMins
-        nextFill = lastFill.shift(minutes=meanMins)
-        # Offset next fill by woodLowCalcOffsetHours
-        nextFill = nextFill.shift(hours=self.config.woodLowCalcOffsetHours)
+        nextFill = self._forecaster.nextFill(self.config.woodLowCalcOffsetHours)
+        if nextFill is None:
+            nextFill = self.clock.now().shift(hours=self.config.woodLowCalcOffsetHours)
+            self.logger.warning(f"Not enough wood fills to calculate from. Next fill is {nextFill}")
 
         self.logger.debug(f"Next calculated fill: {nextFill}")
 
         return nextFill
 
-    def getData(self) -> BoilerData:
-        if arrow.utcnow().shift(seconds=-self.config.updateBoilerSeconds) > self.lastUpdate:
-            self._updateBoiler()
-        self.logger.info(f"Boiler last updated at {self.lastUpdate}")
+    def getData(self, force: bool = False) -> BoilerData:
+        if force or self.timeToUpdate():
+            with self.lock:
+                if self.recorder is not None:
+                    self.recorder.beginCycle()
+                try:
+                    with metrics.timer("boiler_cycle_seconds", controller=self.name):
+                        self._updateBoiler()
+                finally:
+                    if self.recorder is not None:
+                        self.recorder.endCycle()
+        self.logger.info(f"Boiler {self.name} last updated at {self.lastUpdate}")
 
         return self.boilerData
 
+    def close(self):
+        """Stop following new events and drop the controller session."""
+        self._db.removeListener(self._listener)
+        self._client.close()
+
     def timeToUpdate(self) -> bool:
-        if arrow.utcnow().shift(seconds=-self.config.updateBoilerSeconds) > self.lastUpdate:
+        if self.clock.utcnow().shift(seconds=-self.config.updateBoilerSeconds) > self.lastUpdate:
             return True
 
         return False
 
     def getOfflineData(self) -> BoilerData:
         bd = BoilerData()
-        bd.ts = arrow.utcnow()
+        bd.ts = self.clock.utcnow()
         bd.status = BoilerStatus.OFFLINE
         bd.coldStart = TrackedBool(False)
         bd.highLimit = False
@@ -612,7 +602,7 @@ class Boiler:
         bd.waterTemp = False
         bd.woodEmpty = False
         bd.woodLow = False
-        self.lastUpdate = arrow.utcnow()
+        self.lastUpdate = self.clock.utcnow()
 
         return bd
 
@@ -625,3 +615,20 @@ class Boiler:
     def woodFilled(self):
         self.boilerData.woodLow = False
         self.boilerData.woodEmpty = False
+
+    def addWoodFill(self, ts: arrow.Arrow) -> bool:
+        """
+        Record a wood fill reported from outside the poll loop. Safe to call from any thread.
+        False when the latest fill already has this time, e.g. a retained command delivered again.
+        Like every event the time is stored naive, as the wall clock time written in the command.
+        """
+        with self.lock:
+            if self._db.lastWoodFilled().ts.naive == ts.naive:
+                return False
+
+            self._db.eventWoodFilled(ts=ts)
+            if self.boilerData is not None:
+                self.boilerData.lastWoodFilled = self._db.lastWoodFilled().ts
+                self.boilerData.lastWoodFilledHuman = self.boilerData.lastWoodFilled.humanize(self.clock.utcnow())
+                self.woodFilled()
+            return True
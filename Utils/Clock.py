@@ -0,0 +1,27 @@
+from __future__ import annotations
+
+__all__ = [
+    "Clock",
+]
+
+import time
+
+import arrow
+
+class Clock:
+    """
+    Time source for the poller. `Boiler` and `Controller` read the time only through a clock,
+    so replay can swap in a recorded one and run without sleeping.
+    """
+
+    def utcnow(self) -> arrow.Arrow:
+        return arrow.utcnow()
+
+    def now(self) -> arrow.Arrow:
+        return arrow.now()
+
+    def monotonic(self) -> float:
+        return time.monotonic()
+
+    def sleep(self, seconds: float):
+        time.sleep(seconds)
@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+__all__ = [
+    "Command",
+    "CommandQueue",
+]
+
+import logging
+import queue
+import threading
+import time
+from typing import Callable, Dict, NamedTuple, Optional
+
+from Utils.Metrics import metrics
+
+class Command(NamedTuple):
+    topic: str
+    payload: str
+    retained: bool
+    received: float  # time.monotonic() when it arrived
+
+class CommandQueue:
+    """
+    Hands MQTT commands from paho's network thread to one worker thread.
+    `put()` only enqueues, so keepalives and other messages never wait on a command.
+    The worker applies commands in arrival order with the handler registered for their topic.
+    A retained command repeating the last applied payload of its topic is skipped, as the broker redelivers
+    retained `set` messages on every reconnect.
+    """
+    logger = logging.getLogger()
+
+    def __init__(self, maxSize: int = 1000):
+        self._queue: queue.Queue = queue.Queue(maxsize=maxSize)
+        self._handlers: Dict[str, Callable[[Command], None]] = {}
+        self._last: Dict[str, str] = {}  # Last applied payload per topic
+        self._thread: Optional[threading.Thread] = None
+        self.applied = 0
+        self.skipped = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def register(self, topic: str, handler: Callable[[Command], None]):
+        self._handlers[topic] = handler
+
+    def handles(self, topic: str) -> bool:
+        return topic in self._handlers
+
+    def put(self, topic: str, payload: str, retained: bool = False) -> bool:
+        """Enqueue a command without blocking. False when the queue is full and the command was dropped."""
+        try:
+            self._queue.put_nowait(Command(topic, payload, retained, time.monotonic()))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            metrics.inc("boiler_commands_total", result="dropped")
+            self.logger.warning(f"Command queue full, dropping {topic}")
+            return False
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="Commands", daemon=True)
+            self._thread.start()
+
+    def join(self, timeout: float = None) -> bool:
+        """Wait until every queued command was applied."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def stop(self, timeout: float = 5.0):
+        """Apply what is queued, then stop the worker."""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _apply(self, command: Command):
+        if command.retained and self._last.get(command.topic) == command.payload:
+            self.skipped += 1
+            metrics.inc("boiler_commands_total", result="skipped")
+            self.logger.debug(f"Skipping repeated retained command {command.topic}: {command.payload}")
+            return
+
+        handler = self._handlers.get(command.topic)
+        if handler is None:
+            self.logger.warning(f"No handler for command {command.topic}")
+            return
+
+        try:
+            handler(command)
+        except Exception as e:
+            self.failed += 1
+            metrics.inc("boiler_commands_total", result="failed")
+            self.logger.exception(f"Command {command.topic} failed: {e}")
+            return
+
+        self._last[command.topic] = command.payload
+        self.applied += 1
+        metrics.inc("boiler_commands_total", result="applied")
+        metrics.observe("boiler_command_seconds", time.monotonic() - command.received)
+
+    def _run(self):
+        while True:
+            command = self._queue.get()
+            try:
+                if command is None:
+                    return
+                self._apply(command)
+            finally:
+                self._queue.task_done()
@@ -0,0 +1,226 @@
+from __future__ import annotations
+
+__all__ = [
+    "Controller",
+    "Reply",
+]
+
+import logging
+import zlib
+from random import randint
+from typing import Dict, NamedTuple, Tuple
+
+import arrow
+import requests
+
+from Models.config import Config
+from Utils.Clock import Clock
+from Utils.Decoder import Screen, parseScreen, parseVar
+from Utils.Metrics import metrics
+
+class Reply(NamedTuple):
+    status_code: int
+    text: str
+
+class Controller:
+    """
+    Long-lived HeatMaster controller client.
+    Keeps one HTTP session alive across poll cycles and only logs in again when the token is no longer accepted.
+    A `transport` with post(data, hint) -> Reply replaces HTTP, and a `recorder` sees every exchange.
+    """
+    logger = logging.getLogger()
+    logins: int = 0
+    reconnects: int = 0
+    reusedConnections: int = 0
+    _token = None
+    _tokenTs: arrow.Arrow = arrow.get(0)
+    _secA1 = None
+    _secA2 = None
+    _secB1 = None
+    _secB2 = None
+    _session: requests.Session = None
+    _sessionRequests: int = 0
+    transport = None
+    recorder = None
+
+    def __init__(self, config: Config, name: str = "boiler", clock: Clock = None):
+        self.config = config
+        self.name = name  # Controller label for metrics
+        self.clock = clock or Clock()
+
+    @property
+    def token(self) -> str or None:
+        return self._token
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {
+            "logins": self.logins,
+            "reconnects": self.reconnects,
+            "reused_connections": self.reusedConnections,
+        }
+
+    def _newSession(self):
+        if self._session is not None:
+            self._session.close()
+            self.reconnects += 1
+            metrics.inc("boiler_reconnects_total", controller=self.name)
+
+        self._session = requests.Session()
+        self._session.headers = {
+            'Cache-Control': 'no-cache,no-store,must-revalidate',
+            'Pragma': 'no-cache',
+            'Content-Encoding': 'gzip',
+            'Accept': '*/*',
+            'Accept-Encoding': 'gzip, deflate',
+            'App-Language': '1'
+        }
+        self._sessionRequests = 0
+
+    def _post(self, data: str, hint: str or None) -> Reply:
+        try:
+            reply = self._send(data, hint)
+        except requests.exceptions.ConnectionError as e:
+            if self.recorder is not None:
+                self.recorder.exchange(data, hint, None, error=e)
+            raise
+
+        if self.recorder is not None:
+            self.recorder.exchange(data, hint, reply)
+        return reply
+
+    def _send(self, data: str, hint: str or None) -> Reply:
+        if self.transport is not None:
+            return self.transport.post(data, hint)
+
+        if self._session is None:
+            self._newSession()
+
+        if self._sessionRequests > 0:
+            self.reusedConnections += 1
+        self._sessionRequests += 1
+
+        try:
+            with metrics.timer("boiler_request_seconds", controller=self.name, command=data.split(':', 1)[0]):
+                resp = self._session.post(url=self.config.hmUrl, headers={'Security-Hint': hint}, data=data)
+            return Reply(resp.status_code, resp.text)
+        except requests.exceptions.ConnectionError:
+            # Drop the broken connection so the next request starts clean
+            self._newSession()
+            raise
+
+    def _challengeCommand(self) -> str:
+        if self._secA1 is None:
+            self._secA1 = randint(0, 4294967296)
+        if self._secA2 is None:
+            self._secA2 = randint(0, 4294967296)
+        if self._secB1 is None:
+            self._secB1 = randint(0, 4294967296)
+        if self._secB2 is None:
+            self._secB2 = randint(0, 4294967296)
+
+        self.logins += 1
+        metrics.inc("boiler_logins_total", controller=self.name)
+        self._token = None
+        return f"UAMCHAL:3,4,{self._secA1},{self._secA2},{self._secB1},{self._secB2}"
+
+    def _loginCommand(self, challenge: str) -> Tuple[str, str] or None:
+        """
+        Answer the UAMCHAL response. Returns the login hint and UAMLOGIN command or None when the challenge was refused.
+        """
+        self.logger.debug(f"Login response = {challenge}")
+        ret = challenge.split(',')
+        if len(ret) != 3 or ret[0] != "700":
+            return None
+
+        pwToken = f"{self.config.hmPassword}+{ret[2]}"
+        pwToken = pwToken[0:32]
+        self.logger.debug(f"pwToken = {pwToken}")
+        pwTokenCrc = zlib.crc32(pwToken.encode())
+        iPWToken = pwTokenCrc ^ int(ret[2])
+        self.logger.debug(f"iPWToken = {iPWToken}")
+        iServerChallenge = (((self._secA1 ^ self._secA2) ^ self._secB1) ^ self._secB2) ^ int(ret[2])
+        self.logger.debug(f"iServerChallenge = {iServerChallenge}")
+        return f'{ret[1]}', f"UAMLOGIN:Web User,{iPWToken},{iServerChallenge}"
+
+    def _loginResult(self, challenge: str, response: str) -> bool:
+        self.logger.debug(f"Login response = {response}")
+        data = response.split(',')
+        if len(data) == 2 and data[0] == '700':
+            self._token = data[1]
+            self._tokenTs = self.clock.utcnow()
+            return True
+
+        self.logger.error(f"Login failed: {challenge}")
+        return False
+
+    def login(self) -> bool:
+        req1 = self._post(data=self._challengeCommand(), hint='p')
+        cmd = self._loginCommand(req1.text)
+        if cmd is None:
+            self.logger.error(f"Login failed: {req1.text}")
+            return False
+
+        req2 = self._post(data=cmd[1], hint=cmd[0])
+        return self._loginResult(req1.text, req2.text)
+
+    def _loginRetry(self) -> bool:
+        for _ in range(0, 4):
+            if self.login():
+                return True
+
+        return False
+
+    def _tokenExpired(self) -> bool:
+        if self.config.hmTokenMaxAgeSecs <= 0:
+            return False
+
+        return self.clock.utcnow().shift(seconds=-self.config.hmTokenMaxAgeSecs) > self._tokenTs
+
+    def ensureLogin(self) -> bool:
+        """
+        Make sure the cached token is still accepted, logging in again only when it is missing, too old or rejected.
+        """
+        if self._token is None:
+            return self._loginRetry()
+
+        if self._tokenExpired():
+            self.logger.info("Refreshing controller token")
+            return self._loginRetry()
+
+        req = self.post("GETSTDG")
+        if "Running" not in req.text:
+            self.logger.info("Logging in after timeout")
+            return self._loginRetry()
+
+        return True
+
+    def post(self, data: str) -> Reply:
+        req = self._post(data=data, hint=self._token)
+        if req.status_code in (401, 403):
+            self.logger.info(f"Controller rejected token with {req.status_code}. Logging in again")
+            metrics.inc("boiler_relogins_total", controller=self.name)
+            if self._loginRetry():
+                req = self._post(data=data, hint=self._token)
+
+        return req
+
+    def getVars(self, command: str) -> int or None:
+        req = self.post(command)
+        return parseVar(req.text)
+
+    def msgGet(self) -> Screen:
+        req = self.post("MSGGET:bm,-1")
+        self.logger.debug(f"Request Response: {req.text}")
+        return parseScreen(req.text)
+
+    def msgClickUp(self):
+        self.post("MSGCLICK:bm,1,1")
+
+    def msgClickDown(self):
+        self.post(self.config.hmClickDownCmd)
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+            self._session = None
@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+__all__ = [
+    "Screen",
+    "parseVar",
+    "parseScreen",
+    "unpack",
+]
+
+import dataclasses
+import logging
+import re
+from typing import Dict, List, Optional
+# noinspection PyPep8Naming
+import xml.etree.ElementTree as ET
+
+logger = logging.getLogger()
+
+_VAR = re.compile(r'<r\s+v="([0-9A-Fa-f]*)"')
+_ROOT = re.compile(r'\s*(?:<\?xml[^>]*\?>\s*)?<(\w+)([^>]*?)/?>')
+_TEXT = re.compile(r'<t\s([^>]*?)/?>')
+_TEXT_ID_V = re.compile(r'<t\s+id="([^"]*)"\s+v="([^"]*)"\s*/>')
+_ATTR = re.compile(r'(\w+)="([^"]*)"')
+
+@dataclasses.dataclass
+class Screen:
+    """A MSGGET screen. `texts` maps the id of each <t> line to its value."""
+    type: Optional[str] = None
+    texts: Dict[str, str] = dataclasses.field(default_factory=dict)
+
+    def text(self, id: str or int) -> Optional[str]:
+        return self.texts.get(str(id))
+
+def _attrs(raw: str) -> Dict[str, str]:
+    return dict(_ATTR.findall(raw))
+
+def parseVar(xml: str) -> int or None:
+    """
+    Value of a GETVARS response (`<r v="..."/>`) as an integer.
+    Tries a single regex match before falling back to ElementTree.
+    """
+    m = _VAR.search(xml)
+    if m is not None and m.group(1):
+        return int(m.group(1), 16)
+
+    try:
+        root = ET.fromstring(xml)
+    except ET.ParseError:
+        logger.error(f"Failed to parse: {xml}")
+        return None
+
+    r = root.find('r')
+    if r is None:
+        logger.error(f"No value in: {xml}")
+        return None
+
+    val = r.get('v', default=None)
+    if not val:
+        return None
+    return int(val, 16)
+
+def parseScreen(xml: str) -> Screen:
+    """
+    Parse a MSGGET response into a `Screen`.
+    Plain attribute-only markup is scanned with regexes, anything else goes through ElementTree.
+    An unparsable response gives an empty screen.
+    """
+    if "<!" not in xml and "'" not in xml and "&" not in xml:
+        m = _ROOT.match(xml)
+        # A truncated response is left to ElementTree to reject
+        if m is not None and (m.group(0).endswith("/>") or xml.rstrip().endswith(f"</{m.group(1)}>")):
+            screenType = _attrs(m.group(2)).get('type')
+            # Lines are normally written as <t id="" v=""/>, other attribute layouts take the slower scan
+            texts = _TEXT_ID_V.findall(xml, m.end())
+            if len(texts) == xml.count("<t ", m.end()):
+                return Screen(type=screenType, texts=dict(texts))
+
+            return Screen(
+                type=screenType,
+                texts={a['id']: a.get('v') for a in map(_attrs, _TEXT.findall(xml, m.end())) if 'id' in a},
+            )
+
+    try:
+        root = ET.fromstring(xml)
+    except ET.ParseError:
+        logger.error(f"Failed to parse: {xml}")
+        return Screen()
+
+    return Screen(type=root.get('type'), texts={t.get('id'): t.get('v') for t in root.iter('t') if t.get('id') is not None})
+
+def unpack(payload: int, sizes: List[int]) -> List[int]:
+    """
+    Split a big-endian payload into values of the given byte sizes, first value in the most significant bytes.
+    """
+    values = []
+    shift = sum(sizes) * 8
+    for size in sizes:
+        shift -= size * 8
+        values.append((payload >> shift) & ((1 << (size * 8)) - 1))
+
+    return values
@@ -0,0 +1,352 @@
+from __future__ import annotations
+
+__all__ = [
+    "Emulator",
+    "Fault",
+]
+
+import dataclasses
+import logging
+import random
+import socket
+import threading
+import time
+import zlib
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+@dataclasses.dataclass
+class Fault:
+    """
+    A failure injected into requests whose command starts with `command`. An empty `command` matches everything.
+    kind is one of:
+    - "status": answer with HTTP `status` and an empty body
+    - "drop": close the connection without answering
+    - "delay": wait `delay` extra seconds before answering
+    - "garbage": answer with a body that is not valid XML or CSV
+    - "logout": forget the login token before handling the request
+    """
+    kind: str
+    command: str = ""
+    count: int = 1  # Requests to fault, -1 for every matching request
+    probability: float = 1.0
+    status: int = 500
+    delay: float = 0.0
+
+# Raw register value or a function of the seconds since the emulator started
+Value = Union[int, Callable[[float], int]]
+
+class Emulator:
+    """
+    Local stand-in for a HeatMaster controller's /AJAX endpoint.
+    Speaks the UAMCHAL / UAMLOGIN challenge, GETSTDG, MSGGET / MSGCLICK menu screens and GETVARS,
+    with scriptable register values, response latency with jitter and fault injection.
+    Point HM_URL at `url` once started. Runs until `stop()` or as a context manager.
+    """
+    logger = logging.getLogger()
+    # name -> (group, index, bytes)
+    variables: Dict[str, Tuple[int, int, int]] = {
+        "fan": (130, 0, 1),
+        "shutdown": (130, 1, 1),
+        "alarmLt": (130, 2, 1),
+        "lowWater": (129, 0, 1),
+        "bypass": (129, 1, 1),
+        "coldStart": (129, 2, 1),
+        "highLimit": (129, 3, 1),
+        "topAir": (19, 0, 2),
+        "botAir": (19, 1, 2),
+        "waterTemp": (18, 0, 2),
+        "o2": (18, 1, 2),
+    }
+    # Raw values of a boiler mid heating cycle, about 170°F and 8% O2
+    defaults: Dict[str, int] = {
+        "fan": 1,
+        "shutdown": 1,
+        "alarmLt": 0,
+        "lowWater": 1,
+        "bypass": 1,
+        "coldStart": 0,
+        "highLimit": 1,
+        "topAir": 600,
+        "botAir": 400,
+        "waterTemp": 834,
+        "o2": 319,
+    }
+    menu: List[str] = [
+        "Furnace Status",
+        "Water Temp",
+        "Oxygen",
+        "Air Settings",
+        "Heating Setpoint",
+        "Timer Cycle",
+        "Alarms",
+        "Service",
+        "Settings",
+        "About",
+    ]
+    upCommand = "MSGCLICK:bm,1,1"
+    downCommand = "MSGCLICK:bm,1,2"  # Assumed, the real down arrow command is not known
+
+    def __init__(self, password: str = "heatmaster", host: str = "127.0.0.1", port: int = 0,
+                 latency: float = 0.0, jitter: float = 0.0, tokenTtl: float = 0.0, seed: int = None):
+        """
+        `latency` seconds are added to every response, give or take up to `jitter` seconds.
+        A `tokenTtl` above 0 expires login tokens after that many seconds.
+        """
+        self.password = password
+        self.latency = latency
+        self.jitter = jitter
+        self.tokenTtl = tokenTtl
+        self.values: Dict[str, Value] = dict(self.defaults)
+        self.status = "Heating Cycle"
+        self.screen = 0  # Index into menu
+        self.faults: List[Fault] = []
+        self.requests: Counter = Counter()  # Requests per command name
+        self.faulted: Counter = Counter()  # Injected faults per kind
+        self.logins = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._challenges: Dict[str, Tuple[int, List[int]]] = {}  # Login hint -> server challenge and client secrets
+        self._token: Optional[str] = None
+        self._tokenTs = 0.0
+        self._started = time.monotonic()
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.emulator = self
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> Emulator:
+        self._thread = threading.Thread(target=self._server.serve_forever, name="Emulator", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self) -> Emulator:
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def setValues(self, **values: Value):
+        """Set raw register values by variable name. A callable is evaluated on every read."""
+        for name, value in values.items():
+            if name not in self.variables:
+                raise KeyError(f"Unknown variable {name}")
+            self.values[name] = value
+
+    def inject(self, kind: str, command: str = "", count: int = 1, probability: float = 1.0, status: int = 500, delay: float = 0.0) -> Fault:
+        fault = Fault(kind=kind, command=command, count=count, probability=probability, status=status, delay=delay)
+        with self._lock:
+            self.faults.append(fault)
+        return fault
+
+    def resetStats(self):
+        with self._lock:
+            self.requests.clear()
+            self.faulted.clear()
+            self.logins = 0
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"total": sum(self.requests.values()), "logins": self.logins, **self.requests, **{f"fault_{k}": v for k, v in self.faulted.items()}}
+
+    def _fault(self, command: str) -> Optional[Fault]:
+        with self._lock:
+            for fault in self.faults:
+                if fault.count == 0 or not command.startswith(fault.command):
+                    continue
+                if self._random.random() >= fault.probability:
+                    continue
+
+                if fault.count > 0:
+                    fault.count -= 1
+                self.faulted[fault.kind] += 1
+                return fault
+
+        return None
+
+    def _delay(self) -> float:
+        with self._lock:
+            return max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+
+    def _value(self, name: str) -> int:
+        value = self.values[name]
+        if callable(value):
+            value = value(time.monotonic() - self._started)
+        return int(value)
+
+    def _tokenValid(self, hint: Optional[str]) -> bool:
+        if self._token is None or hint != self._token:
+            return False
+        return self.tokenTtl <= 0 or time.monotonic() - self._tokenTs < self.tokenTtl
+
+    def respond(self, command: str, hint: Optional[str]) -> Tuple[Optional[int], str, float]:
+        """
+        Status code, body and delay in seconds for one request, with faults applied.
+        A None status drops the connection.
+        """
+        with self._lock:
+            self.requests[command.split(':', 1)[0]] += 1
+
+        delay = self._delay()
+        fault = self._fault(command)
+        if fault is not None:
+            if fault.kind == "drop":
+                return None, "", 0.0
+            if fault.kind == "status":
+                return fault.status, "", delay
+            if fault.kind == "garbage":
+                return 200, "<d><r v=", delay
+            if fault.kind == "delay":
+                delay += fault.delay
+            if fault.kind == "logout":
+                with self._lock:
+                    self._token = None
+
+        status, body = self.handle(command, hint)
+        return status, body, delay
+
+    def handle(self, command: str, hint: Optional[str]) -> Tuple[int, str]:
+        """Status code and body for one request, without latency or faults."""
+        name = command.split(':', 1)[0]
+        if name == "UAMCHAL":
+            return self._challenge(command)
+        if name == "UAMLOGIN":
+            return self._login(command, hint)
+
+        with self._lock:
+            valid = self._tokenValid(hint)
+        if name == "GETSTDG":
+            # An unknown token is not refused, the controller just does not report running
+            return 200, "Running" if valid else ""
+        if not valid:
+            return 403, ""
+
+        if name == "MSGGET":
+            return 200, self._screenXml()
+        if name == "MSGCLICK":
+            return self._click(command)
+        if name == "GETVARS":
+            return self._getVars(command)
+
+        return 400, ""
+
+    def _challenge(self, command: str) -> Tuple[int, str]:
+        try:
+            secs = [int(x) for x in command.split(':', 1)[1].split(',')[2:6]]
+        except (IndexError, ValueError):
+            return 200, "701"
+        if len(secs) != 4:
+            return 200, "701"
+
+        with self._lock:
+            challenge = self._random.randint(0, 2 ** 31)
+            hint = f"{self._random.getrandbits(32):08x}"
+            self._challenges = {hint: (challenge, secs)}
+        return 200, f"700,{hint},{challenge}"
+
+    def _login(self, command: str, hint: Optional[str]) -> Tuple[int, str]:
+        with self._lock:
+            entry = self._challenges.pop(hint, None)
+        if entry is None:
+            return 200, "701"
+
+        challenge, (a1, a2, b1, b2) = entry
+        try:
+            user, pwToken, serverChallenge = command.split(':', 1)[1].split(',')
+            pwToken = int(pwToken)
+            serverChallenge = int(serverChallenge)
+        except ValueError:
+            return 200, "701"
+
+        expected = zlib.crc32(f"{self.password}+{challenge}"[0:32].encode()) ^ challenge
+        if pwToken != expected or serverChallenge != a1 ^ a2 ^ b1 ^ b2 ^ challenge:
+            return 200, "701"
+
+        with self._lock:
+            self._token = f"{self._random.getrandbits(64):016x}"
+            self._tokenTs = time.monotonic()
+            self.logins += 1
+            return 200, f"700,{self._token}"
+
+    def _screenXml(self) -> str:
+        with self._lock:
+            screen = self.screen
+        title = self.menu[screen]
+        lines = [f'<t id="0" v="{title}"/>']
+        if screen == 0:
+            lines.append(f'<t id="1" v="{self.status}"/>')
+        return f'<?xml version="1.0"?><d type="s">{"".join(lines)}</d>'
+
+    def _click(self, command: str) -> Tuple[int, str]:
+        with self._lock:
+            if command == self.upCommand:
+                self.screen = (self.screen - 1) % len(self.menu)
+            elif command == self.downCommand:
+                self.screen = (self.screen + 1) % len(self.menu)
+            else:
+                return 400, ""
+        return 200, ""
+
+    def _getVars(self, command: str) -> Tuple[int, str]:
+        try:
+            _, group, _, start, size, count = command.split(':', 1)[1].split(',')
+            group, start, size, count = int(group), int(start), int(size), int(count)
+        except ValueError:
+            return 400, ""
+
+        byIndex = {(g, i): (name, s) for name, (g, i, s) in self.variables.items()}
+        payload = 0
+        for index in range(start, start + count):
+            var = byIndex.get((group, index))
+            if var is None or count * var[1] != size:
+                return 200, '<d><r v=""/></d>'
+            payload = (payload << (var[1] * 8)) | (self._value(var[0]) & ((1 << (var[1] * 8)) - 1))
+
+        return 200, f'<d><r v="{payload:0{size * 2}X}"/></d>'
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # Headers and body go out in separate writes
+    server: ThreadingHTTPServer
+
+    # noinspection PyShadowingBuiltins
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: str):
+        data = body.encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    # noinspection PyPep8Naming
+    def do_POST(self):
+        emulator: Emulator = self.server.emulator
+        command = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode()
+        hint = self.headers.get('Security-Hint')
+
+        status, body, delay = emulator.respond(command, hint)
+        if status is None:
+            self.close_connection = True
+            self.connection.shutdown(socket.SHUT_RDWR)
+            return
+
+        if delay > 0:
+            time.sleep(delay)
+        self._send(status, body)
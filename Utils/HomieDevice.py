@@ -5,7 +5,7 @@ __all__ = {
     'DeviceState'
 }
 
-from typing import Optional, Mapping, Iterator, NamedTuple
+from typing import Optional, Mapping, Iterator, NamedTuple, Dict, Tuple
 from functools import partial
 
 from homie_spec.devices import DeviceState, HOMIE_VERSION
@@ -13,18 +13,63 @@ from homie_spec.messages import Message
 from homie_spec.properties import Property
 from homie_spec.nodes import Node
 
-class Device(NamedTuple):
-    """Object representation of a device according to the Homie topology"""
-
-    id: str
+class _TopicEntry(NamedTuple):
+    node_name: str
+    node: Node
+    prop: Property
+    retained: bool
+    qos: int
 
-    name: str
-    nodes: Optional[Mapping[str, Node]] = None
-    extensions: Optional[dict] = None
-    fw: Optional[str] = None
+class Device:
+    """Object representation of a device according to the Homie topology"""
 
-    implementation: str = "homie-spec"
-    prefix: str = "homie"
+    __slots__ = ("id", "name", "nodes", "extensions", "fw", "implementation", "prefix", "_topics")
+
+    def __init__(
+        self,
+        id: str,
+        name: str,
+        nodes: Optional[Mapping[str, Node]] = None,
+        extensions: Optional[dict] = None,
+        fw: Optional[str] = None,
+        implementation: str = "homie-spec",
+        prefix: str = "homie",
+    ):
+        self.id = id
+        self.name = name
+        self.nodes = nodes
+        self.extensions = extensions
+        self.fw = fw
+        self.implementation = implementation
+        self.prefix = prefix
+        # Absolute property topic -> property, compiled when nodes are registered
+        self._topics: Dict[str, _TopicEntry] = {}
+        self._compile()
+
+    def _compile(self):
+        self._topics = {}
+        for node_name, node in (self.nodes or {}).items():
+            self._compileNode(node_name, node)
+
+    def _compileNode(self, node_name: str, node: Node):
+        if node is None:
+            return
+
+        for prop_name, prop in (node.properties or {}).items():
+            topic = f"{self.prefix}/{self.id}/{node_name}/{prop_name}".lower()
+            retained = True if prop.retained is None else prop.retained
+            self._topics[topic] = _TopicEntry(node_name, node, prop, retained, 1)
+
+    def register_node(self, node_name: str, node: Node):
+        """Add or replace a node and compile its property topics."""
+        if self.nodes is None:
+            self.nodes = {}
+
+        old = self.nodes.get(node_name)
+        self.nodes[node_name] = node
+        if old is not None:
+            self._topics = {t: e for t, e in self._topics.items() if e.node_name != node_name}
+        self._compileNode(node_name, node)
 
     def messages(self) -> Iterator[Message]:
         """
@@ -58,8 +103,8 @@ class Device(NamedTuple):
             yield msg("$nodes", payload_nodes)
 
             for node_name, node in self.nodes.items():
-                prefix = "/".join((prefix, node_name))
-                yield from node.messages(prefix=prefix)
+                node_prefix = "/".join((prefix, node_name))
+                yield from node.messages(prefix=node_prefix)
         else:
             yield msg("$nodes", "")
 
@@ -101,19 +146,16 @@ class Device(NamedTuple):
         """
         absolute_path = f"{self.prefix}/{self.id}/{path}".lower()
 
-        # Enumerate all valid topics where the property value should reside.
-        property_topics: Mapping[str, Property] = {
-            f"{self.prefix}/{self.id}/{node_name}/{prop_name}".lower(): prop
-            for node_name, node in (self.nodes or {}).items()
-            for prop_name, prop in (node.properties or {}).items()
-        }
+        entry = self._topics.get(absolute_path)
+        if entry is None or (self.nodes or {}).get(entry.node_name) is not entry.node:
+            # The nodes mapping was changed directly, rebuild the table
+            self._compile()
+            entry = self._topics.get(absolute_path)
 
-        try:
-            prop = property_topics[absolute_path]
-        except KeyError as err:
+        if entry is None:
             absolute_prefix_len = len(f"{self.prefix}/{self.id}")
             reachable_paths = [
-                topic[absolute_prefix_len:].lower() for topic in property_topics.keys()
+                topic[absolute_prefix_len:].lower() for topic in self._topics.keys()
             ]
             raise ValueError(
                 " - ".join(
@@ -122,7 +164,22 @@ class Device(NamedTuple):
                         f"Valid property paths are {reachable_paths}",
                     ]
                 )
-            ) from err
+            )
 
-        message: Message = prop.getter_message(absolute_path)
+        message: Message = entry.prop.getter_message(absolute_path)
         return message
+
+    def getter_messages(self, node_name: Optional[str] = None) -> Iterator[Tuple[str, str, bool, int]]:
+        """
+        "Yields (topic, payload, retained, qos) for every property, or only those of `node_name`,
+        "calling each getter once.
+        "
+        ">>> from homie_spec.properties import Datatype
+        ">>> prop = Property("P", lambda: "4", Datatype.INTEGER)
+        ">>> device = Device("D", "d", {"n": Node("N", "n", {"p": prop})})
+        ">>> list(device.getter_messages("n"))
+        "[('homie/d/n/p', '4', True, 1)]
+        """
+        for topic, entry in self._topics.items():
+            if node_name is None or entry.node_name == node_name:
+                yield topic, entry.prop.get(), entry.retained, entry.qos
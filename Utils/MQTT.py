@@ -2,19 +2,96 @@ from __future__ import annotations
 
 __all__ = [
     "MQTT",
+    "PublishBatch",
 ]
 
-from typing import TYPE_CHECKING, Callable, List, Tuple
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, Set, Tuple
+import asyncio
+import threading
 import time
 import logging
 
 import paho.mqtt.client
 import paho.mqtt.client as mqtt
 from Models.config import Config
+from Utils.Metrics import metrics
+from Utils.Spool import Spool
 
 if TYPE_CHECKING:
     import logging
 
+class PublishBatch:
+    """
+    Handle for a group of messages handed to `MQTT.publishMany`.
+    Wait on it with `wait()` / `join()` or `await` it for delivery.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.delivered = 0
+        self.failed = 0
+        self.spooled = 0  # Written to the offline spool, sent after the broker is back
+        self.started = time.monotonic()
+        self.queued: float or None = None  # When the last message was handed to paho
+        self.finished: float or None = None  # When the last message was delivered
+        self._closed = False
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    def _add(self):
+        self.count += 1
+
+    def _complete(self, ok: bool = True):
+        with self._lock:
+            if ok:
+                self.delivered += 1
+            else:
+                self.failed += 1
+            self._checkDone()
+        metrics.inc("boiler_mqtt_messages_total", result="delivered" if ok else "failed")
+
+    def _spool(self):
+        with self._lock:
+            self.spooled += 1
+            self._checkDone()
+
+    def _close(self):
+        with self._lock:
+            self.queued = time.monotonic()
+            self._closed = True
+            self._checkDone()
+
+    def _checkDone(self):
+        if self._closed and self.delivered + self.failed + self.spooled >= self.count and not self._done.is_set():
+            self.finished = time.monotonic()
+            self._done.set()
+            if self.count:
+                metrics.observe("boiler_mqtt_seconds", self.finished - self.started, op="deliver")
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout: float = None) -> bool:
+        return self._done.wait(timeout)
+
+    def join(self, timeout: float = None) -> bool:
+        return self.wait(timeout)
+
+    def __await__(self):
+        return asyncio.get_running_loop().run_in_executor(None, self.wait).__await__()
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "delivered": self.delivered,
+            "failed": self.failed,
+            "spooled": self.spooled,
+            "queue_secs": (self.queued or time.monotonic()) - self.started,
+            "delivery_secs": (self.finished or time.monotonic()) - self.started,
+        }
+
 class MQTT:
     logger = logging.getLogger()
     _began = False
@@ -26,6 +103,10 @@ class MQTT:
     _debug = False
     _mqttVerbose: bool = False
     disconnectCode: int = 0
+    inflightWindow: int = 100
+    publishTimeout: float = 10.0
+    drainRetrySecs: float = 1.0  # First wait before a stalled spool drain is retried, doubled on each stall
+    drainRetryMaxSecs: float = 60.0
 
     def __init__(self, clientId: str, onMessage: Callable, onConnect: Callable = None, onDisconnect: Callable = None, onSubscribe: Callable = None):
         self.client = mqtt.Client(protocol=paho.mqtt.client.MQTTv311, client_id=clientId, clean_session=False)
@@ -34,6 +115,19 @@ class MQTT:
         self._onConnect = onConnect
         self._onDisconnect = onDisconnect
         self._onSubscribe = onSubscribe
+        self._inflight = 0
+        self._pending: Dict[int, PublishBatch] = {}
+        self._published: Set[int] = set()
+        self._window = threading.Condition(threading.RLock())
+        self._connected = False
+        self.spool: Spool or None = None
+        if self.config.mqttSpoolEnabled and self.config.mqttSpoolPath:
+            history = [t.strip() for t in self.config.mqttSpoolHistory.split(',') if t.strip()]
+            self.spool = Spool(self.config.mqttSpoolPath, int(self.config.mqttSpoolMaxMb * 1024 * 1024), history)
+        self._drainWake = threading.Event()
+        self._drainer: threading.Thread or None = None
+        # Held from checking a spooled message until paho queued it, so a live publish of its topic can not slip in between
+        self._order = threading.Lock()
 
     def begin(self):
         if self._mqttVerbose:
@@ -41,39 +135,154 @@ class MQTT:
 
         self.client.on_message = self._onMessage
 
-        if self._onConnect is not None:
-            self.client.on_connect = self._onConnect
-        else:
-            self.client.on_connect = self._onConnectDefault
-
-        if self._onDisconnect is not None:
-            self.client.on_disconnect = self._onDisconnect
-        else:
-            self.client.on_disconnect = self._onDisconnectDefault
+        self.client.on_connect = self._handleConnect
+        self.client.on_disconnect = self._handleDisconnect
 
         if self._onSubscribe is not None:
             self.client.on_subscribe = self._onSubscribe
         else:
             self.client.on_subscribe = self._onSubscribeDefault
 
-        self.client.max_inflight_messages_set(100)
+        self.client.on_publish = self._onPublish
+        self.client.max_inflight_messages_set(self.inflightWindow)
         self.client.username_pw_set(username=self.config.mqttUser, password=self.config.mqttPasswd)
-        self.client.connect(self.config.mqttServer)
+        try:
+            self.client.connect(self.config.mqttServer, self.config.mqttPort)
+        except OSError as e:
+            if self.spool is None:
+                raise
+            # The network loop keeps retrying, publishes are spooled meanwhile
+            self.logger.warning(f"MQTT broker unreachable ({e}). Spooling until it is back")
+            self.client.connect_async(self.config.mqttServer, self.config.mqttPort)
         self._began = True
+        if self.spool is not None and (self._drainer is None or not self._drainer.is_alive()):
+            self._drainer = threading.Thread(target=self._drain, name="MQTTSpool", daemon=True)
+            self._drainer.start()
         self.client.loop_start()
 
-    def publishHomie(self, topic, payload, retain=False, qos=0):
-        self.client.publish(topic=topic, payload=payload, retain=retain, qos=qos)
-        time.sleep(0.02)
+    def publishHomie(self, topic, payload, retain=False, qos=0) -> PublishBatch:
+        return self.publishMany([(topic, payload, retain, qos)])
 
-    def stop(self):
+    def _spooling(self) -> bool:
+        return self.spool is not None and not self._connected
+
+    def publishMany(self, messages: Iterable[Tuple[str, str, bool, int]]) -> PublishBatch:
+        """
+        Queue (topic, payload, retain, qos) messages, paced by the in-flight window instead of fixed sleeps.
+        A slot is freed whenever paho reports a message as published.
+        While the broker is unreachable the messages go to the offline spool instead.
+        Once it is back they are sent straight away, the spooled values they replace are not drained.
+        """
+        batch = PublishBatch()
+        for topic, payload, retain, qos in messages:
+            if self._spooling():
+                batch._add()
+                if self.spool.put(topic, payload, retain, qos):
+                    batch._spool()
+                else:
+                    batch._complete(ok=False)
+            elif self.spool is not None:
+                with self._order:
+                    self.spool.supersede(topic)
+                    self._send(batch, topic, payload, retain, qos)
+            else:
+                self._send(batch, topic, payload, retain, qos)
+
+        batch._close()
+        if batch.count:
+            metrics.observe("boiler_mqtt_seconds", batch.queued - batch.started, op="queue")
+        return batch
+
+    def _send(self, batch: PublishBatch, topic: str, payload, retain: bool, qos: int):
+        with self._window:
+            # Without a connection paho only queues the message and no slot frees up, so waiting would just stall the caller
+            if not self._window.wait_for(lambda: self._inflight < self.inflightWindow or not self._connected, timeout=self.publishTimeout):
+                self.logger.warning("MQTT in-flight window still full. Publishing anyway")
+            self._inflight += 1
+
+        # paho calls on_publish while holding its own locks so ours must not be held here
+        try:
+            info = self.client.publish(topic=topic, payload=payload, retain=retain, qos=qos)
+        except Exception:
+            with self._window:
+                self._release()
+            raise
+        batch._add()
+
+        with self._window:
+            if info.rc != mqtt.MQTT_ERR_SUCCESS and qos == 0:
+                # Dropped by paho, no publish callback will follow
+                self._release()
+                batch._complete(ok=False)
+            elif info.mid in self._published:
+                # Delivered before it could be registered
+                self._published.discard(info.mid)
+                self._release()
+                batch._complete()
+            else:
+                self._pending[info.mid] = batch
+
+    def _drain(self):
+        """
+        Send the spool in rate limited batches whenever the broker is connected.
+        A stalled batch is retried after a wait that doubles up to `drainRetryMaxSecs`, or on the next connect.
+        """
+        backoff = 0.0
+        while True:
+            self._drainWake.wait(backoff or None)
+            self._drainWake.clear()
+            while self._connected and not self.spool.empty:
+                start = time.monotonic()
+                messages, position = self.spool.take(self.config.mqttSpoolDrainBatch)
+                batch = PublishBatch()
+                for message in messages:
+                    with self._order:
+                        # A live publish since take() may have replaced it
+                        message = self.spool.current(message)
+                        if message is not None:
+                            self._send(batch, *message)
+                batch._close()
+                if not batch.wait(self.publishTimeout) or batch.failed:
+                    backoff = min(backoff * 2, self.drainRetryMaxSecs) if backoff else self.drainRetrySecs
+                    self.logger.warning(f"MQTT spool drain stalled, retrying in {backoff:.0f}s. {batch.stats}")
+                    break
+
+                backoff = 0.0
+                self.spool.ack(position)
+                self.logger.debug(f"Drained {len(messages)} spooled messages")
+                pause = len(messages) / max(self.config.mqttSpoolDrainRate, 1.0) - (time.monotonic() - start)
+                if pause > 0:
+                    time.sleep(pause)
+
+    def _release(self):
+        self._inflight = max(0, self._inflight - 1)
+        self._window.notify()
+
+    # noinspection PyUnusedLocal
+    def _onPublish(self, client, userdata, mid):
+        with self._window:
+            batch = self._pending.pop(mid, None)
+            if batch is None:
+                self._published.add(mid)
+                return
+            self._release()
+
+        batch._complete()
+
+    def _disconnect(self):
         self.client.loop_stop(True)
         self.client.disconnect()
+        self._connected = False
         self._began = False
 
+    def stop(self):
+        self._disconnect()
+        if self.spool is not None:
+            self.spool.close()
+
     def restart(self):
         self.logger.warning("Restart of MQTT requested")
-        self.stop()
+        self._disconnect()
         time.sleep(3)
         self.begin()
 
@@ -85,6 +294,19 @@ class MQTT:
         if self._debug:
             self.logger.debug(f"Subscribed to {topic} with qos: {qos}")
 
+    def _handleConnect(self, client, userdata, flags, rc):
+        self._connected = rc == 0
+        if self._connected:
+            self._drainWake.set()
+        (self._onConnect or self._onConnectDefault)(client, userdata, flags, rc)
+
+    def _handleDisconnect(self, client, userdata, rc):
+        with self._window:
+            self._connected = False
+            # Publishers waiting for a slot stop waiting
+            self._window.notify_all()
+        (self._onDisconnect or self._onDisconnectDefault)(client, userdata, rc)
+
     # noinspection PyUnusedLocal
     def _onConnectDefault(self, client, userdata, flags, rc):
         if self._debug:
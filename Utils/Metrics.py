@@ -0,0 +1,259 @@
+from __future__ import annotations
+
+__all__ = [
+    "Histogram",
+    "Metrics",
+    "metrics",
+]
+
+import bisect
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+Labels = Tuple[Tuple[str, str], ...]
+
+class Histogram:
+    """Latency histogram with fixed upper bounds in seconds, rendered as a Prometheus histogram."""
+    buckets: List[float] = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0]
+
+    def __init__(self):
+        self.counts = [0] * (len(self.buckets) + 1)  # The last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self) -> Tuple[List[int], float, int]:
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+class _Timer:
+    __slots__ = ("_metrics", "_name", "_labels", "_start")
+
+    def __init__(self, metrics: Metrics, name: str, labels: Dict[str, str]):
+        self._metrics = metrics
+        self._name = name
+        self._labels = labels
+
+    def __enter__(self) -> _Timer:
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._metrics.observe(self._name, time.perf_counter() - self._start, **self._labels)
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self) -> _NullTimer:
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+_NULL_TIMER = _NullTimer()
+
+class Metrics:
+    """
+    Process wide latency histograms, counters and gauges.
+    Everything is a no-op until `enable()` is called, so instrumented code costs one attribute check when metrics are off.
+    """
+    logger = logging.getLogger()
+    enabled: bool = False
+    descriptions: Dict[str, str] = {
+        "boiler_request_seconds": "Controller request latency by command",
+        "boiler_cycle_seconds": "Full poll cycle latency",
+        "boiler_phase_seconds": "Poll cycle latency by phase",
+        "boiler_db_seconds": "Database operation latency",
+        "boiler_mqtt_seconds": "MQTT publish latency",
+        "boiler_logins_total": "Controller logins",
+        "boiler_relogins_total": "Requests retried after the controller rejected the token",
+        "boiler_reconnects_total": "Controller connections dropped and opened again",
+        "boiler_mqtt_messages_total": "MQTT messages by result: sent or suppressed by the publish cache, spooled, delivered, failed or dropped",
+        "boiler_command_seconds": "Time from receiving an MQTT command to applying it",
+        "boiler_commands_total": "MQTT commands by result",
+        "boiler_nav_cycles_total": "Poll cycles that looked for the status screen",
+        "boiler_nav_clicks_total": "Menu clicks made to reach the status screen",
+        "boiler_nav_clicks_avg": "Average menu clicks per poll cycle",
+        "boiler_nav_clicks_max": "Most menu clicks any poll cycle needed",
+    }
+
+    def __init__(self):
+        self._histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._gauges: Dict[Tuple[str, Labels], float] = {}
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    def enable(self):
+        self.enabled = True
+
+    @staticmethod
+    def _key(name: str, labels: Dict[str, str]) -> Tuple[str, Labels]:
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def observe(self, name: str, seconds: float, **labels: str):
+        if not self.enabled:
+            return
+
+        key = self._key(name, labels)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, Histogram())
+        histogram.observe(seconds)
+
+    def inc(self, name: str, amount: float = 1, **labels: str):
+        if not self.enabled:
+            return
+
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def set(self, name: str, value: float, **labels: str):
+        """Set a gauge to `value`."""
+        if not self.enabled:
+            return
+
+        key = self._key(name, labels)
+        with self._lock:
+            self._gauges[key] = value
+
+    def timer(self, name: str, **labels: str):
+        """Context manager observing how long its block took."""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name, labels)
+
+    @staticmethod
+    def _labelText(labels: Labels, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+        pairs = labels + extra
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+            gauges = sorted(self._gauges.items())
+
+        lines: List[str] = []
+        typed = set()
+        for (name, labels), histogram in histograms:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# HELP {name} {self.descriptions.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+            counts, total, count = histogram.snapshot()
+            cumulative = 0
+            for bound, n in zip(histogram.buckets + [float("inf")], counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{name}_bucket{self._labelText(labels, (('le', le),))} {cumulative}")
+            lines.append(f"{name}_sum{self._labelText(labels)} {total}")
+            lines.append(f"{name}_count{self._labelText(labels)} {count}")
+
+        for (name, labels), value in counters:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# HELP {name} {self.descriptions.get(name, name)}")
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{self._labelText(labels)} {value}")
+
+        for (name, labels), value in gauges:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# HELP {name} {self.descriptions.get(name, name)}")
+                lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name}{self._labelText(labels)} {value}")
+
+        lines.append("# HELP boiler_uptime_seconds Seconds since the publisher started")
+        lines.append("# TYPE boiler_uptime_seconds gauge")
+        lines.append(f"boiler_uptime_seconds {time.monotonic() - self._started}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self, controller: str = None) -> Dict[str, str]:
+        """
+        Flat Homie friendly view: average milliseconds and count per histogram, value per counter and gauge.
+        With `controller` only metrics of that controller or of no controller are included.
+        Keys are lowercase letters, digits and dashes.
+        """
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+            gauges = sorted(self._gauges.items())
+
+        def _id(name: str, labels: Labels) -> Optional[str]:
+            values = []
+            for k, v in labels:
+                if k == "controller":
+                    if controller is not None and v != controller:
+                        return None
+                    continue
+                values.append(v)
+            base = name.replace("boiler_", "", 1).replace("_seconds", "").replace("_total", "")
+            return "-".join([base] + values).replace("_", "-").replace(":", "-").lower()
+
+        stats = {"uptime": f"{time.monotonic() - self._started:.0f}"}
+        for (name, labels), histogram in histograms:
+            key = _id(name, labels)
+            if key is None:
+                continue
+            _, total, count = histogram.snapshot()
+            stats[f"{key}-avg-ms"] = f"{total / count * 1000:.2f}" if count else "0"
+            stats[f"{key}-count"] = str(count)
+
+        for (name, labels), value in counters + gauges:
+            key = _id(name, labels)
+            if key is not None:
+                stats[key] = f"{value:g}"
+
+        return stats
+
+    def serve(self, port: int, host: str = "127.0.0.1"):
+        """Serve `render()` over HTTP on a background thread."""
+        self._server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        self._server.daemon_threads = True
+        self._server.metrics = self
+        threading.Thread(target=self._server.serve_forever, name="Metrics", daemon=True).start()
+        self.logger.info(f"Serving metrics on http://{host}:{self._server.server_address[1]}/metrics")
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    server: ThreadingHTTPServer
+
+    # noinspection PyShadowingBuiltins
+    def log_message(self, format, *args):
+        pass
+
+    # noinspection PyPep8Naming
+    def do_GET(self):
+        if self.path.split('?', 1)[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+
+        body = self.server.metrics.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+metrics = Metrics()
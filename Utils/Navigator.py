@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+__all__ = [
+    "Navigator",
+]
+
+import logging
+from collections import deque
+from typing import Dict, Optional, Set, Tuple
+
+from Utils.Metrics import metrics
+
+class Navigator:
+    """
+    Learns the controller's menu order from the clicks it makes and plans the shortest way to the status screen.
+    Up moves are learned as they happen. A down move is assumed to undo an up move until the controller shows otherwise.
+    Screens are identified by their lowercase title.
+    Clicks per cycle are exported as boiler_nav_* metrics labelled with `controller`.
+    """
+    logger = logging.getLogger()
+    UP = "up"
+    DOWN = "down"
+
+    def __init__(self, target: str = "furnace status", useDown: bool = True, controller: str = "boiler"):
+        self.target = target
+        self.controller = controller
+        self.useDown = useDown
+        self._moves: Dict[Tuple[str, str], str] = {}  # (screen, move) -> screen it leads to
+        self._badDown: Set[str] = set()  # Screens where the assumed down move was wrong
+        self.lastScreen: Optional[str] = None
+        self.cycles = 0
+        self.clicks = 0
+        self.maxClicks = 0
+        self.navSecs = 0.0
+        self.maxNavSecs = 0.0
+
+    def _neighbours(self, screen: str):
+        up = self._moves.get((screen, self.UP))
+        if up is not None:
+            yield self.UP, up
+
+        if not self.useDown:
+            return
+
+        down = self._moves.get((screen, self.DOWN))
+        if down is not None:
+            yield self.DOWN, down
+        elif screen not in self._badDown:
+            for (src, move), dst in self._moves.items():
+                if move == self.UP and dst == screen:
+                    yield self.DOWN, src
+                    break
+
+    def _path(self, screen: str) -> Tuple[Optional[str], int]:
+        """First move and length of the shortest known path from `screen` to the target."""
+        seen = {screen}
+        queue = deque([(screen, None, 0)])
+        while queue:
+            current, first, length = queue.popleft()
+            if current == self.target:
+                return first, length
+            for move, nxt in self._neighbours(current):
+                if nxt not in seen:
+                    seen.add(nxt)
+                    queue.append((nxt, first or move, length + 1))
+
+        return None, 0
+
+    def nextMove(self, screen: Optional[str]) -> str:
+        if screen is None:
+            return self.UP
+
+        move, length = self._path(screen)
+        if move is None:
+            # Nothing known yet, keep exploring upwards
+            return self.UP
+
+        # The menu wraps around, so a long way up is worth one try downwards
+        screens = {src for src, _ in self._moves} | set(self._moves.values())
+        if self.useDown and move == self.UP and (screen, self.DOWN) not in self._moves and length > len(screens) / 2:
+            return self.DOWN
+
+        return move
+
+    def observe(self, screen: Optional[str], move: str, result: Optional[str]):
+        self.lastScreen = result
+        if screen is None or result is None:
+            return
+
+        if move == self.DOWN:
+            expected = next((dst for m, dst in self._neighbours(screen) if m == self.DOWN), None)
+            if expected is not None and expected != result:
+                self.logger.debug(f"Down from {screen} went to {result}, not {expected}")
+                self._badDown.add(screen)
+
+        self._moves[(screen, move)] = result
+
+    def record(self, clicks: int, secs: float):
+        self.cycles += 1
+        self.clicks += clicks
+        self.maxClicks = max(self.maxClicks, clicks)
+        self.navSecs += secs
+        self.maxNavSecs = max(self.maxNavSecs, secs)
+        metrics.inc("boiler_nav_cycles_total", controller=self.controller)
+        metrics.inc("boiler_nav_clicks_total", clicks, controller=self.controller)
+        metrics.set("boiler_nav_clicks_avg", self.clicks / self.cycles, controller=self.controller)
+        metrics.set("boiler_nav_clicks_max", self.maxClicks, controller=self.controller)
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        return {
+            "cycles": self.cycles,
+            "avg_clicks": self.clicks / self.cycles if self.cycles else 0.0,
+            "max_clicks": self.maxClicks,
+            "avg_secs": self.navSecs / self.cycles if self.cycles else 0.0,
+            "max_secs": self.maxNavSecs,
+            "known_moves": len(self._moves),
+        }
@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+__all__ = [
+    "PollPolicy",
+]
+
+import logging
+from typing import Dict, Optional, Tuple
+
+from Models.BoilerData import BoilerData, BoilerStatus
+from Models.config import Config
+
+class PollPolicy:
+    """
+    Picks the next poll interval from the latest `BoilerData`.
+    Transitions (status change, bypass / shutdown / cold start flips, water temp or O2 moving fast) poll at the minimum.
+    A heating cycle polls at the base interval. A boiler that stays quiet backs off towards the maximum.
+    Flips are found by comparing with the values seen on the previous call, not with `TrackedBool.changed`,
+    which keeps its old state on cycles where the slow tier does not read the variable.
+    """
+    logger = logging.getLogger()
+    # Statuses that are worth watching closely
+    active = [BoilerStatus.HEATING, BoilerStatus.COLD_START, BoilerStatus.TIMER_CYCLE, BoilerStatus.ALARM, BoilerStatus.LOW_TEMP]
+    # Statuses that do not come from the controller
+    unknown = (BoilerStatus.OFFLINE, BoilerStatus.ERROR, BoilerStatus.NONE)
+    flags = ("bypass", "shutdown", "coldStart")
+
+    def __init__(self, config: Config):
+        self.config = config
+        self.base = float(config.updateBoilerSeconds)
+        self.minimum = float(min(config.pollMinSecs, config.updateBoilerSeconds))
+        self.maximum = float(max(config.pollMaxSecs, config.updateBoilerSeconds))
+        self.interval = self.base
+        self._lastStatus: Optional[BoilerStatus] = None
+        self._lastFlags: Dict[str, bool] = {}
+
+    def _clamp(self, seconds: float) -> float:
+        return max(self.minimum, min(self.maximum, seconds))
+
+    def nextInterval(self, bd: Optional[BoilerData]) -> Tuple[float, str]:
+        """Seconds until the next poll and why."""
+        if not self.config.pollAdaptive:
+            return self.base, "fixed interval"
+        if bd is None:
+            return self.base, "no data"
+
+        interval, reason = self._choose(bd)
+        self.interval = self._clamp(interval)
+        self._lastStatus = bd.status
+        if bd.status not in self.unknown:
+            # Offline placeholder data would look like flips once the controller is back
+            self._lastFlags = {name: bool(getattr(bd, name)) for name in self.flags}
+        return self.interval, reason
+
+    def _choose(self, bd: BoilerData) -> Tuple[float, str]:
+        if bd.status in self.unknown:
+            return self.base, f"status {bd.status.name}"
+
+        if self._lastStatus is not None and bd.status != self._lastStatus:
+            return self.minimum, f"status changed {self._lastStatus.name} -> {bd.status.name}"
+
+        for name in self.flags:
+            value = bool(getattr(bd, name))
+            if name in self._lastFlags and value != self._lastFlags[name]:
+                return self.minimum, f"{name} changed to {value}"
+
+        # Slopes are per sample, turn them into per minute rates with the interval that produced them
+        perMinute = 60.0 / self.interval
+        waterRate = bd.waterSlope * perMinute
+        o2Rate = bd.o2Slope * perMinute
+        if abs(waterRate) >= self.config.pollWaterRate:
+            return self.minimum, f"water temp moving {waterRate:+.2f}°F/min"
+        if abs(o2Rate) >= self.config.pollO2Rate:
+            return self.minimum, f"O2 moving {o2Rate:+.2f}%/min"
+
+        if bd.status in self.active or bd.alarmLt or bd.woodLow or bd.woodEmpty:
+            return self.base, f"status {bd.status.name}"
+
+        return self.interval * self.config.pollBackoff, f"quiet {bd.status.name}, backing off"
@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+__all__ = [
+    "PublishCache",
+]
+
+import threading
+import time
+from typing import Dict, Tuple
+
+from Utils.Metrics import metrics
+
+class PublishCache:
+    """
+    Remembers the last payload published per topic so unchanged values can be skipped.
+    A topic is published again once `refreshSeconds` have passed, 0 disables the periodic refresh.
+    Safe to share between the pooled poll tasks and the command thread.
+    Every decision is also counted in `boiler_mqtt_messages_total` as result "sent" or "suppressed".
+    """
+
+    def __init__(self, refreshSeconds: int = 0):
+        self.refreshSeconds = refreshSeconds
+        self.sent = 0
+        self.suppressed = 0
+        self._last: Dict[str, Tuple[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def changed(self, topic: str, payload: str) -> bool:
+        """Returns True and records the payload when it should be published."""
+        now = time.monotonic()
+        with self._lock:
+            last = self._last.get(topic)
+            if last is not None and last[0] == payload and \
+                    (self.refreshSeconds <= 0 or now - last[1] < self.refreshSeconds):
+                self.suppressed += 1
+                metrics.inc("boiler_mqtt_messages_total", result="suppressed")
+                return False
+
+            self._last[topic] = (payload, now)
+            self.sent += 1
+        metrics.inc("boiler_mqtt_messages_total", result="sent")
+        return True
+
+    def clear(self):
+        """Forget every payload so the next pass publishes everything."""
+        with self._lock:
+            self._last.clear()
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "sent": self.sent,
+                "suppressed": self.suppressed,
+            }
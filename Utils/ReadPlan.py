@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+__all__ = [
+    "PlanVar",
+    "PlanRead",
+    "ReadPlan",
+]
+
+import asyncio
+import dataclasses
+import logging
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from Utils.Decoder import unpack
+
+@dataclasses.dataclass(frozen=True)
+class PlanVar:
+    name: str
+    group: int
+    index: int
+    size: int = 1  # Bytes per value
+
+@dataclasses.dataclass(frozen=True)
+class PlanRead:
+    group: int
+    start: int
+    variables: Tuple[PlanVar, ...]
+
+    @property
+    def size(self) -> int:
+        return sum(v.size for v in self.variables)
+
+    @property
+    def command(self) -> str:
+        return f"GETVARS:v0,{self.group},0,{self.start},{self.size},{len(self.variables)}"
+
+    def decode(self, payload: int or None) -> Dict[str, Optional[int]]:
+        """
+        Split the combined payload back into its variables.
+        The first variable occupies the most significant bytes.
+        A single variable read returns the payload untouched.
+        """
+        if payload is None:
+            return {v.name: None for v in self.variables}
+
+        if len(self.variables) == 1:
+            return {self.variables[0].name: payload}
+
+        return dict(zip((v.name for v in self.variables), unpack(payload, [v.size for v in self.variables])))
+
+class ReadPlan:
+    """
+    Merges neighbouring controller variables into multi-value GETVARS requests.
+    Variables are merged when they share a group, have consecutive indexes and the same size.
+    With batching off only multi-byte words are merged, which matches the original one request per variable path.
+    """
+    logger = logging.getLogger()
+
+    def __init__(self, variables: Iterable[PlanVar], batched: bool = True, maxVars: int = 8):
+        self.variables: List[PlanVar] = list(variables)
+        self.batched = batched
+        self.maxVars = maxVars
+        self.reads: List[PlanRead] = self._compile()
+
+    def _compile(self) -> List[PlanRead]:
+        reads: List[PlanRead] = []
+        run: List[PlanVar] = []
+
+        for v in sorted(self.variables, key=lambda x: (x.group, x.index)):
+            if run and (self.batched or v.size > 1) and \
+                    v.group == run[-1].group and \
+                    v.index == run[-1].index + 1 and \
+                    v.size == run[-1].size and \
+                    len(run) < self.maxVars:
+                run.append(v)
+                continue
+
+            if run:
+                reads.append(PlanRead(group=run[0].group, start=run[0].index, variables=tuple(run)))
+            run = [v]
+
+        if run:
+            reads.append(PlanRead(group=run[0].group, start=run[0].index, variables=tuple(run)))
+
+        return reads
+
+    def subset(self, names: Iterable[str]) -> ReadPlan:
+        """Plan for only the named variables, with the same batching."""
+        names = set(names)
+        return ReadPlan([v for v in self.variables if v.name in names], batched=self.batched, maxVars=self.maxVars)
+
+    def execute(self, read: Callable[[str], int or None]) -> Dict[str, Optional[int]]:
+        """
+        Run every request of the plan through `read`, which takes a GETVARS command and returns the parsed payload.
+        """
+        values: Dict[str, Optional[int]] = {}
+        for r in self.reads:
+            val = read(r.command)
+            self.logger.debug(f"Read plan: {r.command} = {val}")
+            values.update(r.decode(val))
+
+        return values
+
+    async def executeAsync(self, read: Callable[[str], Awaitable[int or None]]) -> Dict[str, Optional[int]]:
+        """
+        Same as `execute` with an async `read`. The requests are issued concurrently.
+        """
+        results = await asyncio.gather(*(read(r.command) for r in self.reads))
+
+        values: Dict[str, Optional[int]] = {}
+        for r, val in zip(self.reads, results):
+            self.logger.debug(f"Read plan: {r.command} = {val}")
+            values.update(r.decode(val))
+
+        return values
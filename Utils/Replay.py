@@ -0,0 +1,340 @@
+from __future__ import annotations
+
+__all__ = [
+    "Recorder",
+    "ReplayClock",
+    "ReplayError",
+    "ReplayResult",
+    "ReplayTransport",
+    "Replayer",
+    "snapshot",
+]
+
+import dataclasses
+import json
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from enum import Enum
+from typing import TYPE_CHECKING, Deque, Dict, List, Optional, Tuple
+
+import arrow
+import requests
+
+from Database.Database import Dbase
+from Database.Models.Event import Event, EventData, EventType
+from Models.BoilerData import BoilerData, TrackedBool
+from Models.config import Config
+from Utils.Clock import Clock
+from Utils.Controller import Reply
+
+if TYPE_CHECKING:
+    from Utils.Boiler import Boiler
+
+# Commands carrying login secrets are stored by name only
+_REDACTED = ("UAMCHAL", "UAMLOGIN")
+# Config fields left out of recordings
+_SECRETS = {"hmPassword", "mqttUser", "mqttPasswd", "hmUrl"}
+
+class ReplayError(Exception):
+    """The replayed poller asked for something the recording does not have."""
+
+def _convert(value):
+    if isinstance(value, arrow.Arrow):
+        return value.isoformat()
+    if isinstance(value, TrackedBool):
+        return value.value
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, dict):
+        return {k: _convert(v) for k, v in value.items()}
+    return value
+
+def snapshot(bd: Optional[BoilerData]) -> Optional[dict]:
+    """JSON friendly copy of every BoilerData field."""
+    if bd is None:
+        return None
+    return {name: _convert(getattr(bd, name)) for name in BoilerData.model_fields}
+
+def _commandName(data: str) -> str:
+    return data.split(':', 1)[0]
+
+class _RecordingClock(Clock):
+    def __init__(self, inner: Clock, recorder: Recorder):
+        self._inner = inner
+        self._recorder = recorder
+
+    def utcnow(self) -> arrow.Arrow:
+        value = self._inner.utcnow()
+        self._recorder.clockRead("u", value.isoformat())
+        return value
+
+    def now(self) -> arrow.Arrow:
+        value = self._inner.now()
+        self._recorder.clockRead("n", value.isoformat())
+        return value
+
+    def monotonic(self) -> float:
+        value = self._inner.monotonic()
+        self._recorder.clockRead("m", value)
+        return value
+
+    def sleep(self, seconds: float):
+        self._inner.sleep(seconds)
+
+class Recorder:
+    """
+    Records a `Boiler` poll session as JSON lines.
+    The first line holds the config, the random seed and the controller's events at the start.
+    Every poll cycle then writes one line with each clock read, each controller exchange, the events added and the resulting BoilerData.
+    Attach right after the Boiler is created so replay starts from the same state.
+    """
+    logger = logging.getLogger()
+
+    def __init__(self, path: str, boiler: Boiler):
+        self.path = path
+        self.boiler = boiler
+        self.cycles = 0
+        self._cycle: Optional[dict] = None
+        self._cycleThread: Optional[int] = None
+        self._lock = threading.Lock()
+        self._file = open(path, "w")
+
+        boiler._db.flush()
+        rows = Event.select().where(Event.controller == boiler.name).order_by(Event.id)
+        self._write({
+            "version": 1,
+            "name": boiler.name,
+            "seed": boiler.seed,
+            "config": boiler.config.model_dump(mode="json", by_alias=True, exclude=_SECRETS),
+            "events": [[r.eventType, str(r.ts), r.value] for r in rows],
+        })
+
+        clock = _RecordingClock(boiler.clock, self)
+        boiler.clock = clock
+        boiler._client.clock = clock
+        boiler._client.recorder = self
+        boiler.recorder = self
+        self._listener = boiler._db.addListener(self._onEvent)
+        self.logger.info(f"Recording {boiler.name} to {path}")
+
+    def _write(self, line: dict):
+        with self._lock:
+            self._file.write(json.dumps(line, separators=(',', ':')) + "\n")
+            self._file.flush()
+
+    def _inCycle(self) -> bool:
+        return self._cycle is not None and threading.get_ident() == self._cycleThread
+
+    def beginCycle(self):
+        self._cycle = {"clock": [], "exchanges": [], "events": []}
+        self._cycleThread = threading.get_ident()
+
+    def clockRead(self, kind: str, value):
+        if self._inCycle():
+            self._cycle["clock"].append([kind, value])
+
+    def exchange(self, data: str, hint: Optional[str], reply: Optional[Reply], error: Exception = None):
+        if not self._inCycle():
+            return
+
+        if _commandName(data) in _REDACTED:
+            data = _commandName(data)
+        if reply is None:
+            self._cycle["exchanges"].append([data, None, type(error).__name__])
+        else:
+            self._cycle["exchanges"].append([data, reply.status_code, reply.text])
+
+    def _onEvent(self, event: EventData):
+        entry = [event.eventType.value, event.ts.isoformat(), event.value]
+        if self._inCycle():
+            self._cycle["events"].append(entry)
+        else:
+            # Added between cycles, like a wood fill reported over MQTT
+            self._write({"event": entry})
+
+    def endCycle(self):
+        if not self._inCycle():
+            return
+
+        self._cycle["data"] = snapshot(self.boiler.boilerData)
+        self._write(self._cycle)
+        self._cycle = None
+        self.cycles += 1
+
+    def close(self):
+        self.boiler._db.removeListener(self._listener)
+        with self._lock:
+            self._file.close()
+
+class ReplayClock(Clock):
+    """Hands back the clock reads of one recorded cycle in order. Sleeping returns at once."""
+
+    def __init__(self):
+        self._reads: Deque[Tuple[str, object]] = deque()
+        self._last: Dict[str, object] = {"u": arrow.get(0).isoformat(), "n": arrow.get(0).isoformat(), "m": 0.0}
+        self.misses = 0
+
+    def load(self, reads: List[list]):
+        self._reads = deque((kind, value) for kind, value in reads)
+
+    @property
+    def remaining(self) -> int:
+        return len(self._reads)
+
+    def _next(self, kind: str):
+        if self._reads and self._reads[0][0] == kind:
+            self._last[kind] = self._reads.popleft()[1]
+        else:
+            self.misses += 1
+        return self._last[kind]
+
+    def utcnow(self) -> arrow.Arrow:
+        return arrow.get(self._next("u"))
+
+    def now(self) -> arrow.Arrow:
+        return arrow.get(self._next("n"))
+
+    def monotonic(self) -> float:
+        return float(self._next("m"))
+
+    def sleep(self, seconds: float):
+        pass
+
+class ReplayTransport:
+    """Answers controller requests from one recorded cycle, matching on the command."""
+
+    def __init__(self):
+        self._pending: List[list] = []
+
+    def load(self, exchanges: List[list]):
+        self._pending = list(exchanges)
+
+    @property
+    def remaining(self) -> int:
+        return len(self._pending)
+
+    def post(self, data: str, hint: Optional[str]) -> Reply:
+        key = _commandName(data) if _commandName(data) in _REDACTED else data
+        for i, (command, status, text) in enumerate(self._pending):
+            if command == key:
+                del self._pending[i]
+                if status is None:
+                    raise requests.exceptions.ConnectionError(f"Recorded {text}")
+                return Reply(status, text)
+
+        raise ReplayError(f"No recorded reply for {key}")
+
+@dataclasses.dataclass
+class ReplayResult:
+    cycles: int = 0
+    seconds: float = 0.0  # Wall time the replay took
+    recordedSeconds: float = 0.0  # Time span of the recording
+    mismatches: List[str] = dataclasses.field(default_factory=list)
+
+    @property
+    def speedup(self) -> float:
+        return self.recordedSeconds / self.seconds if self.seconds > 0 else 0.0
+
+class Replayer:
+    """
+    Replays a recording through a fresh `Boiler` with a `ReplayClock` and `ReplayTransport`, as fast as it can run.
+    Every cycle's BoilerData and events are compared with the recorded ones.
+    """
+    logger = logging.getLogger()
+
+    def __init__(self, path: str, databasePath: str = ":memory:"):
+        self.path = path
+        self.databasePath = databasePath
+
+    def _boiler(self, header: dict, db: Dbase) -> Boiler:
+        from Utils.Boiler import Boiler
+
+        # Broker settings are required by Config but never used here
+        settings = {"MQTT_BROKER": "replay", "MQTT_USER": "replay", "MQTT_PASSWORD": "replay", **header["config"]}
+        config = Config(**settings)
+
+        with db.db.atomic():
+            for eventType, ts, value in header["events"]:
+                Event.create(eventType=eventType, ts=datetime.fromisoformat(ts), value=value, controller=header["name"])
+        db.invalidate()
+
+        return Boiler(db=db, config=config, name=header["name"], clock=ReplayClock(), seed=header["seed"])
+
+    @staticmethod
+    def _addEvent(boiler: Boiler, eventType: str, ts: str, value: bool):
+        event = EventType(eventType)
+        if event == EventType.WoodFilled:
+            boiler.addWoodFill(arrow.get(ts))
+        else:
+            Dbase._addEvent(event=event, value=json.dumps(value), ts=arrow.get(ts), controller=boiler.name)
+
+    def run(self, maxMismatches: int = 20) -> ReplayResult:
+        result = ReplayResult()
+        db = Dbase(self.databasePath)
+        db.connect()
+        db.create_tables()
+
+        with open(self.path) as f:
+            header = json.loads(f.readline())
+            boiler = self._boiler(header, db)
+            clock: ReplayClock = boiler.clock
+            transport = ReplayTransport()
+            boiler._client.transport = transport
+
+            events: List[list] = []
+            listener = boiler._db.addListener(lambda e: events.append([e.eventType.value, e.ts.isoformat(), e.value]))
+
+            first: Optional[str] = None
+            last: Optional[str] = None
+            start = time.perf_counter()
+            for line in f:
+                cycle = json.loads(line)
+                if "event" in cycle:
+                    # Clock reads between cycles are not recorded, so they do not count as misses
+                    misses = clock.misses
+                    self._addEvent(boiler, *cycle["event"])
+                    clock.misses = misses
+                    continue
+
+                clock.load(cycle["clock"])
+                transport.load(cycle["exchanges"])
+                events.clear()
+
+                try:
+                    boiler.getData(force=True)
+                except requests.exceptions.ConnectionError:
+                    pass
+                except ReplayError as e:
+                    result.mismatches.append(f"cycle {result.cycles}: {e}")
+
+                data = snapshot(boiler.boilerData)
+                if data != cycle["data"]:
+                    fields = sorted(k for k in set(data or {}) | set(cycle["data"] or {}) if (data or {}).get(k) != (cycle["data"] or {}).get(k))
+                    result.mismatches.append(f"cycle {result.cycles}: BoilerData differs in {', '.join(fields)}")
+                if events != cycle["events"]:
+                    result.mismatches.append(f"cycle {result.cycles}: events {events} != recorded {cycle['events']}")
+                if transport.remaining or clock.remaining:
+                    result.mismatches.append(f"cycle {result.cycles}: {transport.remaining} exchanges and {clock.remaining} clock reads left over")
+
+                if cycle["data"] is not None and cycle["data"]["ts"] is not None:
+                    first = first or cycle["data"]["ts"]
+                    last = cycle["data"]["ts"]
+                result.cycles += 1
+                if len(result.mismatches) >= maxMismatches:
+                    self.logger.error("Too many mismatches, stopping")
+                    break
+
+            result.seconds = time.perf_counter() - start
+            boiler._db.removeListener(listener)
+            boiler.close()
+
+        if clock.misses:
+            result.mismatches.append(f"{clock.misses} clock reads were not in the recording")
+        if first is not None:
+            result.recordedSeconds = (arrow.get(last) - arrow.get(first)).total_seconds()
+
+        db.close()
+        return result
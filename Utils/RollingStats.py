@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+__all__ = [
+    "RollingStats",
+]
+
+from collections import deque
+from typing import Deque, Tuple
+
+import numpy as np
+
+class RollingStats:
+    """
+    Fixed length rolling window over a signal with O(1) updates.
+    Keeps running sums for mean, variance and least-squares slope (x = 0..n-1, oldest first)
+    and monotonic queues for min / max. The sums are recomputed once per window to stop float drift.
+    """
+
+    def __init__(self, length: int, fill: float = 0.0):
+        if length < 2:
+            raise ValueError("RollingStats length must be at least 2")
+
+        self.length = length
+        self._buf = np.empty(length, dtype=np.float64)
+        # Constant sums over x = 0..n-1
+        self._sx = length * (length - 1) / 2
+        self._sxx = (length - 1) * length * (2 * length - 1) / 6
+        self.fill(fill)
+
+    def fill(self, value: float):
+        """Reset the whole window to `value`."""
+        self._buf.fill(value)
+        self._pos = 0  # Index of the oldest sample
+        self._count = 0  # Samples pushed since the last fill, used to index the min / max queues
+        self._sinceSum = 0
+        self._resum()
+
+    def _ordered(self) -> np.ndarray:
+        return np.roll(self._buf, -self._pos)
+
+    def _resum(self):
+        values = self._ordered()
+        self._sy = float(values.sum())
+        self._syy = float(np.dot(values, values))
+        self._sxy = float(np.dot(np.arange(self.length), values))
+        self._sinceSum = 0
+
+        # Rebuild the min / max queues with window relative sequence numbers
+        self._min: Deque[Tuple[int, float]] = deque()
+        self._max: Deque[Tuple[int, float]] = deque()
+        base = self._count - self.length
+        for i, v in enumerate(values):
+            self._pushMinMax(base + i, float(v))
+
+    def _pushMinMax(self, seq: int, value: float):
+        while self._min and self._min[-1][1] >= value:
+            self._min.pop()
+        self._min.append((seq, value))
+        while self._max and self._max[-1][1] <= value:
+            self._max.pop()
+        self._max.append((seq, value))
+
+    def push(self, value: float):
+        old = float(self._buf[self._pos])
+        self._buf[self._pos] = value
+        self._pos = (self._pos + 1) % self.length
+        self._count += 1
+
+        # Every remaining sample shifts one x position towards the start
+        self._sxy = self._sxy - (self._sy - old) + (self.length - 1) * value
+        self._sy += value - old
+        self._syy += value * value - old * old
+
+        self._pushMinMax(self._count - 1, value)
+        oldest = self._count - self.length
+        while self._min[0][0] < oldest:
+            self._min.popleft()
+        while self._max[0][0] < oldest:
+            self._max.popleft()
+
+        self._sinceSum += 1
+        if self._sinceSum >= self.length:
+            self._resum()
+
+    @property
+    def values(self) -> np.ndarray:
+        """Window contents, oldest first."""
+        return self._ordered()
+
+    @property
+    def mean(self) -> float:
+        return self._sy / self.length
+
+    @property
+    def variance(self) -> float:
+        mean = self.mean
+        return max(0.0, self._syy / self.length - mean * mean)
+
+    @property
+    def slope(self) -> float:
+        n = self.length
+        return (n * self._sxy - self._sx * self._sy) / (n * self._sxx - self._sx * self._sx)
+
+    @property
+    def min(self) -> float:
+        return self._min[0][1]
+
+    @property
+    def max(self) -> float:
+        return self._max[0][1]
+
+    def __repr__(self):
+        return f"RollingStats(mean={self.mean:.4f}, slope={self.slope:.4f}, min={self.min:.4f}, max={self.max:.4f})"
@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+__all__ = [
+    "Scheduler",
+    "Task",
+    "TaskStats",
+]
+
+import dataclasses
+import heapq
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Tuple
+
+@dataclasses.dataclass
+class TaskStats:
+    runs: int = 0
+    wakes: int = 0
+    lateTotal: float = 0.0  # Seconds the task started after its deadline
+    lateMax: float = 0.0
+    runTotal: float = 0.0  # Seconds spent running the task
+    runMax: float = 0.0
+
+    @property
+    def lateAvg(self) -> float:
+        return self.lateTotal / self.runs if self.runs else 0.0
+
+    @property
+    def runAvg(self) -> float:
+        return self.runTotal / self.runs if self.runs else 0.0
+
+    def __str__(self):
+        return f"runs={self.runs} wakes={self.wakes} late avg={self.lateAvg:.3f}s max={self.lateMax:.3f}s run avg={self.runAvg:.3f}s max={self.runMax:.3f}s"
+
+@dataclasses.dataclass
+class Task:
+    name: str
+    interval: float
+    func: Callable[[], None]
+    deadline: float = 0.0
+    pooled: bool = False  # Runs on the worker pool instead of the scheduler thread
+    running: bool = False
+    stats: TaskStats = dataclasses.field(default_factory=TaskStats)
+
+class Scheduler:
+    """
+    Deadline queue of periodic tasks.
+    The run loop sleeps until the nearest deadline and can be woken early from any thread with `wake()`.
+    Pooled tasks run on a bounded pool of `workers` threads, so a slow one does not hold up the others.
+    A task never runs twice at the same time.
+    """
+    logger = logging.getLogger()
+
+    def __init__(self, workers: int = 0):
+        self._tasks: Dict[str, Task] = {}
+        self._queue: List[Tuple[float, int, str]] = []
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._running = False
+        self._pool: ThreadPoolExecutor or None = None
+        if workers > 0:
+            self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="SchedulerWorker")
+
+    def _push(self, task: Task):
+        # Stale queue entries are skipped when their deadline no longer matches the task
+        self._seq += 1
+        heapq.heappush(self._queue, (task.deadline, self._seq, task.name))
+
+    def addTask(self, name: str, interval: float, func: Callable[[], None], runNow: bool = False, pooled: bool = False):
+        with self._cond:
+            task = Task(name=name, interval=interval, func=func, pooled=pooled and self._pool is not None)
+            task.deadline = time.monotonic() if runNow else time.monotonic() + interval
+            self._tasks[name] = task
+            self._push(task)
+            self._cond.notify()
+
+    def setInterval(self, name: str, interval: float):
+        """Change the interval of a task. Takes effect when its next run is scheduled."""
+        with self._cond:
+            self._tasks[name].interval = interval
+
+    def wake(self, name: str):
+        """Run the task as soon as possible. Safe to call from other threads. Unknown tasks are ignored."""
+        with self._cond:
+            task = self._tasks.get(name)
+            if task is None:
+                self.logger.debug(f"Not waking unknown task {name}")
+                return
+            task.deadline = time.monotonic()
+            task.stats.wakes += 1
+            self._push(task)
+            self._cond.notify()
+
+    def _nextDue(self) -> Task or None:
+        with self._cond:
+            while self._running:
+                while self._queue:
+                    deadline, _, name = self._queue[0]
+                    task = self._tasks.get(name)
+                    if task is None or task.deadline != deadline:
+                        heapq.heappop(self._queue)
+                        continue
+                    break
+
+                if not self._queue:
+                    self._cond.wait()
+                    continue
+
+                delay = self._queue[0][0] - time.monotonic()
+                if delay > 0:
+                    self._cond.wait(timeout=delay)
+                    continue
+
+                heapq.heappop(self._queue)
+                if task.running:
+                    # Requeued when the current run finishes
+                    continue
+
+                task.running = True
+                return task
+
+        return None
+
+    def _runTask(self, task: Task):
+        start = time.monotonic()
+        deadline = task.deadline
+        late = max(0.0, start - deadline)
+
+        try:
+            task.func()
+        finally:
+            end = time.monotonic()
+            elapsed = end - start
+            stats = task.stats
+            stats.runs += 1
+            stats.lateTotal += late
+            stats.lateMax = max(stats.lateMax, late)
+            stats.runTotal += elapsed
+            stats.runMax = max(stats.runMax, elapsed)
+
+            with self._cond:
+                task.running = False
+                # A wake while running already moved the deadline
+                if task.deadline == deadline:
+                    # Keep the cadence unless the task overran its next deadline
+                    task.deadline = max(deadline + task.interval, end)
+                self._push(task)
+                self._cond.notify()
+
+        self.logger.debug(f"Task {task.name}: late {late:.3f}s run {elapsed:.3f}s")
+
+    def run(self):
+        self._running = True
+        while self._running:
+            task = self._nextDue()
+            if task is None:
+                break
+            if task.pooled:
+                self._pool.submit(self._runPooled, task)
+            else:
+                self._runTask(task)
+
+    def _runPooled(self, task: Task):
+        try:
+            self._runTask(task)
+        except Exception as e:
+            self.logger.exception(f"Task {task.name} failed: {e}")
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+
+    def stats(self) -> Dict[str, TaskStats]:
+        return {name: task.stats for name, task in self._tasks.items()}
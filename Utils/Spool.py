@@ -0,0 +1,211 @@
+from __future__ import annotations
+
+__all__ = [
+    "Spool",
+]
+
+import base64
+import json
+import logging
+import os
+import threading
+from typing import BinaryIO, Dict, List, Optional, Sequence, Set, Tuple
+
+import paho.mqtt.client as mqtt
+
+from Utils.Metrics import metrics
+
+Message = Tuple[str, str, bool, int]
+
+class Spool:
+    """
+    Bounded append-only file of MQTT publishes made while the broker is unreachable. Survives restarts.
+    Only the newest value of a topic is sent when draining, unless the topic matches one of the `history` filters.
+    The index holds one offset per topic, so memory stays flat however long the outage lasts.
+    When the file reaches `maxBytes` it is compacted down to the newest values, dropping the oldest history first.
+    """
+    logger = logging.getLogger()
+
+    def __init__(self, path: str, maxBytes: int, history: Sequence[str] = ()):
+        self.path = path
+        self.maxBytes = maxBytes
+        self.history = list(history)
+        self.dropped = 0
+        self._lock = threading.RLock()
+        self._latest: Dict[str, int] = {}  # Offset of the newest record of each coalesced topic
+        self._pos = 0  # Offset of the first record not yet delivered
+        self._size = 0
+        self._generation = 0  # Bumped by each compaction, which moves every record
+        self._live: Set[str] = set()  # History topics published live since they were spooled
+        self._superseded = False
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file: BinaryIO = open(path, "a+b")
+        self._load()
+        if not self.empty:
+            self.logger.info(f"MQTT spool {path} holds {self._size} bytes from before the restart")
+
+    def _keepsHistory(self, topic: str) -> bool:
+        return any(mqtt.topic_matches_sub(sub, topic) for sub in self.history)
+
+    def _load(self):
+        """Index the file, cutting off a record left half written by a crash."""
+        self._latest.clear()
+        self._file.seek(0)
+        offset = 0
+        for line in iter(self._file.readline, b""):
+            try:
+                topic, _, _, _, history = json.loads(line)
+            except ValueError:
+                self.logger.warning(f"Truncating MQTT spool {self.path} at a damaged record, offset {offset}")
+                self._file.truncate(offset)
+                break
+            if not history:
+                self._latest[topic] = offset
+            offset += len(line)
+
+        self._size = offset
+        self._pos = 0
+
+    @property
+    def empty(self) -> bool:
+        with self._lock:
+            return self._pos >= self._size
+
+    @staticmethod
+    def _encode(topic: str, payload, retain: bool, qos: int, history: bool) -> bytes:
+        if isinstance(payload, (bytes, bytearray)):
+            # Binary payloads such as MessagePack are kept as base64
+            payload = {"b64": base64.b64encode(payload).decode()}
+        return (json.dumps([topic, payload, retain, qos, history], separators=(',', ':')) + "\n").encode()
+
+    def put(self, topic: str, payload, retain: bool = False, qos: int = 0) -> bool:
+        """Append a publish. False when it was dropped because the spool is full even after compacting."""
+        history = self._keepsHistory(topic)
+        line = self._encode(topic, payload, retain, qos, history)
+        with self._lock:
+            if self._size + len(line) > self.maxBytes:
+                self._compact(self.maxBytes - len(line))
+                if self._size + len(line) > self.maxBytes:
+                    self.dropped += 1
+                    metrics.inc("boiler_mqtt_messages_total", result="dropped")
+                    self.logger.warning(f"MQTT spool full, dropping {topic}")
+                    return False
+
+            self._file.seek(0, os.SEEK_END)
+            self._file.write(line)
+            self._file.flush()
+            if not history:
+                self._latest[topic] = self._size
+            self._size += len(line)
+
+        metrics.inc("boiler_mqtt_messages_total", result="spooled")
+        return True
+
+    def supersede(self, topic: str):
+        """
+        `topic` was just published live. A coalesced value waiting here is stale now and is not sent,
+        spooled history of it is still sent but no longer retained, so it can not replace the live value.
+        """
+        with self._lock:
+            if self.empty:
+                return
+            if self._keepsHistory(topic):
+                self._live.add(topic)
+            elif self._latest.pop(topic, None) is not None:
+                self._superseded = True
+
+    def current(self, message: Message) -> Optional[Message]:
+        """`message` from `take()` as it is to be sent now, None when a live publish replaced it since."""
+        topic, payload, retain, qos = message
+        with self._lock:
+            if topic in self._live:
+                return topic, payload, False, qos
+            if topic not in self._latest and not self._keepsHistory(topic):
+                return None
+            return message
+
+    def _records(self, start: int) -> List[Tuple[int, bytes, list]]:
+        self._file.seek(start)
+        records = []
+        offset = start
+        for line in iter(self._file.readline, b""):
+            records.append((offset, line, json.loads(line)))
+            offset += len(line)
+        return records
+
+    def _compact(self, target: int):
+        """Rewrite the undelivered records without superseded values, then drop the oldest history until under `target` bytes."""
+        kept = [(offset, line, record) for offset, line, record in self._records(self._pos)
+                if record[4] or self._latest.get(record[0]) == offset]
+        size = sum(len(line) for _, line, _ in kept)
+        for i, (_, line, record) in enumerate(kept):
+            if size <= target:
+                break
+            if record[4]:
+                kept[i] = None
+                size -= len(line)
+                self.dropped += 1
+                metrics.inc("boiler_mqtt_messages_total", result="dropped")
+        kept = [k for k in kept if k is not None]
+
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as f:
+            for _, line, _ in kept:
+                f.write(line)
+        self._file.close()
+        os.replace(tmp, self.path)
+        self._file = open(self.path, "a+b")
+        self._load()
+        self._generation += 1
+        self._superseded = False
+        self.logger.info(f"Compacted MQTT spool to {self._size} bytes, {self.dropped} dropped so far")
+
+    def take(self, limit: int) -> Tuple[List[Message], Tuple[int, int]]:
+        """
+        Up to `limit` messages to send, oldest first, skipping values a newer record replaced.
+        Pass the returned position to `ack()` once they are delivered.
+        """
+        with self._lock:
+            self._file.seek(self._pos)
+            messages: List[Message] = []
+            offset = self._pos
+            while len(messages) < limit and offset < self._size:
+                line = self._file.readline()
+                topic, payload, retain, qos, history = json.loads(line)
+                if history or self._latest.get(topic) == offset:
+                    if isinstance(payload, dict):
+                        payload = base64.b64decode(payload["b64"])
+                    messages.append((topic, payload, retain and topic not in self._live, qos))
+                offset += len(line)
+            return messages, (self._generation, offset)
+
+    def ack(self, position: Tuple[int, int]):
+        """Everything before `position` was delivered. Truncates the file once it is drained."""
+        generation, offset = position
+        with self._lock:
+            if generation != self._generation:
+                # Compacted since, the messages are still in the file and get sent again
+                return
+
+            self._pos = max(self._pos, offset)
+            for topic in [t for t, o in self._latest.items() if o < self._pos]:
+                del self._latest[topic]
+
+            if self._pos >= self._size:
+                self._file.truncate(0)
+                self._latest.clear()
+                self._pos = 0
+                self._size = 0
+                self._generation += 1
+                self._live.clear()
+                self._superseded = False
+
+    def close(self):
+        """Drop delivered records so a restart does not send them again."""
+        with self._lock:
+            if (self._pos > 0 or self._superseded) and not self.empty:
+                self._compact(self.maxBytes)
+            self._file.close()
@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+__all__ = [
+    "StateEncoder",
+]
+
+import math
+import operator
+import struct
+from enum import Enum
+from json.encoder import encode_basestring
+from typing import Callable, Dict, List, Tuple
+
+import arrow
+
+from Models.BoilerData import BoilerData, TrackedBool
+
+_DOUBLE = struct.Struct('>Bd')
+_UINT16 = struct.Struct('>BH')
+_UINT32 = struct.Struct('>BI')
+_INT64 = struct.Struct('>Bq')
+
+def _plain(value):
+    """BoilerData value as None, bool, int, float or str."""
+    if isinstance(value, TrackedBool):
+        return value.value
+    if isinstance(value, arrow.Arrow):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return value.value
+    return value
+
+def _json(value) -> str:
+    if value is None:
+        return "null"
+    if value is True:
+        return "true"
+    if value is False:
+        return "false"
+    if isinstance(value, float):
+        return repr(value) if math.isfinite(value) else "null"
+    if isinstance(value, int):
+        return str(value)
+    return encode_basestring(value)
+
+def _float(value):
+    return None if value is None else float(value)
+
+def _msgpackStr(value: str) -> bytes:
+    data = value.encode()
+    n = len(data)
+    if n < 32:
+        return bytes((0xa0 | n,)) + data
+    if n < 0x100:
+        return bytes((0xd9, n)) + data
+    if n < 0x10000:
+        return _UINT16.pack(0xda, n) + data
+    return _UINT32.pack(0xdb, n) + data
+
+def _msgpackMapHeader(count: int) -> bytes:
+    return bytes((0x80 | count,)) if count < 16 else _UINT16.pack(0xde, count)
+
+def _msgpack(value) -> bytes:
+    if value is None:
+        return b'\xc0'
+    if value is True:
+        return b'\xc3'
+    if value is False:
+        return b'\xc2'
+    if isinstance(value, float):
+        return _DOUBLE.pack(0xcb, value)
+    if isinstance(value, int):
+        return bytes((value,)) if 0 <= value < 0x80 else _INT64.pack(0xd3, value)
+    return _msgpackStr(value)
+
+class StateEncoder:
+    """
+    Encodes a whole `BoilerData` as one JSON object or MessagePack map for the aggregate state topic.
+    Field names, their encoded keys and the document framing are built once, so each encode only converts the values.
+    Keys are the BoilerData field names plus `controller` and `age`, which maps each variable in `fieldTs`
+    to the seconds since it was last read from the controller, so consumers can tell stale values apart.
+    """
+    formats = ("json", "msgpack")
+    skipped = {"fieldTs"}
+
+    def __init__(self, controller: str, format: str = "json"):
+        if format not in self.formats:
+            raise ValueError(f"Unknown state format {format}. Pick one of {', '.join(self.formats)}")
+
+        self.format = format
+        self.names: List[str] = [name for name in BoilerData.model_fields if name not in self.skipped]
+        # One C level call reads every field, plain floats skip the type checks
+        self._values = operator.attrgetter(*self.names)
+        floats = {name for name, field in BoilerData.model_fields.items() if field.annotation in (float, "float")}
+        self._plain: Tuple[Callable[[object], object], ...] = tuple(_float if name in floats else _plain for name in self.names)
+
+        if format == "json":
+            self._head = '{"controller":' + encode_basestring(controller)
+            self._keys = tuple(',' + encode_basestring(name) + ':' for name in self.names)
+        else:
+            self._headBytes = _msgpackMapHeader(len(self.names) + 2) + _msgpackStr("controller") + _msgpackStr(controller)
+            self._keyBytes = tuple(_msgpackStr(name) for name in self.names)
+        self._ageKeys: Dict[str, object] = {}  # Encoded `fieldTs` names, the same few every cycle
+
+    @property
+    def contentType(self) -> str:
+        return "application/json" if self.format == "json" else "application/msgpack"
+
+    def _ageKey(self, name: str):
+        key = self._ageKeys.get(name)
+        if key is None:
+            key = self._ageKeys[name] = encode_basestring(name) + ':' if self.format == "json" else _msgpackStr(name)
+        return key
+
+    def encode(self, bd: BoilerData, now: arrow.Arrow = None) -> bytes:
+        """`now` is what the ages are measured against, the current time by default."""
+        now = now or arrow.utcnow()
+        ages = [(self._ageKey(name), round((now - ts).total_seconds(), 3)) for name, ts in bd.fieldTs.items()]
+        if self.format == "json":
+            parts = [self._head]
+            for key, plain, value in zip(self._keys, self._plain, self._values(bd)):
+                parts.append(key)
+                parts.append(_json(plain(value)))
+            parts.append(',"age":{')
+            parts.append(','.join(key + _json(age) for key, age in ages))
+            parts.append('}}')
+            return ''.join(parts).encode()
+
+        buf = bytearray(self._headBytes)
+        for key, plain, value in zip(self._keyBytes, self._plain, self._values(bd)):
+            buf += key
+            buf += _msgpack(plain(value))
+        buf += _msgpackStr("age")
+        buf += _msgpackMapHeader(len(ages))
+        for key, age in ages:
+            buf += key
+            buf += _msgpack(age)
+        return bytes(buf)
@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+__all__ = [
+    "WoodForecaster",
+]
+
+import logging
+
+import arrow
+import numpy as np
+
+from Database.Database import ControllerDb
+from Database.Models.Event import Event, EventType, EventData
+
+class WoodForecaster:
+    """
+    Forecasts the next wood fill from the mean interval between the last `limit` fills.
+    Intervals outside the 1% / 99% quantiles are dropped before taking the mean.
+    State is rebuilt from the controller's events on `load()` and kept up to date from new events,
+    so the mean is only recalculated when a fill is recorded.
+    """
+    logger = logging.getLogger()
+
+    def __init__(self, db: ControllerDb, limit: int):
+        self._db = db
+        self.limit = limit
+        self._fills = np.empty(0, dtype=np.int64)  # Fill timestamps in microseconds, newest insert first
+        self.meanMins: float or None = None
+        self.lastFill: arrow.Arrow = arrow.get(0)
+
+    @property
+    def count(self) -> int:
+        return self._fills.size
+
+    def load(self):
+        self._db.flush()
+        rows = Event.select(Event.ts).where((Event.controller == self._db.controller) & (Event.eventType == EventType.WoodFilled.value)).order_by(Event.id.desc()).limit(self.limit)
+        self._fills = np.array([self._micros(arrow.get(r.ts)) for r in rows], dtype=np.int64)
+        self.lastFill = self._db.lastWoodFilled().ts
+        self._update()
+
+    def onEvent(self, event: EventData):
+        if event.eventType == EventType.WoodFilled:
+            self.recordFill(event.ts)
+
+    def recordFill(self, ts: arrow.Arrow):
+        self._fills = np.concatenate(([self._micros(ts)], self._fills[:self.limit - 1]))
+        if ts > self.lastFill:
+            self.lastFill = ts
+        self._update()
+
+    @staticmethod
+    def _micros(ts: arrow.Arrow) -> int:
+        delta = ts - arrow.get(0)
+        return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+    def _update(self):
+        if self._fills.size < 2:
+            self.meanMins = None
+            return
+
+        # Minutes between each fill and the next newer one, the newest reuses its neighbour
+        y = (self._fills[:-1] - self._fills[1:]) / 1e6 / 60
+        y = np.concatenate((y[:1], y))
+
+        # Drop the upper and lower 1% outliers
+        lo, hi = np.quantile(y, [0.01, 0.99])
+        kept = y[np.logical_and(y < hi, y > lo)]
+        if kept.size == 0:
+            kept = y
+
+        self.meanMins = float(np.mean(kept))
+        self.logger.debug(f"Calculated fill mean mins: {self.meanMins}")
+
+    def nextFill(self, offsetHours: int) -> arrow.Arrow or None:
+        if self.meanMins is None:
+            return None
+
+        return self.lastFill.shift(minutes=self.meanMins).shift(hours=offsetHours)
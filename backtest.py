@@ -0,0 +1,86 @@
+"""
+Backtests the wood low / empty thresholds against the telemetry history and the logged wood fills.
+Every combination of the swept values is scored on a process pool, the best ones are printed next to the current config.
+
+    python backtest.py --days 30 --sweep woodLowO2=6:14:0.5 --sweep woodEmptyO2=12:18:1 --sweep woodLowHeatingMins=30,60,90
+"""
+from __future__ import annotations
+import argparse
+import json
+import logging
+import os
+import time
+
+import arrow
+import numpy as np
+
+# Config needs the broker settings even though nothing is published here
+for _name in ('MQTT_BROKER', 'MQTT_USER', 'MQTT_PASSWORD'):
+    os.environ.setdefault(_name, 'backtest')
+
+from Database.Database import Dbase
+from Database.Models.Event import EventType
+from Database.Telemetry import TelemetryStore
+from Models.config import Config
+from Utils.Backtest import Backtest, parseAxis, product, sweep
+
+def main():
+    parser = argparse.ArgumentParser(description="Backtest the wood detection thresholds over the telemetry history")
+    parser.add_argument("--controller", default=Dbase.defaultController)
+    parser.add_argument("--telemetry", help="Telemetry directory of the controller. Defaults to TELEMETRY_PATH")
+    parser.add_argument("--db", default="./Store/db.sqlite")
+    parser.add_argument("--days", type=float, default=30, help="How far back to test")
+    parser.add_argument("--sweep", action="append", default=[], metavar="NAME=START:STOP:STEP", help="Values to try for one setting, or NAME=a,b,c")
+    parser.add_argument("--horizon-mins", type=float, default=180, help="An alert this long before a fill counts as a hit")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes. 0 runs in this process")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)-16s %(levelname)-8s %(message)s', level=os.environ.get("LOGLEVEL", "ERROR").upper())
+
+    config = Config(HM_URL=os.environ.get("HM_URL", "http://backtest"))
+    telemetryPath = args.telemetry
+    if telemetryPath is None:
+        telemetryPath = os.path.join(config.telemetryPath, args.controller) if config.hmControllers else config.telemetryPath
+
+    end = arrow.utcnow()
+    start = end.shift(days=-args.days)
+    store = TelemetryStore(telemetryPath)
+    series = store.read(start, end)
+
+    db = Dbase(args.db)
+    db.connect()
+    fills = [TelemetryStore._micros(e.ts) for e in db.events(EventType.WoodFilled, start, end, controller=args.controller)]
+    db.close()
+
+    axes = dict(parseAxis(spec) for spec in args.sweep)
+    combos = product(config, axes)
+    began = time.perf_counter()
+    scores = sweep(series, fills, combos, horizonMins=args.horizon_mins, workers=args.workers)
+    elapsed = time.perf_counter() - began
+    baseline = Backtest(series, fills, args.horizon_mins).evaluate(product(config, {}))
+
+    # Best F1 first, then fewer false alarms, then the earlier warning
+    order = np.lexsort((-scores["leadMins"], scores["falseAlarms"], -scores["f1"]))[:args.top]
+    names = list(axes) or ["woodLowO2"]
+
+    def _row(columns, scored, i: int) -> dict:
+        return {**{name: float(columns[name][i]) for name in names}, **{k: float(v[i]) for k, v in scored.items()}}
+
+    rows = [_row(combos, scores, i) for i in order]
+    current = _row(product(config, {}), baseline, 0)
+    if args.json:
+        print(json.dumps({"samples": int(series["ts"].size), "fills": len(fills), "combinations": int(combos["woodLowO2"].size),
+                          "seconds": elapsed, "current": current, "best": rows}, indent=4))
+        return
+
+    print(f"{series['ts'].size} samples, {len(fills)} wood fills, {combos['woodLowO2'].size} combinations in {elapsed:.1f}s")
+    header = "".join(f"{n:>20}" for n in names) + f"{'f1':>7}{'prec':>7}{'recall':>7}{'false':>7}{'lead m':>8}{'alert %':>8}"
+    print(header)
+    for label, row in [("current", current)] + [("", r) for r in rows]:
+        print("".join(f"{row[n]:>20g}" for n in names) +
+              f"{row['f1']:>7.2f}{row['precision']:>7.2f}{row['recall']:>7.2f}{row['falseAlarms']:>7.0f}{row['leadMins']:>8.0f}{row['alertPct']:>8.1f}  {label}")
+
+if __name__ == '__main__':
+    main()
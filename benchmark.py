@@ -0,0 +1,205 @@
+"""
+Poll cycle benchmark against the local controller emulator.
+Runs full `getData()` cycles and reports latency, CPU time and controller requests per cycle.
+
+    python benchmark.py --cycles 50 --latency 0.02 --jitter 0.01 --wander 0.3
+
+With --commands the sync run also floods wood_filled commands, each delivered twice as retained, through the
+command queue while the cycles run, and checks every fill was recorded once and in order.
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, List
+
+import arrow
+import requests
+
+# Config needs the broker settings even though nothing is published here
+for _name in ('MQTT_BROKER', 'MQTT_USER', 'MQTT_PASSWORD'):
+    os.environ.setdefault(_name, 'benchmark')
+
+from Database.Database import Dbase
+from Database.Models.Event import EventType
+from Models.config import Config
+from Utils.AsyncBoiler import AsyncBoiler
+from Utils.Boiler import Boiler
+from Utils.Commands import Command, CommandQueue
+from Utils.Emulator import Emulator
+
+logger = logging.getLogger()
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def summarise(name: str, latencies: List[float], cpus: List[float], requestCounts: List[Dict[str, int]], errors: int) -> Dict[str, object]:
+    commands: Dict[str, float] = {}
+    for counts in requestCounts:
+        for command, count in counts.items():
+            commands[command] = commands.get(command, 0) + count
+
+    cycles = len(latencies)
+    return {
+        "name": name,
+        "cycles": cycles,
+        "errors": errors,
+        "latency_ms": {
+            "mean": statistics.fmean(latencies) * 1000 if cycles else 0.0,
+            "p50": percentile(latencies, 50) * 1000 if cycles else 0.0,
+            "p95": percentile(latencies, 95) * 1000 if cycles else 0.0,
+            "max": max(latencies) * 1000 if cycles else 0.0,
+        },
+        "cpu_ms": {
+            "mean": statistics.fmean(cpus) * 1000 if cycles else 0.0,
+            "max": max(cpus) * 1000 if cycles else 0.0,
+        },
+        "requests_per_cycle": {command: count / cycles for command, count in sorted(commands.items())} if cycles else {},
+    }
+
+def runCycles(emulator: Emulator, cycles: int, wander: float, cycle: Callable[[], None], warmup: int = 1) -> Dict[str, object]:
+    # The first cycles log in and seed the database, keep them out of the numbers
+    for _ in range(warmup):
+        cycle()
+
+    # The client runs on this thread, so thread CPU time leaves out the emulator
+    latencies, cpus, requestCounts = [], [], []
+    errors = 0
+    shuffle = random.Random(0)
+    for _ in range(cycles):
+        if shuffle.random() < wander:
+            emulator.screen = shuffle.randrange(len(emulator.menu))
+
+        emulator.resetStats()
+        start = time.perf_counter()
+        cpuStart = time.thread_time()
+        try:
+            cycle()
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"Cycle failed: {e}")
+            errors += 1
+        cpus.append(time.thread_time() - cpuStart)
+        latencies.append(time.perf_counter() - start)
+        requestCounts.append({k: v for k, v in emulator.stats.items() if k != "total"})
+
+    return {"latencies": latencies, "cpus": cpus, "requestCounts": requestCounts, "errors": errors}
+
+def floodCommands(boiler: Boiler, count: int) -> Callable[[], Dict[str, object]]:
+    """Start pushing `count` wood fills at the command queue from another thread. Returns a check to call after the cycles."""
+    topic = f"homie/{boiler.name}/heatmaster/wood_filled/set"
+    applied: List[str] = []
+    commands = CommandQueue(maxSize=count * 2 + 1)
+
+    def _apply(command: Command):
+        if boiler.addWoodFill(arrow.get(command.payload)):
+            applied.append(command.payload)
+
+    commands.register(topic, _apply)
+    commands.start()
+    base = arrow.utcnow().shift(days=-1).floor('second')
+    payloads = [base.shift(seconds=i).isoformat() for i in range(count)]
+
+    def _flood():
+        for payload in payloads:
+            # The broker hands retained commands out again on reconnect
+            commands.put(topic, payload, retained=True)
+            commands.put(topic, payload, retained=True)
+
+    flooder = threading.Thread(target=_flood, name="Flood", daemon=True)
+    flooder.start()
+
+    def _check() -> Dict[str, object]:
+        flooder.join()
+        commands.join()
+        commands.stop()
+        recorded = [e.ts.isoformat() for e in boiler._db.events(EventType.WoodFilled, base, base.shift(seconds=count))]
+        return {
+            "sent": count * 2,
+            "applied": commands.applied,
+            "skipped": commands.skipped,
+            "dropped": commands.dropped,
+            "in_order": applied == payloads,
+            "recorded_once": recorded == payloads,
+        }
+
+    return _check
+
+def benchSync(emulator: Emulator, db: Dbase, config: Config, cycles: int, wander: float, commands: int = 0) -> Dict[str, object]:
+    boiler = Boiler(db=db, config=config)
+    check = floodCommands(boiler, commands) if commands else None
+    result = runCycles(emulator, cycles, wander, lambda: boiler.getData(force=True))
+    boiler.close()
+    summary = summarise("sync", **result)
+    if check is not None:
+        summary["commands"] = check()
+    return summary
+
+def benchAsync(emulator: Emulator, db: Dbase, config: Config, cycles: int, wander: float) -> Dict[str, object]:
+    loop = asyncio.new_event_loop()
+    boiler = AsyncBoiler(db=db, config=config)
+    try:
+        result = runCycles(emulator, cycles, wander, lambda: loop.run_until_complete(boiler.getData(force=True)))
+        loop.run_until_complete(boiler.close())
+    finally:
+        loop.close()
+    return summarise("async", **result)
+
+def printResult(result: Dict[str, object]):
+    latency = result["latency_ms"]
+    cpu = result["cpu_ms"]
+    print(f"{result['name']:>6}: {result['cycles']} cycles, {result['errors']} errors")
+    print(f"        latency ms  mean {latency['mean']:8.2f}  p50 {latency['p50']:8.2f}  p95 {latency['p95']:8.2f}  max {latency['max']:8.2f}")
+    print(f"        cpu ms      mean {cpu['mean']:8.2f}  max {cpu['max']:8.2f}")
+    print(f"        requests    " + "  ".join(f"{k} {v:.2f}" for k, v in result["requests_per_cycle"].items()))
+    if "commands" in result:
+        print(f"        commands    " + "  ".join(f"{k} {v}" for k, v in result["commands"].items()))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark boiler poll cycles against the controller emulator")
+    parser.add_argument("--cycles", type=int, default=20)
+    parser.add_argument("--engine", choices=["sync", "async", "both"], default="both")
+    parser.add_argument("--latency", type=float, default=0.005, help="Emulated controller response time in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Random +/- seconds added to the response time")
+    parser.add_argument("--wander", type=float, default=0.0, help="Chance per cycle that the controller is left on a random menu screen")
+    parser.add_argument("--fault-rate", type=float, default=0.0, help="Chance of a request failing with HTTP 500")
+    parser.add_argument("--click-delay", type=float, default=0.0, help="Seconds to wait after each menu click")
+    parser.add_argument("--unbatched", action="store_true", help="Baseline without the read optimizations: one GETVARS request per variable and every variable read each cycle")
+    parser.add_argument("--commands", type=int, default=0, help="Wood fill commands to flood in while the sync cycles run")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)-16s %(levelname)-8s %(message)s', level=os.environ.get("LOGLEVEL", "ERROR").upper())
+
+    with Emulator(latency=args.latency, jitter=args.jitter, seed=0) as emulator, tempfile.TemporaryDirectory() as store:
+        if args.fault_rate > 0:
+            emulator.inject("status", command="GETVARS", count=-1, probability=args.fault_rate)
+
+        settings = dict(HM_BATCH_READS=False, HM_SLOW_VARS_EVERY=1) if args.unbatched else {}
+        config = Config(HM_URL=emulator.url, HM_CLICK_DELAY_SECS=args.click_delay, **settings)
+        db = Dbase(os.path.join(store, "db.sqlite"), tuned=True)
+        db.connect()
+        db.create_tables()
+
+        results = []
+        if args.engine in ("sync", "both"):
+            results.append(benchSync(emulator, db, config, args.cycles, args.wander, args.commands))
+        if args.engine in ("async", "both"):
+            results.append(benchAsync(emulator, db, config, args.cycles, args.wander))
+        db.close()
+
+    if args.json:
+        print(json.dumps(results, indent=4))
+    else:
+        for result in results:
+            printResult(result)
+
+if __name__ == '__main__':
+    main()
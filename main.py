@@ -1,9 +1,12 @@
 from __future__ import annotations
 import logging
 import atexit
+import functools
 import os
 import signal
 import sys
+import time
+from typing import Dict, List
 import requests
 import arrow
 from paho.mqtt.client import MQTTMessage
@@ -13,9 +16,17 @@ from Models.config import Config
 from homie_spec import Node as HomieNode, Property as HomieProperty, Message as HomieMessage
 from homie_spec.properties import Datatype as HomieDataType
 from Utils.HomieDevice import Device as HomieDevice, DeviceState as HomieDeviceState
+from Utils.Metrics import metrics
 from Utils.MQTT import MQTT
 from Utils.Boiler import Boiler
+from Utils.Commands import Command, CommandQueue
+from Utils.PollPolicy import PollPolicy
+from Utils.PublishCache import PublishCache
+from Utils.Replay import Recorder
+from Utils.Scheduler import Scheduler
+from Utils.StateEncoder import StateEncoder
 from Database.Database import Dbase
+from Database.Telemetry import TelemetryStore
 
 loglevel = os.environ.get("LOGLEVEL", "INFO").upper()
 version: str = "1.0.7"
@@ -35,16 +46,28 @@ db: Dbase = None
 createDbTables: bool = False
 # noinspection PyTypeChecker
 mqtt: MQTT = None
-# noinspection PyTypeChecker
-node: HomieNode = None
-boilerDev: HomieDevice = HomieDevice(id="boiler", name="Boiler", fw=version, nodes={'heatmaster': node})
 config = Config()
-# noinspection PyTypeChecker
-boiler: Boiler = None
-currentBoilerData = BoilerData()
-lastPublishHomie: arrow.Arrow = arrow.utcnow()
-
-topicWoodFilled = f"{boilerDev.prefix}/{boilerDev.id}/heatmaster/wood_filled/set"
+sites: Dict[str, Site] = {}
+recorders: List[Recorder] = []
+scheduler = Scheduler(workers=config.hmPollWorkers)
+commands = CommandQueue()
+publishCache = PublishCache(refreshSeconds=config.homieFullRefreshSecs)
+
+class Site:
+    """One polled controller with its own boiler state, Homie device and telemetry"""
+
+    def __init__(self, name: str, boiler: Boiler, telemetry: TelemetryStore = None):
+        self.name = name
+        self.boiler = boiler
+        self.telemetry = telemetry
+        self.policy = PollPolicy(boiler.config)
+        self.data = BoilerData()
+        self.node: HomieNode or None = None
+        self.device = HomieDevice(id=name, name="Boiler" if name == "boiler" else f"Boiler {name}", fw=version, nodes={'heatmaster': None})
+        self.topicWoodFilled = f"{self.device.prefix}/{self.device.id}/heatmaster/wood_filled/set"
+        self.stateTopic = config.mqttStateTopic.replace('{id}', name)
+        self.stateEncoder = StateEncoder(name, config.mqttStateFormat) if self.stateTopic else None
+        self.woodFilled = ""  # Payload of the last applied wood_filled command, published back as its acknowledgement
 
 def register_exit_func(fun, signals=_exit_signals):
     """Register a function which will be executed on clean interpreter
@@ -118,76 +141,155 @@ def register_exit_func(fun, signals=_exit_signals):
 
 @register_exit_func
 def shutdown():
-    global currentBoilerData
+    if mqtt is None:
+        # Imported or stopped before anything was started
+        return
     logger.warning("Shutdown")
-    currentBoilerData = boiler.getPublisherShutdownData()
-    makeHomieNode()
-    publishBoilerData()
-    publishBoilerStatus(HomieDeviceState.DISCONNECTED.payload)
+    scheduler.stop()
+    commands.stop()
+    publishCache.clear()
+    batches = []
+    for site in sites.values():
+        site.data = site.boiler.getPublisherShutdownData()
+        publishBoilerData(site)
+        batches.append(publishBoilerStatus(site, HomieDeviceState.DISCONNECTED.payload))
+    for batch in batches:
+        batch.wait(mqtt.publishTimeout)
     mqtt.stop()
+    for site in sites.values():
+        site.boiler.close()
+        if site.telemetry is not None:
+            site.telemetry.close()
+    db.close()
+    for recorder in recorders:
+        recorder.close()
+
+def publishBoilerDevice(site: Site):
+    batch = mqtt.publishMany((x.topic, x.payload, x.retained, x.qos) for x in site.device.messages())
+    batch.wait(mqtt.publishTimeout)
+    logger.info(f"Created MQTT Boiler Device {site.name}. {batch.stats}")
+
+def publishBoilerData(site: Site):
+    messages = []
+    if site.stateEncoder is not None:
+        messages.append((site.stateTopic, site.stateEncoder.encode(site.data), True, 0))
+    if not (site.stateEncoder is not None and config.mqttStateOnly):
+        for topic, payload, retained, qos in site.device.getter_messages('heatmaster'):
+            if not publishCache.changed(topic, payload):
+                continue
+            messages.append((topic, payload, retained, qos))
+    batch = mqtt.publishMany(messages)
+    logger.info(f"Published Boiler {site.name} MQTT Data. {publishCache.stats}")
+    return batch
+
+def pollBoiler(site: Site):
+    logger.info(f"Time to update boiler {site.name}")
+    start = time.perf_counter()
+
+    try:
+        data = site.boiler.getData(force=True)
+        if data is None:
+            # The controller refused the login, nothing was read
+            logger.warning(f"Boiler {site.name} login failed")
+            data = site.boiler.getOfflineData()
+        elif site.telemetry is not None:
+            site.telemetry.append(data)
+        site.data = data
+    except requests.exceptions.ConnectionError as ce:
+        print(ce)
+        logger.warning(f"Boiler {site.name} is offline")
+        site.data = site.boiler.getOfflineData()
+
+    publishBoilerData(site)
+    logger.info(f"Boiler {site.name} cycle took {time.perf_counter() - start:.3f}s")
+
+    interval, reason = site.policy.nextInterval(site.data)
+    scheduler.setInterval(f"boiler/{site.name}", interval)
+    logger.info(f"Boiler {site.name} next poll in {interval:.0f}s: {reason}")
 
-def publishBoilerDevice():
-    for x in boilerDev.messages():  # type: HomieMessage
-        mqtt.publishHomie(topic=x.topic, payload=x.payload, retain=x.retained, qos=x.qos)
-    logger.info("Created MQTT Boiler Device")
+def publishHeartbeat():
+    for site in sites.values():
+        if site.data.status == BoilerStatus.OFFLINE:
+            publishBoilerStatus(site, HomieDeviceState.LOST.payload)
+        else:
+            publishBoilerStatus(site, HomieDeviceState.READY.payload)
 
-def publishBoilerData():
-    for prop in boilerDev.nodes['heatmaster'].properties.keys():
-        msg = boilerDev.getter_message(f"heatmaster/{prop}").attrs
-        # print(f"Message:: qos: {msg['qos']}   topic: {msg['topic']}  payload: {msg['payload']}")
-        mqtt.publishHomie(topic=msg['topic'], payload=msg['payload'], retain=msg['retained'], qos=msg['qos'])
-    logger.info("Published Boiler MQTT Data")
+        if config.homieStats:
+            publishBoilerStats(site)
 
-def publishBoilerStatus(status: str):
-    bds = boilerDev.getter_state(status)
-    mqtt.publishHomie(topic=bds.topic, payload=bds.payload, retain=bds.retained, qos=bds.qos)
+    for name, stats in scheduler.stats().items():
+        logger.debug(f"Task {name}: {stats}")
 
-def makeHomieNode():
-    global node, boilerDev
+def publishBoilerStats(site: Site):
+    prefix = f"{site.device.prefix}/{site.device.id}/$stats"
+    stats = {"interval": str(config.homiePublishStatusSeconds), **metrics.summary(controller=site.name)}
+    return mqtt.publishMany((f"{prefix}/{key}", value, False, 0) for key, value in stats.items())
 
+def publishBoilerStatus(site: Site, status: str):
+    bds = site.device.getter_state(status)
+    return mqtt.publishHomie(topic=bds.topic, payload=bds.payload, retain=bds.retained, qos=bds.qos)
+
+def makeHomieNode(site: Site):
+    # Getters read the site so each publish sees the latest data
     node = HomieNode(
         name="Boiler",
         typeOf="boiler",
         properties={
-            "time": HomieProperty(name="Time", datatype=HomieDataType.STRING, get=lambda: currentBoilerData.ts.isoformat()),
-            "cold_start": HomieProperty(name="Cold Start", datatype=HomieDataType.BOOLEAN, get=lambda: "ON" if currentBoilerData.coldStart.value else "OFF"),
-            "high_limit": HomieProperty(name="High Limit", datatype=HomieDataType.BOOLEAN, get=lambda: "ON" if currentBoilerData.highLimit else "OFF"),
-            "low_water": HomieProperty(name="Low Water", datatype=HomieDataType.BOOLEAN, get=lambda: "ON" if currentBoilerData.lowWater else "OFF"),
-            "bypass": HomieProperty(name="Bypass", datatype=HomieDataType.BOOLEAN, get=lambda: "ON" if currentBoilerData.bypass.value else "OFF"),
-            "fan": HomieProperty(name="Fan", datatype=HomieDataType.BOOLEAN, get=lambda: "ON" if currentBoilerData.fan else "OFF"),
-            "shutdown": HomieProperty(name="Shutdown", datatype=HomieDataType.BOOLEAN, get=lambda: "ON" if currentBoilerData.shutdown.value else "OFF"),
-            "alarm_light": HomieProperty(name="Alarm Light", datatype=HomieDataType.BOOLEAN, get=lambda: "ON" if currentBoilerData.alarmLt else "OFF"),
-            "water_temp": HomieProperty(name="Water Temp", datatype=HomieDataType.FLOAT, unit="°F", get=lambda: f"{currentBoilerData.waterTemp:.2f}"),
-            "o2": HomieProperty(name="Oxygen", datatype=HomieDataType.FLOAT, unit="%", get=lambda: f"{currentBoilerData.o2:.2f}"),
-            "bot_air": HomieProperty(name="Bottom Air", datatype=HomieDataType.FLOAT, get=lambda: f"{currentBoilerData.botAir:.2f}"),
-            "bot_air_pct": HomieProperty(name="Bottom Air Pct", datatype=HomieDataType.FLOAT, unit="%", get=lambda: f"{currentBoilerData.botAirPct:.2f}"),
-            "top_air": HomieProperty(name="Top Air", datatype=HomieDataType.FLOAT, get=lambda: f"{currentBoilerData.topAir:.2f}"),
-            "top_air_pct": HomieProperty(name="Top Air Pct", datatype=HomieDataType.FLOAT, unit="%", get=lambda: f"{currentBoilerData.topAirPct:.2f}"),
-            "wood_empty": HomieProperty(name="Wood Empty", datatype=HomieDataType.BOOLEAN, get=lambda: "ON" if currentBoilerData.woodEmpty else "OFF"),
-            "wood_low": HomieProperty(name="Wood Low", datatype=HomieDataType.BOOLEAN, get=lambda: "ON" if currentBoilerData.woodLow else "OFF"),
-            "condensing": HomieProperty(name="Condensing", datatype=HomieDataType.BOOLEAN, get=lambda: "ON" if currentBoilerData.condensing else "OFF"),
-            "status": HomieProperty(name="Status", datatype=HomieDataType.STRING, get=lambda: currentBoilerData.status.value.title()),
-            "last_bp_open": HomieProperty(name="Last Bypass Opened", datatype=HomieDataType.STRING, get=lambda: currentBoilerData.lastBypassOpened.isoformat()),
-            "last_bp_open_human": HomieProperty(name="Last Bypass Opened Human", datatype=HomieDataType.STRING, get=lambda: currentBoilerData.lastBypassOpenedHuman.title()),
-            "last_wood_fill": HomieProperty(name="Last Wood Fill", datatype=HomieDataType.STRING, get=lambda: currentBoilerData.lastWoodFilled.isoformat()),
-            "last_wood_fill_human": HomieProperty(name="Last Wood Fill Human", datatype=HomieDataType.STRING, get=lambda: currentBoilerData.lastWoodFilledHuman.title()),
-
-            "wood_filled": HomieProperty(name="Wood Filled", datatype=HomieDataType.STRING, get=lambda: "", set=lambda x: print(f"SET HERE = {x}"), settable=True)
+            "time": HomieProperty(name="Time", datatype=HomieDataType.STRING, get=lambda: site.data.ts.isoformat()),
+            "cold_start": HomieProperty(name="Cold Start", datatype=HomieDataType.BOOLEAN, get=lambda: "ON" if site.data.coldStart.value else "OFF"),
+            "high_limit": HomieProperty(name="High Limit", datatype=HomieDataType.BOOLEAN, get=lambda: "ON" if site.data.highLimit else "OFF"),
+            "low_water": HomieProperty(name="Low Water", datatype=HomieDataType.BOOLEAN, get=lambda: "ON" if site.data.lowWater else "OFF"),
+            "bypass": HomieProperty(name="Bypass", datatype=HomieDataType.BOOLEAN, get=lambda: "ON" if site.data.bypass.value else "OFF"),
+            "fan": HomieProperty(name="Fan", datatype=HomieDataType.BOOLEAN, get=lambda: "ON" if site.data.fan else "OFF"),
+            "shutdown": HomieProperty(name="Shutdown", datatype=HomieDataType.BOOLEAN, get=lambda: "ON" if site.data.shutdown.value else "OFF"),
+            "alarm_light": HomieProperty(name="Alarm Light", datatype=HomieDataType.BOOLEAN, get=lambda: "ON" if site.data.alarmLt else "OFF"),
+            "water_temp": HomieProperty(name="Water Temp", datatype=HomieDataType.FLOAT, unit="°F", get=lambda: f"{site.data.waterTemp:.2f}"),
+            "o2": HomieProperty(name="Oxygen", datatype=HomieDataType.FLOAT, unit="%", get=lambda: f"{site.data.o2:.2f}"),
+            "bot_air": HomieProperty(name="Bottom Air", datatype=HomieDataType.FLOAT, get=lambda: f"{site.data.botAir:.2f}"),
+            "bot_air_pct": HomieProperty(name="Bottom Air Pct", datatype=HomieDataType.FLOAT, unit="%", get=lambda: f"{site.data.botAirPct:.2f}"),
+            "top_air": HomieProperty(name="Top Air", datatype=HomieDataType.FLOAT, get=lambda: f"{site.data.topAir:.2f}"),
+            "top_air_pct": HomieProperty(name="Top Air Pct", datatype=HomieDataType.FLOAT, unit="%", get=lambda: f"{site.data.topAirPct:.2f}"),
+            "wood_empty": HomieProperty(name="Wood Empty", datatype=HomieDataType.BOOLEAN, get=lambda: "ON" if site.data.woodEmpty else "OFF"),
+            "wood_low": HomieProperty(name="Wood Low", datatype=HomieDataType.BOOLEAN, get=lambda: "ON" if site.data.woodLow else "OFF"),
+            "condensing": HomieProperty(name="Condensing", datatype=HomieDataType.BOOLEAN, get=lambda: "ON" if site.data.condensing else "OFF"),
+            "status": HomieProperty(name="Status", datatype=HomieDataType.STRING, get=lambda: site.data.status.value.title()),
+            "last_bp_open": HomieProperty(name="Last Bypass Opened", datatype=HomieDataType.STRING, get=lambda: site.data.lastBypassOpened.isoformat()),
+            "last_bp_open_human": HomieProperty(name="Last Bypass Opened Human", datatype=HomieDataType.STRING, get=lambda: site.data.lastBypassOpenedHuman.title()),
+            "last_wood_fill": HomieProperty(name="Last Wood Fill", datatype=HomieDataType.STRING, get=lambda: site.data.lastWoodFilled.isoformat()),
+            "last_wood_fill_human": HomieProperty(name="Last Wood Fill Human", datatype=HomieDataType.STRING, get=lambda: site.data.lastWoodFilledHuman.title()),
+
+            "wood_filled": HomieProperty(name="Wood Filled", datatype=HomieDataType.STRING, get=lambda: site.woodFilled, settable=True)
         }
     )
 
-    # noinspection PyUnresolvedReferences
-    boilerDev.nodes['heatmaster'] = node
+    site.node = node
+    site.device.register_node('heatmaster', node)
 
 # noinspection PyUnusedLocal
 def onMessage(client, userdata, message: MQTTMessage) -> None:
     logger.debug(f"userdata: {userdata}")
     logger.debug(f"message: Topic: {message.topic}  Payload: {message.payload}")
 
-    if message.topic == topicWoodFilled and message.payload != "":
-        logger.info(f"Wood Filled: {message.payload}")
-        db.eventWoodFilled(ts=arrow.get(message.payload.decode()))
-        boiler.woodFilled()
+    # Runs on paho's network thread, so only hand the command over
+    if commands.handles(message.topic) and message.payload:
+        commands.put(message.topic, message.payload.decode(errors='replace'), message.retain)
+
+def applyWoodFilled(site: Site, command: Command):
+    try:
+        ts = arrow.get(command.payload)
+    except (arrow.ParserError, ValueError) as e:
+        logger.warning(f"Wood Filled {site.name}: bad time {command.payload!r}: {e}")
+        return
+
+    if not site.boiler.addWoodFill(ts):
+        logger.info(f"Wood Filled {site.name}: {command.payload} already recorded")
+        return
+
+    logger.info(f"Wood Filled {site.name}: {command.payload}")
+    site.woodFilled = command.payload
+    site.data = site.boiler.boilerData or site.data
+    publishBoilerData(site)
+    scheduler.wake(f"boiler/{site.name}")
 
 if __name__ == '__main__':
     logging.basicConfig(format='%(asctime)-16s %(levelname)-8s %(message)s', level=loglevel)
@@ -196,55 +298,57 @@ if __name__ == '__main__':
 
     if not os.path.exists('./Store/db.sqlite'):
         createDbTables = True
-    db = Dbase('./Store/db.sqlite')
+    if config.metricsPort > 0 or config.homieStats:
+        metrics.enable()
+    if config.metricsPort > 0:
+        metrics.serve(config.metricsPort, config.metricsHost)
+
+    db = Dbase('./Store/db.sqlite', tuned=config.dbTuned)
     db.connect()
     if createDbTables:
         db.create_tables()
 
-    boiler = Boiler(db=db)
+    for name, controllerConfig in config.controllerConfigs().items():
+        telemetry = None
+        if config.telemetryEnabled:
+            # A single controller keeps the history at the top level
+            telemetry = TelemetryStore(os.path.join(config.telemetryPath, name) if config.hmControllers else config.telemetryPath)
+        sites[name] = Site(name, Boiler(db=db, config=controllerConfig, name=name), telemetry)
+        if config.recordPath:
+            os.makedirs(config.recordPath, exist_ok=True)
+            recorders.append(Recorder(os.path.join(config.recordPath, f"{name}-{arrow.now().format('YYYYMMDD-HHmmss')}.jsonl"), sites[name].boiler))
 
     mqtt = MQTT(clientId=os.environ.get('MQTT_CLIENT_ID', default='boiler'), onMessage=onMessage)
     mqttDebug = False
     if 'MQTT_DEBUG' in os.environ:
         mqttDebug = True
     mqtt.debug = mqttDebug
-    mqtt.subscribe(topic=topicWoodFilled, qos=1)
+    for site in sites.values():
+        mqtt.subscribe(topic=site.topicWoodFilled, qos=1)
+        commands.register(site.topicWoodFilled, functools.partial(applyWoodFilled, site))
+    # Registered before any command can wake them, they first run once scheduler.run() starts
+    for site in sites.values():
+        scheduler.addTask(f"boiler/{site.name}", site.boiler.config.updateBoilerSeconds, functools.partial(pollBoiler, site), pooled=True)
+    scheduler.addTask("heartbeat", config.homiePublishStatusSeconds, publishHeartbeat)
     mqtt.begin()
 
-    try:
-        currentBoilerData = boiler.getData()
-    except requests.exceptions.ConnectionError as ce:
-        print(ce)
-        logger.warning("Boiler is offline")
-        currentBoilerData = boiler.getOfflineData()
+    for site in sites.values():
+        try:
+            site.data = site.boiler.getData()
+        except requests.exceptions.ConnectionError as ce:
+            print(ce)
+            logger.warning(f"Boiler {site.name} is offline")
+            site.data = site.boiler.getOfflineData()
 
-    makeHomieNode()
-    publishBoilerDevice()
+        makeHomieNode(site)
+        publishBoilerDevice(site)
 
     if mqtt.disconnectCode == 7:
         raise OSError("MQTT Client ID exists! Another boiler program is running")
 
-    publishBoilerData()
+    for site in sites.values():
+        publishBoilerData(site)
 
-    while True:
-        """ Boiler Publish """
-        if boiler.timeToUpdate():
-            logger.info("Time to update boiler")
-
-            try:
-                currentBoilerData = boiler.getData()
-            except requests.exceptions.ConnectionError as ce:
-                print(ce)
-                logger.warning("Boiler is offline")
-                currentBoilerData = boiler.getOfflineData()
-
-            publishBoilerData()
-
-        """ Homie Status Publish """
-        if arrow.utcnow().shift(seconds=-config.homiePublishStatusSeconds) > lastPublishHomie:
-            if currentBoilerData.status == BoilerStatus.OFFLINE:
-                publishBoilerStatus(HomieDeviceState.LOST.payload)
-            else:
-                publishBoilerStatus(HomieDeviceState.READY.payload)
-
-            lastPublishHomie = arrow.utcnow()
+    # Commands received so far were only queued, the Homie nodes they publish through exist now
+    commands.start()
+    scheduler.run()
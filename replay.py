@@ -0,0 +1,36 @@
+"""
+Replays a poll session recorded with RECORD_PATH through a fresh `Boiler` on a virtual clock and checks
+that every cycle produces the recorded BoilerData and events.
+
+    python replay.py Store/recordings/boiler-20240101-120000.jsonl
+"""
+from __future__ import annotations
+import argparse
+import logging
+import os
+import sys
+
+# Config needs the broker settings even though nothing is published here
+for _name in ('MQTT_BROKER', 'MQTT_USER', 'MQTT_PASSWORD'):
+    os.environ.setdefault(_name, 'replay')
+
+from Utils.Replay import Replayer
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded boiler poll session")
+    parser.add_argument("recording")
+    parser.add_argument("--db", default=":memory:", help="Event database to replay into")
+    parser.add_argument("--max-mismatches", type=int, default=20, help="Stop after this many mismatches")
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)-16s %(levelname)-8s %(message)s', level=os.environ.get("LOGLEVEL", "ERROR").upper())
+
+    result = Replayer(args.recording, databasePath=args.db).run(maxMismatches=args.max_mismatches)
+    print(f"{result.cycles} cycles covering {result.recordedSeconds:.0f}s replayed in {result.seconds:.2f}s ({result.speedup:.0f}x)")
+    for mismatch in result.mismatches:
+        print(f"  {mismatch}")
+    print("Replay matches the recording" if not result.mismatches else f"{len(result.mismatches)} mismatches")
+    sys.exit(1 if result.mismatches else 0)
+
+if __name__ == '__main__':
+    main()
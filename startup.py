@@ -0,0 +1,142 @@
+"""
+Startup benchmark. Runs `python main.py` against the controller emulator and a local broker until the first boiler
+data reaches the broker, then reports import time, time to first publish and peak RSS.
+
+    python startup.py --max-import-secs 1.5 --max-rss-mb 150
+
+Exits with 1 when a limit is exceeded or nothing was published within --timeout seconds.
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from tests.broker import Broker, Received
+from Utils.Emulator import Emulator
+
+MAIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+
+def parseImportTimes(lines: List[str]) -> Tuple[float, List[Tuple[str, float]]]:
+    """
+    Total seconds spent importing and the slowest top level imports from `-X importtime` output.
+    Only top level imports are summed, their cumulative time already holds the nested ones.
+    """
+    total = 0.0
+    topLevel = []
+    for line in lines:
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|", 2)
+        if name[1:2] == " ":
+            continue
+        secs = int(cumulative) / 1e6
+        total += secs
+        topLevel.append((name.strip(), secs))
+    return total, sorted(topLevel, key=lambda x: x[1], reverse=True)
+
+def peakRss(pid: int) -> Optional[float]:
+    """High water mark of the process' resident set in MiB, None where /proc is not available."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+def isBoilerData(message: Received) -> bool:
+    # Property values, not the $ attributes of the device announcement
+    parts = message.topic.split("/")
+    return len(parts) == 4 and parts[2] == "heatmaster" and not parts[3].startswith("$")
+
+def measure(timeout: float = 30.0) -> Dict[str, object]:
+    with Emulator(seed=0) as emulator, Broker() as broker, tempfile.TemporaryDirectory() as store:
+        env = {
+            **os.environ,
+            "HM_URL": emulator.url,
+            "HM_CLICK_DELAY_SECS": "0",
+            "MQTT_BROKER": broker.host,
+            "MQTT_PORT": str(broker.port),
+            "MQTT_USER": "startup",
+            "MQTT_PASSWORD": "startup",
+            "LOGLEVEL": "WARNING",
+        }
+        for name in ("HM_CONTROLLERS", "RECORD_PATH", "METRICS_PORT", "MQTT_DEBUG"):
+            env.pop(name, None)
+        os.makedirs(os.path.join(store, "Store"))
+
+        lines: List[str] = []
+        start = time.monotonic()
+        process = subprocess.Popen([sys.executable, "-X", "importtime", MAIN], cwd=store, env=env,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        reader = threading.Thread(target=lambda: lines.extend(process.stderr), name="StartupStderr", daemon=True)
+        reader.start()
+        try:
+            first = broker.waitFor(lambda m: True, timeout)
+            data = broker.waitFor(isBoilerData, max(0.0, timeout - (time.monotonic() - start)))
+            rss = peakRss(process.pid)
+        finally:
+            process.terminate()
+            try:
+                process.wait(10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+            reader.join()
+
+        if rss is None:
+            # Linux reports ru_maxrss in KiB
+            rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+
+    importSecs, slowest = parseImportTimes(lines)
+    return {
+        "published": data is not None,
+        "import_secs": importSecs,
+        "first_message_secs": first.ts - start if first is not None else None,
+        "first_publish_secs": data.ts - start if data is not None else None,
+        "peak_rss_mib": rss,
+        "slowest_imports": slowest[:10],
+        "log": [line.rstrip() for line in lines if not line.startswith("import time:")],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure main.py startup against the controller emulator")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Seconds to wait for the first publish")
+    parser.add_argument("--max-import-secs", type=float, default=0.0, help="Fail above this import time. 0 only reports")
+    parser.add_argument("--max-rss-mb", type=float, default=0.0, help="Fail above this peak RSS in MiB. 0 only reports")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    args = parser.parse_args()
+
+    result = measure(args.timeout)
+    if args.json:
+        print(json.dumps(result, indent=4))
+    else:
+        print(f"imports        {result['import_secs']:8.3f}s")
+        if result["published"]:
+            print(f"first message  {result['first_message_secs']:8.3f}s")
+            print(f"first publish  {result['first_publish_secs']:8.3f}s")
+        print(f"peak RSS       {result['peak_rss_mib']:8.1f} MiB")
+        print("slowest imports " + "  ".join(f"{name} {secs:.3f}s" for name, secs in result["slowest_imports"]))
+
+    failures = []
+    if not result["published"]:
+        failures.append(f"nothing published within {args.timeout:.0f}s")
+        failures.extend(result["log"][-20:])
+    if 0 < args.max_import_secs < result["import_secs"]:
+        failures.append(f"imports took {result['import_secs']:.3f}s, limit {args.max_import_secs:.3f}s")
+    if 0 < args.max_rss_mb < result["peak_rss_mib"]:
+        failures.append(f"peak RSS {result['peak_rss_mib']:.1f} MiB, limit {args.max_rss_mb:.1f} MiB")
+    for failure in failures:
+        print(failure, file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
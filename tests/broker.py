@@ -0,0 +1,245 @@
+from __future__ import annotations
+
+__all__ = [
+    "Broker",
+    "Received",
+]
+
+import dataclasses
+import logging
+import socket
+import struct
+import threading
+import time
+from socketserver import StreamRequestHandler, ThreadingTCPServer
+from typing import Callable, List, Optional
+
+from paho.mqtt.client import topic_matches_sub
+
+@dataclasses.dataclass
+class Received:
+    """A PUBLISH the broker got from a client"""
+    topic: str
+    payload: bytes
+    retain: bool
+    qos: int
+    ts: float  # time.monotonic() when it arrived
+
+class Broker:
+    """
+    Local MQTT 3.1.1 broker for tests and benchmarks, enough for the paho client used here.
+    Accepts any login, acknowledges QoS 1 and 2 publishes, keeps retained messages and forwards
+    publishes to matching subscriptions at QoS 0. No sessions, wills or persistence.
+    Point MQTT_BROKER and MQTT_PORT at `host` and `port` once started. Runs until `stop()` or as a context manager.
+    """
+    logger = logging.getLogger()
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, ackDelay: float = 0.0):
+        """`ackDelay` seconds are waited before each PUBACK / PUBREC, which keeps publishes in flight longer."""
+        self.ackDelay = ackDelay
+        self.received: List[Received] = []
+        self.retained: dict = {}  # topic -> payload
+        self.connects = 0
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._clients: List[_Handler] = []
+        self._server = ThreadingTCPServer((host, port), _Handler, bind_and_activate=False)
+        self._server.allow_reuse_address = True
+        self._server.daemon_threads = True
+        self._server.broker = self
+        self._server.server_bind()
+        self._server.server_activate()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def host(self) -> str:
+        return self._server.server_address[0]
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def start(self) -> Broker:
+        self._thread = threading.Thread(target=self._server.serve_forever, name="Broker", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self.disconnectAll()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self) -> Broker:
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def disconnectAll(self):
+        """Drop every client connection, as a broker restart would."""
+        with self._lock:
+            clients = list(self._clients)
+        for client in clients:
+            client.drop()
+
+    def publish(self, topic: str, payload: bytes or str, retain: bool = False):
+        """Send a message to every matching subscription as if a client had published it."""
+        if isinstance(payload, str):
+            payload = payload.encode()
+        with self._lock:
+            if retain:
+                self.retained[topic] = payload
+            clients = list(self._clients)
+        for client in clients:
+            client.deliver(topic, payload, False)
+
+    def waitFor(self, match: Callable[[Received], bool], timeout: float = 10.0) -> Optional[Received]:
+        """The first received message `match` accepts, waiting up to `timeout` seconds for it to arrive."""
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while True:
+                for message in self.received:
+                    if match(message):
+                        return message
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._changed.wait(remaining)
+
+    def _received(self, message: Received):
+        with self._changed:
+            self.received.append(message)
+            if message.retain:
+                if message.payload:
+                    self.retained[message.topic] = message.payload
+                else:
+                    self.retained.pop(message.topic, None)
+            clients = list(self._clients)
+            self._changed.notify_all()
+        for client in clients:
+            client.deliver(message.topic, message.payload, False)
+
+class _Handler(StreamRequestHandler):
+    server: ThreadingTCPServer
+
+    def setup(self):
+        super().setup()
+        self.subscriptions: List[str] = []
+        self._writeLock = threading.Lock()
+
+    def _readPacket(self) -> Optional[tuple]:
+        header = self.rfile.read(1)
+        if not header:
+            return None
+        length, shift = 0, 0
+        while True:
+            byte = self.rfile.read(1)
+            if not byte:
+                return None
+            length |= (byte[0] & 0x7F) << shift
+            shift += 7
+            if not byte[0] & 0x80:
+                break
+        body = self.rfile.read(length)
+        if len(body) < length:
+            return None
+        return header[0] >> 4, header[0] & 0x0F, body
+
+    def _write(self, kind: int, flags: int, body: bytes = b""):
+        length = len(body)
+        encoded = bytearray()
+        while True:
+            byte = length & 0x7F
+            length >>= 7
+            encoded.append(byte | (0x80 if length else 0))
+            if not length:
+                break
+        try:
+            with self._writeLock:
+                self.wfile.write(bytes([kind << 4 | flags]) + bytes(encoded) + body)
+        except OSError:
+            pass
+
+    def drop(self):
+        try:
+            self.connection.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def deliver(self, topic: str, payload: bytes, retain: bool):
+        with self._writeLock:
+            subscriptions = list(self.subscriptions)
+        if any(topic_matches_sub(sub, topic) for sub in subscriptions):
+            encoded = topic.encode()
+            self._write(3, 1 if retain else 0, struct.pack("!H", len(encoded)) + encoded + payload)
+
+    def handle(self):
+        broker: Broker = self.server.broker
+        with broker._lock:
+            broker._clients.append(self)
+        try:
+            while True:
+                try:
+                    packet = self._readPacket()
+                except OSError:
+                    packet = None
+                if packet is None:
+                    return
+                kind, flags, body = packet
+                if kind == 1:  # CONNECT
+                    with broker._lock:
+                        broker.connects += 1
+                    self._write(2, 0, b"\x00\x00")
+                elif kind == 3:  # PUBLISH
+                    self._publish(broker, flags, body)
+                elif kind == 6:  # PUBREL
+                    self._write(7, 0, body[:2])
+                elif kind == 8:  # SUBSCRIBE
+                    self._subscribe(broker, body)
+                elif kind == 10:  # UNSUBSCRIBE
+                    self._write(11, 0, body[:2])
+                elif kind == 12:  # PINGREQ
+                    self._write(13, 0)
+                elif kind == 14:  # DISCONNECT
+                    return
+        finally:
+            with broker._lock:
+                broker._clients.remove(self)
+
+    def _publish(self, broker: Broker, flags: int, body: bytes):
+        qos = (flags >> 1) & 0x03
+        size = struct.unpack("!H", body[:2])[0]
+        topic = body[2:2 + size].decode()
+        offset = 2 + size
+        mid = body[offset:offset + 2]
+        if qos:
+            offset += 2
+        broker._received(Received(topic=topic, payload=body[offset:], retain=bool(flags & 0x01), qos=qos, ts=time.monotonic()))
+        if qos and broker.ackDelay > 0:
+            time.sleep(broker.ackDelay)
+        if qos == 1:
+            self._write(4, 0, mid)
+        elif qos == 2:
+            self._write(5, 0, mid)
+
+    def _subscribe(self, broker: Broker, body: bytes):
+        mid, offset = body[:2], 2
+        topics = []
+        while offset < len(body):
+            size = struct.unpack("!H", body[offset:offset + 2])[0]
+            topics.append(body[offset + 2:offset + 2 + size].decode())
+            offset += 3 + size  # Topic and its requested QoS
+        with self._writeLock:
+            self.subscriptions.extend(topics)
+        # Everything is forwarded at QoS 0
+        self._write(9, 0, mid + bytes(len(topics)))
+
+        with broker._lock:
+            retained = list(broker.retained.items())
+        for topic, payload in retained:
+            if any(topic_matches_sub(sub, topic) for sub in topics):
+                encoded = topic.encode()
+                self._write(3, 1, struct.pack("!H", len(encoded)) + encoded + payload)
@@ -0,0 +1,35 @@
+import os
+import sys
+
+import pytest
+
+# Run from anywhere, imports resolve from the repo root like main.py's do
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Config needs the controller and broker settings even though nothing connects here
+for _name, _value in (('HM_URL', 'http://tests'), ('MQTT_BROKER', 'tests'), ('MQTT_USER', 'tests'), ('MQTT_PASSWORD', 'tests')):
+    os.environ.setdefault(_name, _value)
+
+from Database.Database import Dbase  # noqa: E402
+
+@pytest.fixture
+def db():
+    """Fresh in-memory event database. Dbase keeps its listeners and cache on the class, so they are reset after each test."""
+    dbase = Dbase(":memory:")
+    dbase.connect()
+    dbase.create_tables()
+    yield dbase
+    dbase.close()
+    Dbase._listeners.clear()
+    Dbase._latest.clear()
+
+@pytest.fixture
+def fileDb(tmp_path):
+    """Event database in a file with the background writer, as main.py runs it. Needed when several threads use the database."""
+    dbase = Dbase(str(tmp_path / "db.sqlite"), tuned=True)
+    dbase.connect()
+    dbase.create_tables()
+    yield dbase
+    dbase.close()
+    Dbase._listeners.clear()
+    Dbase._latest.clear()
@@ -0,0 +1,156 @@
+import asyncio
+import threading
+import time
+
+import aiohttp
+import pytest
+
+from Models.BoilerData import BoilerStatus
+from Models.config import Config
+from Utils.AsyncBoiler import AsyncBoiler
+from Utils.Boiler import Boiler
+from Utils.Emulator import Emulator
+
+@pytest.fixture
+def emulator():
+    with Emulator(seed=0) as e:
+        yield e
+
+def _config(emulator: Emulator, **settings) -> Config:
+    return Config(HM_URL=emulator.url, HM_CLICK_DELAY_SECS=0, **settings)
+
+def _peakConcurrency(emulator: Emulator, command: str):
+    """Track how many `command` requests the emulator is answering at once."""
+    respond = emulator.respond
+    state = {"now": 0, "peak": 0}
+    lock = threading.Lock()
+
+    def tracked(cmd, hint):
+        if not cmd.startswith(command):
+            return respond(cmd, hint)
+        with lock:
+            state["now"] += 1
+            state["peak"] = max(state["peak"], state["now"])
+        try:
+            status, body, delay = respond(cmd, hint)
+            # The latency is slept here so it counts as in flight
+            time.sleep(delay)
+            return status, body, 0.0
+        finally:
+            with lock:
+                state["now"] -= 1
+
+    emulator.respond = tracked
+    return state
+
+def test_reads_the_same_data_as_the_blocking_poller(db, emulator):
+    async def run():
+        boiler = AsyncBoiler(db=db, config=_config(emulator))
+        bd = await boiler.getData(force=True)
+        await boiler.close()
+        return bd
+
+    bd = asyncio.run(run())
+    blocking = Boiler(db=db, config=_config(emulator))
+    expected = blocking.getData(force=True)
+    blocking.close()
+    assert bd.status == BoilerStatus.HEATING
+    for name in ("waterTemp", "o2", "topAir", "botAir", "fan"):
+        assert getattr(bd, name) == getattr(expected, name), name
+    assert bd.bypass.value == expected.bypass.value
+
+def test_session_and_token_are_kept_across_cycles(db, emulator):
+    async def run():
+        boiler = AsyncBoiler(db=db, config=_config(emulator))
+        await boiler.getData(force=True)
+        token = boiler._client.token
+        session = boiler._client._asyncSession
+        await boiler.getData(force=True)
+        await boiler.getData(force=True)
+        assert boiler._client.token == token
+        assert boiler._client._asyncSession is session
+        stats = boiler._client.stats
+        await boiler.close()
+        return stats
+
+    stats = asyncio.run(run())
+    assert emulator.logins == 1 and stats["logins"] == 1
+    assert stats["reconnects"] == 0 and stats["reused_connections"] > 0
+
+def test_reads_are_gathered_up_to_the_limit(db, emulator):
+    emulator.latency = 0.05
+    state = _peakConcurrency(emulator, "GETVARS")
+
+    async def run():
+        boiler = AsyncBoiler(db=db, config=_config(emulator, HM_BATCH_READS=False, HM_MAX_CONCURRENT_REQUESTS=3))
+        bd = await boiler.getData(force=True)
+        await boiler.close()
+        return bd
+
+    bd = asyncio.run(run())
+    assert bd.status == BoilerStatus.HEATING
+    assert state["peak"] == 3
+
+def test_dropped_connection_then_relogin(db, emulator):
+    async def run():
+        boiler = AsyncBoiler(db=db, config=_config(emulator))
+        await boiler.getData(force=True)
+
+        emulator.inject("drop", command="GETVARS")
+        with pytest.raises(aiohttp.ClientConnectionError):
+            await boiler.getData(force=True)
+        # Reads gathered with the failed one finish on their own, the session is replaced after them
+        for _ in range(100):
+            if boiler._client._active == 0:
+                break
+            await asyncio.sleep(0.01)
+        assert boiler._client._asyncSession is None
+
+        emulator.inject("logout")
+        bd = await boiler.getData(force=True)
+        stats = boiler._client.stats
+        await boiler.close()
+        return bd, stats
+
+    bd, stats = asyncio.run(run())
+    assert bd.status == BoilerStatus.HEATING
+    assert stats["reconnects"] == 1
+    assert emulator.logins == 2 and stats["logins"] == 2
+
+def test_navigates_back_to_the_status_screen(db, emulator):
+    emulator.screen = 4
+
+    async def run():
+        boiler = AsyncBoiler(db=db, config=_config(emulator))
+        bd = await boiler.getData(force=True)
+        await boiler.close()
+        return bd
+
+    emulator.resetStats()
+    bd = asyncio.run(run())
+    assert emulator.screen == 0
+    assert emulator.stats["MSGCLICK"] == 4  # Up from screen 4
+    assert bd.status == BoilerStatus.HEATING
+
+def test_concurrent_cycles_run_one_at_a_time(db, emulator):
+    emulator.latency = 0.02
+    state = {"now": 0, "peak": 0}
+
+    async def run():
+        boiler = AsyncBoiler(db=db, config=_config(emulator))
+        update = boiler._updateBoilerAsync
+
+        async def tracked():
+            state["now"] += 1
+            state["peak"] = max(state["peak"], state["now"])
+            try:
+                await update()
+            finally:
+                state["now"] -= 1
+
+        boiler._updateBoilerAsync = tracked
+        await asyncio.gather(*(boiler.getData(force=True) for _ in range(3)))
+        await boiler.close()
+
+    asyncio.run(run())
+    assert state["peak"] == 1
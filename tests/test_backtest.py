@@ -0,0 +1,190 @@
+from collections import deque
+
+import numpy as np
+import pytest
+
+from Database.Telemetry import TelemetryStore
+from Models.BoilerData import BoilerStatus
+from Models.config import Config
+from Utils.Backtest import Backtest, parseAxis, product, sweep, sweepable
+
+MINUTE = 60 * 1000000
+NEVER = -(2 ** 62)
+
+def _series(rng: np.random.Generator, samples: int):
+    """A few days of made up telemetry with heating cycles, bypass openings and some offline samples."""
+    statuses = TelemetryStore.statuses
+    ts = np.cumsum(rng.integers(15, 90, samples)) * 1000000 + 1700000000 * 1000000
+    status, bypass, shutdown = [], [], []
+    state = BoilerStatus.HEATING
+    for _ in range(samples):
+        r = rng.random()
+        if r < 0.02:
+            state = BoilerStatus.IDLE if state == BoilerStatus.HEATING else BoilerStatus.HEATING
+        elif r < 0.025:
+            state = BoilerStatus.LOW_TEMP
+        elif r < 0.03:
+            state = BoilerStatus.OFFLINE
+        elif state in (BoilerStatus.LOW_TEMP, BoilerStatus.OFFLINE) and r < 0.2:
+            state = BoilerStatus.HEATING
+        status.append(statuses.index(state))
+        bypass.append(rng.random() < 0.01)
+        shutdown.append(rng.random() < 0.003)
+    return {
+        "ts": ts,
+        "status": np.array(status),
+        "waterTemp": 160 + np.cumsum(rng.normal(0, 0.8, samples)).clip(-40, 40),
+        "o2": (9 + np.cumsum(rng.normal(0, 0.4, samples))).clip(0, 21),
+        "bypass": np.array(bypass),
+        "shutdown": np.array(shutdown),
+    }
+
+def _fills(rng: np.random.Generator, series, count: int):
+    return sorted(int(x) for x in rng.integers(series["ts"][0] - 10 * MINUTE, series["ts"][-1] + 10 * MINUTE, count))
+
+def _combos(rng: np.random.Generator, count: int):
+    config = Config()
+    axes = {
+        "woodLowO2": rng.uniform(6, 14, count),
+        "woodEmptyO2": rng.uniform(10, 18, count),
+        "condensingTemp": rng.uniform(140, 170, count),
+        "woodLowHeatingMins": rng.choice([0, 10, 30, 60], count),
+        "woodEmptyCheckMins": rng.choice([5, 20, 45], count),
+        "bypassOpenedWoodCheckMins": rng.choice([0, 30], count),
+        "waterTempWindowLen": rng.choice([2, 4, 8], count),
+        "o2WindowLen": rng.choice([2, 8], count),
+    }
+    combos = product(config, {})
+    return {name: np.asarray(axes.get(name, np.repeat(combos[name], count)), dtype=np.float64) for name in sweepable}
+
+def _window(length: int, first: float):
+    return deque([first] * length, maxlen=length)
+
+def _slope(values) -> float:
+    n = len(values)
+    x = [i - (n - 1) / 2 for i in range(n)]
+    denominator = sum(v * v for v in x)
+    return sum(a * b for a, b in zip(x, values)) / denominator if denominator else 0.0
+
+def _scalar(series, fills, c, horizonMins: float):
+    """One combination, one sample at a time, the way the poller walks through cycles."""
+    statuses = TelemetryStore.statuses
+    skipped = [statuses.index(s) for s in Backtest.skipped]
+    rows = [i for i in range(series["ts"].size) if series["status"][i] not in skipped]
+    ts = [int(series["ts"][i]) for i in rows]
+    fills = [f for f in fills if ts[0] < f <= ts[-1]]
+    checkUs = max(int(c["woodEmptyCheckMins"] * MINUTE), 1)
+    heatingUs = c["woodLowHeatingMins"] * MINUTE
+
+    water = _window(int(c["waterTempWindowLen"]), float(series["waterTemp"][rows[0]]))
+    o2 = _window(int(c["o2WindowLen"]), float(series["o2"][rows[0]]))
+    low, flags = False, []
+    lastFill = heatingStart = lastBypass = NEVER
+    wasHeating = False
+    fillIndex = 0
+    for n, i in enumerate(rows):
+        now = ts[n]
+        heating = series["status"][i] == statuses.index(BoilerStatus.HEATING)
+        lowTemp = series["status"][i] == statuses.index(BoilerStatus.LOW_TEMP)
+        bypass = bool(series["bypass"][i])
+        water.append(float(series["waterTemp"][i]))
+        o2.append(float(series["o2"][i]))
+        tempAvg, waterSlope, o2Avg = sum(water) / len(water), _slope(water), sum(o2) / len(o2)
+
+        if heating and not wasHeating:
+            heatingStart = now
+        wasHeating = heating
+        if bypass:
+            lastBypass = now
+            low = False
+        while fillIndex < len(fills) and fills[fillIndex] <= now:
+            # A fill clears the flag before this sample is checked
+            lastFill = fills[fillIndex]
+            fillIndex += 1
+            low = False
+
+        checked = (n == 0 or (now - ts[0]) // checkUs != (ts[n - 1] - ts[0]) // checkUs)
+        checked = checked and now - lastBypass > c["bypassOpenedWoodCheckMins"] * MINUTE + checkUs
+        cooling = waterSlope <= 0.0
+        condensing = tempAvg <= c["condensingTemp"]
+        empty = checked and (bool(series["shutdown"][i]) or lowTemp or (o2Avg >= c["woodEmptyO2"] and cooling and condensing and heating))
+        lowNow = o2Avg >= c["woodLowO2"] and cooling and not condensing and heating and now - lastFill > heatingUs and now - heatingStart > heatingUs
+        if (empty or lowNow) and not bypass:
+            low = True
+        flags.append(low)
+
+    rises = [k for k in range(len(flags)) if flags[k] and (k == 0 or not flags[k - 1])]
+    hits, leads = 0, []
+    windowStart = 0
+    for fill in fills:
+        at = next(k for k in range(len(ts)) if ts[k] >= fill)
+        before = at - 1
+        if before >= 0:
+            rise = max((r for r in rises if r <= before), default=-1)
+            if flags[before] and rise >= windowStart and fill - ts[rise] <= horizonMins * MINUTE:
+                hits += 1
+                leads.append((fill - ts[rise]) / MINUTE)
+        windowStart = at
+
+    falseAlarms = len(rises) - hits
+    precision = hits / (hits + falseAlarms) if hits + falseAlarms else 0.0
+    recall = hits / len(fills) if fills else 0.0
+    return {
+        "hits": hits,
+        "falseAlarms": falseAlarms,
+        "misses": len(fills) - hits,
+        "precision": precision,
+        "recall": recall,
+        "f1": 2 * precision * recall / (precision + recall) if precision + recall else 0.0,
+        "leadMins": sum(leads) / hits if hits else 0.0,
+        "alertPct": sum(flags) / len(flags) * 100,
+    }
+
+@pytest.mark.parametrize("seed", range(6))
+def test_matches_scalar_reference(seed):
+    rng = np.random.default_rng(seed)
+    series = _series(rng, 1500)
+    fills = _fills(rng, series, 8)
+    combos = _combos(rng, 12)
+
+    scores = Backtest(series, fills, horizonMins=180).evaluate(combos)
+    for k in range(12):
+        expected = _scalar(series, fills, {name: combos[name][k] for name in sweepable}, 180)
+        for name, value in expected.items():
+            assert scores[name][k] == pytest.approx(value), (k, name)
+
+def test_pool_matches_in_process():
+    rng = np.random.default_rng(42)
+    series = _series(rng, 800)
+    fills = _fills(rng, series, 5)
+    combos = _combos(rng, 20)
+    local = sweep(series, fills, combos, workers=0, chunk=7)
+    pooled = sweep(series, fills, combos, workers=2, chunk=7)
+    for name in local:
+        np.testing.assert_allclose(local[name], pooled[name])
+
+def test_too_short_series_scores_zero():
+    rng = np.random.default_rng(0)
+    series = {k: v[:1] for k, v in _series(rng, 10).items()}
+    scores = Backtest(series, [int(series["ts"][0])]).evaluate(product(Config(), {}))
+    assert scores["hits"][0] == 0 and scores["f1"][0] == 0
+
+def test_parse_axis():
+    name, axis = parseAxis("woodLowO2=6:8:0.5")
+    assert name == "woodLowO2"
+    np.testing.assert_allclose(axis, [6, 6.5, 7, 7.5, 8])
+    assert parseAxis("o2WindowLen=4,8")[1].tolist() == [4, 8]
+    with pytest.raises(ValueError):
+        parseAxis("hmPassword=1,2")
+    with pytest.raises(ValueError):
+        parseAxis("woodLowO2=")
+    # The poller's rolling windows need two samples
+    with pytest.raises(ValueError):
+        parseAxis("waterTempWindowLen=1:4:1")
+
+def test_product_covers_every_combination():
+    config = Config()
+    combos = product(config, {"woodLowO2": [6, 8, 10], "o2WindowLen": [4, 8]})
+    assert combos["woodLowO2"].size == 6
+    assert set(zip(combos["woodLowO2"], combos["o2WindowLen"])) == {(a, b) for a in (6, 8, 10) for b in (4, 8)}
+    assert (combos["woodEmptyO2"] == config.woodEmptyO2).all()
@@ -0,0 +1,120 @@
+import threading
+import time
+
+import arrow
+import paho.mqtt.client as mqtt
+
+from Models.config import Config
+from Utils.Boiler import Boiler
+from tests.broker import Broker
+from Utils.Commands import Command, CommandQueue
+from Utils.Emulator import Emulator
+
+def _waitUntil(check, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while not check():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+def _client(broker: Broker, name: str, onMessage=None) -> mqtt.Client:
+    client = mqtt.Client(protocol=mqtt.MQTTv311, client_id=name)
+    connected = threading.Event()
+    client.on_connect = lambda *args: connected.set()
+    if onMessage is not None:
+        client.on_message = onMessage
+    client.connect(broker.host, broker.port)
+    client.loop_start()
+    assert connected.wait(5)
+    return client
+
+def test_flood_never_blocks_the_network_thread():
+    count = 2000
+    applied = []
+    putSecs = []
+    commands = CommandQueue(maxSize=count)
+
+    def slowHandler(command: Command):
+        time.sleep(0.0005)  # A controller click or database write
+        applied.append(command.payload)
+
+    def onMessage(client, userdata, message):
+        start = time.perf_counter()
+        commands.put(message.topic, message.payload.decode(), message.retain)
+        putSecs.append(time.perf_counter() - start)
+
+    commands.register("boiler/set", slowHandler)
+    commands.start()
+    with Broker() as broker:
+        subscriber = _client(broker, "test-subscriber", onMessage)
+        subscribed = threading.Event()
+        subscriber.on_subscribe = lambda *args: subscribed.set()
+        subscriber.subscribe("boiler/set", qos=1)
+        assert subscribed.wait(5)
+
+        publisher = _client(broker, "test-publisher")
+        for n in range(count):
+            publisher.publish("boiler/set", str(n), qos=1)
+        _waitUntil(lambda: len(putSecs) == count)
+        assert commands.join(30)
+        publisher.loop_stop()
+        subscriber.loop_stop()
+    commands.stop()
+
+    # Every command applied exactly once, in arrival order
+    assert applied == [str(n) for n in range(count)]
+    assert commands.applied == count and commands.dropped == 0
+    # paho's loop only paid for an enqueue while the worker was busy
+    assert max(putSecs) < 0.05
+    assert sum(putSecs) < count * 0.0005 / 4
+
+def test_full_queue_drops_instead_of_blocking():
+    commands = CommandQueue(maxSize=2)
+    commands.register("boiler/set", lambda command: None)
+    assert commands.put("boiler/set", "1") and commands.put("boiler/set", "2")
+    start = time.monotonic()
+    assert not commands.put("boiler/set", "3")
+    assert time.monotonic() - start < 0.1
+    assert commands.dropped == 1
+    commands.start()
+    assert commands.join(5) and commands.applied == 2
+    commands.stop()
+
+def test_repeated_retained_command_is_skipped():
+    applied = []
+    commands = CommandQueue()
+    commands.register("boiler/set", lambda command: applied.append(command.payload))
+    commands.start()
+    for payload, retained in (("a", True), ("a", True), ("a", False), ("b", True), ("a", True)):
+        commands.put("boiler/set", payload, retained)
+    assert commands.join(5)
+    commands.stop()
+    assert applied == ["a", "a", "b", "a"]
+    assert commands.skipped == 1
+
+def test_failed_command_does_not_stop_the_worker():
+    applied = []
+
+    def handler(command: Command):
+        if command.payload == "bad":
+            raise ValueError(command.payload)
+        applied.append(command.payload)
+
+    commands = CommandQueue()
+    commands.register("boiler/set", handler)
+    commands.start()
+    for payload in ("1", "bad", "2"):
+        commands.put("boiler/set", payload)
+    assert commands.join(5)
+    commands.stop()
+    assert applied == ["1", "2"] and commands.failed == 1
+
+def test_wood_fill_keeps_the_command_wall_clock(db):
+    with Emulator(seed=0) as emulator:
+        boiler = Boiler(db=db, config=Config(HM_URL=emulator.url, HM_CLICK_DELAY_SECS=0))
+        ts = arrow.get("2024-01-01T06:00:00-05:00")
+        assert boiler.addWoodFill(ts)
+        # Stored naive like every other event, not moved to UTC
+        assert db.lastWoodFilled().ts.naive == ts.naive
+        # The retained command delivered again on reconnect
+        assert not boiler.addWoodFill(arrow.get("2024-01-01T06:00:00-05:00"))
+        boiler.close()
@@ -0,0 +1,109 @@
+import arrow
+import pytest
+import requests
+
+from Models.config import Config
+from Utils.Clock import Clock
+from Utils.Controller import Controller
+from Utils.Emulator import Emulator
+
+class _Clock(Clock):
+    """Wall clock that only moves when told to."""
+
+    def __init__(self):
+        self.current = arrow.get("2024-01-01T12:00:00")
+
+    def utcnow(self) -> arrow.Arrow:
+        return self.current
+
+@pytest.fixture
+def emulator():
+    with Emulator(seed=0) as e:
+        yield e
+
+def _controller(emulator: Emulator, clock: Clock = None, **settings) -> Controller:
+    return Controller(Config(HM_URL=emulator.url, **settings), clock=clock)
+
+def _cycle(controller: Controller):
+    """What one poll cycle asks of the controller."""
+    assert controller.ensureLogin()
+    controller.msgGet()
+    return controller.getVars("GETVARS:v0,18,0,0,2,1")
+
+def test_session_and_token_are_kept_across_cycles(emulator):
+    controller = _controller(emulator)
+    _cycle(controller)
+    token, session = controller.token, controller._session
+    for _ in range(4):
+        _cycle(controller)
+    assert controller.token == token
+    assert controller._session is session
+    assert emulator.logins == 1
+    assert controller.stats == {"logins": 1, "reconnects": 0, "reused_connections": controller.reusedConnections}
+    # Everything after the very first request went over the same session
+    assert controller.reusedConnections == sum(emulator.requests.values()) - 1
+    controller.close()
+
+def test_relogin_when_the_status_check_fails(emulator):
+    controller = _controller(emulator)
+    _cycle(controller)
+    # The controller forgot the token, GETSTDG no longer reports running
+    emulator.inject("logout", command="GETSTDG")
+    assert _cycle(controller) == emulator.defaults["waterTemp"]
+    assert emulator.logins == 2 and controller.logins == 2
+    _cycle(controller)
+    assert emulator.logins == 2
+    controller.close()
+
+@pytest.mark.parametrize("status", [401, 403])
+def test_relogin_when_a_request_is_refused(emulator, status):
+    controller = _controller(emulator)
+    _cycle(controller)
+    emulator.inject("status", command="GETVARS", status=status)
+    # Refused, logged in again and retried within the same call
+    assert controller.getVars("GETVARS:v0,18,0,0,2,1") == emulator.defaults["waterTemp"]
+    assert emulator.logins == 2 and controller.logins == 2
+    controller.close()
+
+def test_relogin_when_the_token_is_too_old(emulator):
+    clock = _Clock()
+    controller = _controller(emulator, clock=clock, HM_TOKEN_MAX_AGE_SECS=600)
+    _cycle(controller)
+    clock.current = clock.current.shift(seconds=599)
+    _cycle(controller)
+    assert emulator.logins == 1
+    clock.current = clock.current.shift(seconds=2)
+    _cycle(controller)
+    assert emulator.logins == 2 and controller.logins == 2
+    # Counted from the new login
+    clock.current = clock.current.shift(seconds=599)
+    _cycle(controller)
+    assert emulator.logins == 2
+    controller.close()
+
+def test_other_failures_do_not_log_in_again(emulator):
+    controller = _controller(emulator)
+    _cycle(controller)
+    emulator.inject("status", command="GETVARS", status=500)
+    emulator.inject("garbage", command="MSGGET")
+    assert controller.getVars("GETVARS:v0,18,0,0,2,1") is None
+    controller.msgGet()
+    _cycle(controller)
+    assert emulator.logins == 1 and controller.logins == 1
+    controller.close()
+
+def test_dropped_connection_gets_a_new_session_but_keeps_the_token(emulator):
+    controller = _controller(emulator)
+    _cycle(controller)
+    token, session = controller.token, controller._session
+    emulator.inject("drop", command="MSGGET")
+    with pytest.raises(requests.exceptions.ConnectionError):
+        controller.msgGet()
+    assert controller._session is not session
+    assert controller.reconnects == 1
+
+    assert _cycle(controller) == emulator.defaults["waterTemp"]
+    assert controller.token == token
+    assert emulator.logins == 1
+    assert controller.stats["reconnects"] == 1
+    controller.close()
@@ -0,0 +1,65 @@
+import threading
+
+import pytest
+from pydantic import ValidationError
+
+from Database.Models.Event import EventType
+from Models.config import Config
+from Utils.Boiler import Boiler
+from Utils.Emulator import Emulator
+
+def test_single_controller_is_named_boiler():
+    config = Config(HM_URL="http://heatmaster", HM_CONTROLLERS="")
+    assert config.controllerUrls == {"boiler": "http://heatmaster"}
+    assert config.controllerConfigs()["boiler"].hmUrl == "http://heatmaster/AJAX"
+
+def test_controllers_get_their_own_config():
+    config = Config(HM_CONTROLLERS=" house=http://10.0.0.2 , shop-2=http://10.0.0.3", WOOD_LOW_O2=9)
+    configs = config.controllerConfigs()
+    assert list(configs) == ["house", "shop-2"]
+    assert configs["house"].hmUrl == "http://10.0.0.2/AJAX"
+    assert configs["shop-2"].hmUrl == "http://10.0.0.3/AJAX"
+    assert all(c.hmControllers == "" and c.woodLowO2 == 9 for c in configs.values())
+
+@pytest.mark.parametrize("controllers", [
+    "House=http://a",  # Upper case
+    "house",  # No url
+    "house=",
+    "-house=http://a",
+    "house=http://a,house=http://b",
+])
+def test_bad_controller_lists_are_refused(controllers):
+    with pytest.raises(ValidationError):
+        Config(HM_CONTROLLERS=controllers)
+
+def test_state_topic_needs_the_controller_id():
+    with pytest.raises(ValidationError):
+        Config(HM_CONTROLLERS="a=http://a,b=http://b", MQTT_STATE_TOPIC="boilers/state")
+    assert Config(HM_CONTROLLERS="a=http://a,b=http://b", MQTT_STATE_TOPIC="boilers/{id}/state")
+
+def test_controllers_are_polled_independently(fileDb):
+    # Pool threads each get their own connection, which an in-memory database does not share
+    db = fileDb
+    with Emulator(seed=1) as house, Emulator(seed=2) as shop:
+        house.setValues(waterTemp=1000)
+        shop.setValues(waterTemp=600, bypass=0)  # Bypass open
+        config = Config(HM_CONTROLLERS=f"house={house.url},shop={shop.url}", HM_CLICK_DELAY_SECS=0)
+        boilers = {name: Boiler(db=db, config=c, name=name) for name, c in config.controllerConfigs().items()}
+
+        # Polled at the same time, as the scheduler's worker pool does
+        threads = [threading.Thread(target=b.getData, kwargs={"force": True}) for b in boilers.values()]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        db.flush()
+
+        assert house.logins == 1 and shop.logins == 1
+        assert boilers["house"].boilerData.waterTemp > boilers["shop"].boilerData.waterTemp
+        assert not boilers["house"].boilerData.bypass.value
+        assert boilers["shop"].boilerData.bypass.value
+        assert db.scoped("shop").lastBypassOpened().value is True
+        assert [e.value for e in db.scoped("house").events(EventType.Bypass)] in ([], [False])
+
+        for boiler in boilers.values():
+            boiler.close()
@@ -0,0 +1,210 @@
+import sqlite3
+import threading
+
+import arrow
+import pytest
+
+from Database.Database import Dbase
+from Database.Models.Event import Event, EventType
+from Models.config import Config
+from Utils.Boiler import Boiler
+
+def _indexes(path) -> set:
+    with sqlite3.connect(path) as c:
+        rows = c.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'event'").fetchall()
+        columns = {name.lower(): tuple(r[2] for r in c.execute(f"PRAGMA index_info('{name}')")) for (name,) in rows}
+        version = c.execute("PRAGMA user_version").fetchone()[0]
+    return set(columns.items()), version
+
+def _open(path) -> Dbase:
+    dbase = Dbase(str(path))
+    dbase.connect()
+    return dbase
+
+@pytest.fixture
+def cleanup():
+    yield
+    Dbase._latest.clear()
+    Dbase._listeners.clear()
+
+def test_migrated_schema_matches_fresh(tmp_path, cleanup):
+    fresh = tmp_path / "fresh.sqlite"
+    dbase = _open(fresh)
+    dbase.create_tables()
+    dbase.close()
+
+    # Table as the first release created it, before any migration
+    old = tmp_path / "old.sqlite"
+    with sqlite3.connect(old) as c:
+        c.execute('CREATE TABLE "event" ("id" INTEGER NOT NULL PRIMARY KEY, "eventType" VARCHAR(50) NOT NULL, "ts" DATETIME NOT NULL, "value" VARCHAR(50) NOT NULL)')
+        c.execute("""INSERT INTO event (eventType, ts, value) VALUES ('wood_filled', '2024-01-01 06:00:00', 'true')""")
+    _open(old).close()
+
+    assert _indexes(old) == _indexes(fresh)
+    assert _indexes(fresh)[0] == {("event_controller_eventtype_ts", ("controller", "eventType", "ts"))}
+
+    dbase = _open(old)
+    assert dbase.lastWoodFilled().ts == arrow.get("2024-01-01T06:00:00")
+    dbase.close()
+
+def test_latest_events_are_served_from_the_cache(db, monkeypatch):
+    db.eventWoodFilled(ts=arrow.get("2024-01-01T06:00:00"))
+    db.eventBypassOpened(True, ts=arrow.get("2024-01-01T05:00:00"))
+    db.invalidate()
+    # Warm the cache, one query per type
+    db.lastWoodFilled(), db.lastBypassOpened(), db.lastHeating()
+
+    selects = []
+    execute = db.db.execute_sql
+    def _counting(sql, *args, **kwargs):
+        if sql.lstrip().upper().startswith("SELECT"):
+            selects.append(sql)
+        return execute(sql, *args, **kwargs)
+    monkeypatch.setattr(db.db, "execute_sql", _counting)
+
+    for hour in range(7, 12):
+        db.eventWoodFilled(ts=arrow.get(f"2024-01-01T{hour:02}:00:00"))
+        db.eventHeating(hour % 2 == 0, ts=arrow.get(f"2024-01-01T{hour:02}:30:00"))
+        assert db.lastWoodFilled().ts == arrow.get(f"2024-01-01T{hour:02}:00:00")
+        assert db.lastHeating().value == (hour % 2 == 0)
+        assert db.lastBypassOpened().value is True
+
+    assert selects == []
+
+def test_older_event_does_not_replace_the_latest(db):
+    db.eventWoodFilled(ts=arrow.get("2024-01-02T06:00:00"))
+    db.eventWoodFilled(ts=arrow.get("2024-01-01T06:00:00"))
+    assert db.lastWoodFilled().ts == arrow.get("2024-01-02T06:00:00")
+
+def test_invalidate_picks_up_external_writes(db):
+    db.eventWoodFilled(ts=arrow.get("2024-01-01T06:00:00"))
+    assert db.lastWoodFilled().ts == arrow.get("2024-01-01T06:00:00")
+
+    db.db.execute_sql("INSERT INTO event (eventType, ts, value, controller) VALUES ('wood_filled', '2024-01-03 06:00:00', 'true', 'boiler')")
+    assert db.lastWoodFilled().ts == arrow.get("2024-01-01T06:00:00")
+    db.invalidate(EventType.WoodFilled, controller="boiler")
+    assert db.lastWoodFilled().ts == arrow.get("2024-01-03T06:00:00")
+
+def test_controllers_are_kept_apart(db):
+    db.scoped("a").eventWoodFilled(ts=arrow.get("2024-01-01T06:00:00"))
+    db.scoped("b").eventWoodFilled(ts=arrow.get("2024-01-02T06:00:00"))
+    assert db.scoped("a").lastWoodFilled().ts == arrow.get("2024-01-01T06:00:00")
+    assert db.scoped("b").lastWoodFilled().ts == arrow.get("2024-01-02T06:00:00")
+    assert [e.ts for e in db.scoped("a").events(EventType.WoodFilled)] == [arrow.get("2024-01-01T06:00:00")]
+
+def test_boiler_close_removes_its_listener(db):
+    before = list(Dbase._listeners)
+    boilers = [Boiler(db=db, config=Config(), name=name) for name in ("a", "b")]
+    assert len(Dbase._listeners) == len(before) + 2
+
+    for boiler in boilers:
+        boiler.close()
+    assert Dbase._listeners == before
+
+def test_tuned_database_uses_wal(fileDb):
+    assert fileDb.db.pragma('journal_mode') == 'wal'
+    assert fileDb.db.pragma('synchronous') == 1  # NORMAL
+
+def test_writer_future_resolves_with_the_saved_row(fileDb):
+    row = fileDb.eventWoodFilled(ts=arrow.get("2024-01-01T06:00:00")).result(5)
+    assert row.id is not None
+    saved = Event.get_by_id(row.id)
+    assert (saved.eventType, saved.value, saved.controller) == ("wood_filled", "true", "boiler")
+
+def test_waiting_events_share_one_transaction(fileDb, monkeypatch):
+    gate, entered = threading.Event(), threading.Event()
+    create = Event.create
+
+    def slowCreate(**fields):
+        entered.set()
+        gate.wait(5)
+        return create(**fields)
+
+    transactions = []
+    atomic = fileDb.db.atomic
+
+    def countingAtomic(*args, **kwargs):
+        transactions.append(threading.current_thread().name)
+        return atomic(*args, **kwargs)
+
+    monkeypatch.setattr(Event, "create", slowCreate)
+    monkeypatch.setattr(fileDb.db, "atomic", countingAtomic)
+    def add(n: int):
+        return fileDb.eventHeating(n % 2 == 0, ts=arrow.get("2024-01-01T06:00:00").shift(minutes=n))
+
+    # The writer is held inside the first event, the others queue up behind it
+    futures = [add(0)]
+    assert entered.wait(5)
+    futures += [add(n) for n in range(1, 11)]
+    gate.set()
+    rows = [f.result(5) for f in futures]
+    fileDb.flush()
+
+    assert len({row.id for row in rows}) == 11
+    assert transactions == ["DbaseWriter", "DbaseWriter"]
+    assert len(fileDb.events(EventType.Heating)) == 11
+
+def test_failed_write_reaches_the_caller_and_the_writer_keeps_going(fileDb, monkeypatch):
+    create = Event.create
+    calls = []
+
+    def failingCreate(**fields):
+        calls.append(fields)
+        if len(calls) == 1:
+            raise sqlite3.OperationalError("disk I/O error")
+        return create(**fields)
+
+    monkeypatch.setattr(Event, "create", failingCreate)
+    failed = fileDb.eventWoodFilled(ts=arrow.get("2024-01-01T06:00:00"))
+    with pytest.raises(sqlite3.OperationalError):
+        failed.result(5)
+
+    row = fileDb.eventWoodFilled(ts=arrow.get("2024-01-02T06:00:00")).result(5)
+    assert Dbase._writer.is_alive()
+    assert [e.ts for e in fileDb.events(EventType.WoodFilled)] == [arrow.get("2024-01-02T06:00:00")]
+    assert row.id is not None
+
+def test_tuned_database_opens_the_old_schema(tmp_path, cleanup):
+    old = tmp_path / "old.sqlite"
+    with sqlite3.connect(old) as c:
+        c.execute('CREATE TABLE "event" ("id" INTEGER NOT NULL PRIMARY KEY, "eventType" VARCHAR(50) NOT NULL, "ts" DATETIME NOT NULL, "value" VARCHAR(50) NOT NULL)')
+        c.execute("""INSERT INTO event (eventType, ts, value) VALUES ('wood_filled', '2024-01-01 06:00:00', 'true')""")
+
+    dbase = Dbase(str(old), tuned=True)
+    dbase.connect()
+    assert dbase.lastWoodFilled().ts == arrow.get("2024-01-01T06:00:00")
+    dbase.eventWoodFilled(ts=arrow.get("2024-01-02T06:00:00")).result(5)
+    dbase.close()
+
+    dbase = _open(old)
+    assert [e.ts for e in dbase.events(EventType.WoodFilled)] == [arrow.get("2024-01-01T06:00:00"), arrow.get("2024-01-02T06:00:00")]
+    assert _indexes(old)[1] == len(Dbase._migrations)
+    dbase.close()
+
+def test_connect_loads_the_latest_events(tmp_path, cleanup, monkeypatch):
+    dbase = _open(tmp_path / "db.sqlite")
+    dbase.create_tables()
+    for day in (1, 3, 2):
+        dbase.scoped("a").eventWoodFilled(ts=arrow.get(f"2024-01-0{day}T06:00:00"))
+    dbase.scoped("a").eventBypassOpened(False, ts=arrow.get("2024-01-01T07:00:00"))
+    dbase.scoped("b").eventHeating(True, ts=arrow.get("2024-01-02T08:00:00.250000"))
+    dbase.close()
+    Dbase._latest.clear()
+
+    selects = []
+    execute = Dbase.db.execute_sql
+    def _counting(sql, *args, **kwargs):
+        if sql.lstrip().upper().startswith("SELECT") and "sqlite_master" not in sql:
+            selects.append(sql)
+        return execute(sql, *args, **kwargs)
+    monkeypatch.setattr(Dbase.db, "execute_sql", _counting)
+
+    dbase = _open(tmp_path / "db.sqlite")
+    assert len(selects) == 1
+    assert dbase.scoped("a").lastWoodFilled().ts == arrow.get("2024-01-03T06:00:00")
+    assert dbase.scoped("a").lastBypassOpened().value is False
+    assert dbase.scoped("b").lastHeating().ts == arrow.get("2024-01-02T08:00:00.250000")
+    # Never logged for a known controller, also answered from the cache
+    assert dbase.scoped("b").lastWoodFilled().ts == arrow.get(0)
+    assert len(selects) == 1
+    dbase.close()
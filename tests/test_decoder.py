@@ -0,0 +1,123 @@
+import json
+import os
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from Utils import Decoder
+from Utils.Decoder import Screen, parseScreen, parseVar, unpack
+
+RECORDING = os.path.join(os.path.dirname(__file__), "fixtures", "boiler-emulator.jsonl")
+
+def _etVar(xml: str):
+    """Reference GETVARS decode, ElementTree only."""
+    try:
+        r = ET.fromstring(xml).find('r')
+    except ET.ParseError:
+        return None
+    if r is None or not r.get('v'):
+        return None
+    return int(r.get('v'), 16)
+
+def _etScreen(xml: str) -> Screen:
+    """Reference MSGGET decode, ElementTree only."""
+    try:
+        root = ET.fromstring(xml)
+    except ET.ParseError:
+        return Screen()
+    return Screen(type=root.get('type'), texts={t.get('id'): t.get('v') for t in root.iter('t') if t.get('id') is not None})
+
+def _payloads(command: str):
+    with open(RECORDING) as f:
+        for line in f:
+            for data, status, text in json.loads(line).get("exchanges", []):
+                if data.startswith(command) and status == 200:
+                    yield text
+
+GETVARS = list(_payloads("GETVARS"))
+MSGGET = list(_payloads("MSGGET"))
+
+@pytest.fixture
+def noElementTree(monkeypatch):
+    """Fail the test if the ElementTree fallback is used."""
+    def _fail(xml):
+        raise AssertionError(f"ElementTree fallback used for {xml!r}")
+    monkeypatch.setattr(Decoder.ET, "fromstring", _fail)
+
+@pytest.mark.parametrize("xml, expected", [
+    ('<d><r v="00FF"/></d>', 0xFF),
+    ('<?xml version="1.0"?><d><r v="0a1B"/></d>', 0x0A1B),
+    ('<d>\n  <r  v="0102030405"/>\n</d>', 0x0102030405),
+])
+def test_var_fast_path(xml, expected, noElementTree):
+    assert parseVar(xml) == expected
+
+@pytest.mark.parametrize("xml, expected", [
+    ("<d><r v='0A'/></d>", 0x0A),  # Single quotes
+    ('<d><r x="1" v="0A"/></d>', 0x0A),  # v is not the first attribute
+    ('<d><r v=""/></d>', None),  # Unknown variable
+    ('<d></d>', None),
+    ('<d><r v=', None),  # Truncated
+    ('', None),
+])
+def test_var_fallback_matches_element_tree(xml, expected):
+    assert parseVar(xml) == expected == _etVar(xml)
+
+def test_recorded_vars_match_element_tree():
+    assert GETVARS
+    for xml in GETVARS:
+        assert parseVar(xml) == _etVar(xml)
+
+@pytest.mark.parametrize("xml", [
+    '<?xml version="1.0"?><d type="s"><t id="0" v="Status"/><t id="1" v="Heating Cycle"/></d>',
+    '<d type="s"><t id="0" v="Status"></t></d>',  # Explicit end tags
+    '<d type="s"><t v="Status" id="0"/></d>',  # v before id
+    '<d type="s"><t id="0" v="Status" c="1"/><t id="1" v="x"/></d>',  # Extra attribute
+    '<d type="s"><t id="0" v="Status"/><t v="no id"/></d>',  # Line without an id
+    '<d><t id="0" v=""/></d>',  # No type, empty value
+    '<d type="s"><t id="0" v="Water &amp; Air"/></d>',  # Entity
+    '<d type="s"><t id="0" v="90&#176;F"/><t id="1" v="&quot;x&quot;"/></d>',  # Numeric and quote entities
+    '<d type="s"><t id="0" v="Don\'t Open"/></d>',  # Apostrophe in a value
+    "<d type='s'><t id='0' v='Status'/></d>",  # Single quoted attributes
+    '<d type="s"><!-- menu --><t id="0" v="Status"/></d>',  # Comment
+    '<d type="s"><t id="0" v="Status"/>',  # Truncated
+    '',
+])
+def test_screen_matches_element_tree(xml):
+    assert parseScreen(xml) == _etScreen(xml)
+
+def test_screen_entities_are_decoded():
+    screen = parseScreen('<d type="s"><t id="0" v="Water &amp; Air"/><t id="1" v="Don\'t"/></d>')
+    assert screen.text(0) == "Water & Air"
+    assert screen.text(1) == "Don't"
+
+def test_recorded_screens_take_the_fast_path(noElementTree):
+    assert MSGGET
+    for xml in MSGGET:
+        screen = parseScreen(xml)
+        assert screen.type == "s"
+        assert screen.text(0)
+
+def test_recorded_screens_match_element_tree():
+    for xml in MSGGET:
+        assert parseScreen(xml) == _etScreen(xml)
+
+def test_unpack():
+    assert unpack(0x01020304, [1, 1, 2]) == [0x01, 0x02, 0x0304]
+    assert unpack(0x00FF, [1, 1]) == [0x00, 0xFF]
+
+@pytest.mark.benchmark(group="decode-vars")
+def test_bench_vars(benchmark):
+    benchmark(lambda: [parseVar(xml) for xml in GETVARS])
+
+@pytest.mark.benchmark(group="decode-vars")
+def test_bench_vars_element_tree(benchmark):
+    benchmark(lambda: [_etVar(xml) for xml in GETVARS])
+
+@pytest.mark.benchmark(group="decode-screens")
+def test_bench_screens(benchmark):
+    benchmark(lambda: [parseScreen(xml) for xml in MSGGET])
+
+@pytest.mark.benchmark(group="decode-screens")
+def test_bench_screens_element_tree(benchmark):
+    benchmark(lambda: [_etScreen(xml) for xml in MSGGET])
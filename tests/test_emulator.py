@@ -0,0 +1,136 @@
+import time
+
+import pytest
+import requests
+
+from Models.config import Config
+from Utils.Controller import Controller
+from Utils.Decoder import unpack
+from Utils.Emulator import Emulator
+
+@pytest.fixture
+def emulator():
+    with Emulator(seed=0) as e:
+        yield e
+
+def _client(emulator: Emulator, **settings) -> Controller:
+    return Controller(Config(HM_URL=emulator.url, **settings))
+
+def test_login_and_read(emulator):
+    client = _client(emulator)
+    assert client.ensureLogin()
+    assert emulator.logins == 1
+    assert client.getVars("GETVARS:v0,18,0,0,2,1") == emulator.defaults["waterTemp"]
+    # Neighbouring variables come back as one big-endian payload
+    payload = client.getVars("GETVARS:v0,129,0,0,4,4")
+    assert unpack(payload, [1, 1, 1, 1]) == [emulator.defaults[n] for n in ("lowWater", "bypass", "coldStart", "highLimit")]
+    assert client.msgGet().text(0) == "Furnace Status"
+    assert client.ensureLogin()
+    assert emulator.logins == 1
+    client.close()
+
+def test_wrong_password_is_refused(emulator):
+    client = _client(emulator, HM_PASSWORD="wrong")
+    assert not client.ensureLogin()
+    assert emulator.logins == 0
+    assert emulator.handle("GETVARS:v0,18,0,0,2,1", None) == (403, "")
+    assert emulator.handle("GETSTDG", None) == (200, "")
+    client.close()
+
+def test_unknown_and_mismatched_variables(emulator):
+    client = _client(emulator)
+    client.ensureLogin()
+    assert client.getVars("GETVARS:v0,18,0,5,2,1") is None  # No such index
+    assert client.getVars("GETVARS:v0,18,0,0,1,1") is None  # Wrong size
+    client.close()
+
+def test_values_can_be_scripted(emulator):
+    emulator.setValues(waterTemp=900, o2=lambda secs: 100)  # Evaluated on every read
+    client = _client(emulator)
+    client.ensureLogin()
+    assert client.getVars("GETVARS:v0,18,0,0,4,2") == (900 << 16) | 100
+    with pytest.raises(KeyError):
+        emulator.setValues(nope=1)
+    client.close()
+
+def test_menu_wraps_around(emulator):
+    client = _client(emulator, HM_CLICK_DOWN_CMD=Emulator.downCommand)
+    client.ensureLogin()
+    client.msgClickUp()
+    assert client.msgGet().text(0) == Emulator.menu[-1]
+    client.msgClickDown()
+    client.msgClickDown()
+    assert client.msgGet().text(0) == Emulator.menu[1]
+    assert client.msgGet().text(1) is None  # Only the status screen has a status line
+    client.close()
+
+def test_expired_token_logs_in_again(emulator):
+    emulator.tokenTtl = 0.05
+    client = _client(emulator)
+    client.ensureLogin()
+    time.sleep(0.1)
+    assert client.getVars("GETVARS:v0,18,0,0,2,1") == emulator.defaults["waterTemp"]
+    assert emulator.logins == 2
+    client.close()
+
+def test_logout_fault_logs_in_again(emulator):
+    client = _client(emulator)
+    client.ensureLogin()
+    emulator.inject("logout", command="GETVARS")
+    assert client.getVars("GETVARS:v0,18,0,0,2,1") == emulator.defaults["waterTemp"]
+    assert emulator.logins == 2
+    assert emulator.stats["fault_logout"] == 1
+    client.close()
+
+def test_status_and_garbage_faults(emulator):
+    client = _client(emulator)
+    client.ensureLogin()
+    emulator.inject("status", command="GETVARS", status=500)
+    emulator.inject("garbage", command="GETVARS")
+    assert client.getVars("GETVARS:v0,18,0,0,2,1") is None
+    assert client.getVars("GETVARS:v0,18,0,0,2,1") is None
+    assert client.getVars("GETVARS:v0,18,0,0,2,1") == emulator.defaults["waterTemp"]
+    client.close()
+
+def test_dropped_connection_opens_a_new_one(emulator):
+    client = _client(emulator)
+    client.ensureLogin()
+    emulator.inject("drop", command="GETVARS")
+    with pytest.raises(requests.exceptions.ConnectionError):
+        client.getVars("GETVARS:v0,18,0,0,2,1")
+    assert client.getVars("GETVARS:v0,18,0,0,2,1") == emulator.defaults["waterTemp"]
+    assert client.reconnects == 1
+    client.close()
+
+def test_fault_count_and_probability():
+    with Emulator(seed=5) as emulator:
+        fault = emulator.inject("status", command="MSGGET", count=-1, probability=0.25)
+        for _ in range(400):
+            emulator.respond("MSGGET:bm,-1", None)
+        assert 60 < emulator.faulted["status"] < 140
+        assert fault.count == -1
+
+        emulator.faults.clear()
+        emulator.inject("status", count=2)
+        statuses = [emulator.respond("GETSTDG", None)[0] for _ in range(4)]
+        assert statuses == [500, 500, 200, 200]
+
+def test_latency_and_delay_fault():
+    with Emulator(latency=0.02, jitter=0.01, seed=0) as emulator:
+        delays = [emulator.respond("GETSTDG", None)[2] for _ in range(50)]
+        assert all(0.01 <= d <= 0.03 for d in delays)
+
+        emulator.inject("delay", delay=0.2)
+        assert emulator.respond("GETSTDG", None)[2] >= 0.21
+
+def test_stats_count_requests(emulator):
+    client = _client(emulator)
+    client.ensureLogin()
+    client.msgGet()
+    client.msgGet()
+    assert emulator.stats["MSGGET"] == 2
+    assert emulator.stats["UAMCHAL"] == 1
+    assert emulator.stats["total"] == 4
+    emulator.resetStats()
+    assert emulator.stats == {"total": 0, "logins": 0}
+    client.close()
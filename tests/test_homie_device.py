@@ -0,0 +1,88 @@
+import pytest
+from homie_spec import Node, Property
+from homie_spec.properties import Datatype
+
+from Utils.HomieDevice import Device
+
+def _device(nodes: int, props: int) -> Device:
+    return Device(id="boiler", name="Boiler", fw="1.0", nodes={
+        f"node{n}": Node(name=f"Node {n}", typeOf="pump", properties={
+            f"prop{p}": Property(name=f"Prop {p}", datatype=Datatype.STRING, get=lambda n=n, p=p: f"{n}.{p}")
+            for p in range(props)
+        })
+        for n in range(nodes)
+    })
+
+def _naiveMessage(device: Device, path: str) -> str:
+    """The lookup getter_message did before the table: rebuild every topic on each call."""
+    topics = {
+        f"{device.prefix}/{device.id}/{node_name}/{prop_name}".lower(): prop
+        for node_name, node in device.nodes.items()
+        for prop_name, prop in (node.properties or {}).items()
+    }
+    return topics[f"{device.prefix}/{device.id}/{path}".lower()].get()
+
+def test_announce_topics_of_every_node_sit_under_the_device():
+    device = _device(nodes=3, props=2)
+    topics = [m.topic for m in device.messages()]
+
+    for n in range(3):
+        assert f"homie/boiler/node{n}/$name" in topics
+        assert f"homie/boiler/node{n}/prop1/$datatype" in topics
+    assert not [t for t in topics if t.startswith("homie/boiler/node0/node1")]
+    assert topics[-1] == "homie/boiler/$state"
+
+def test_getter_messages_match_getter_message():
+    device = _device(nodes=4, props=5)
+    messages = list(device.getter_messages())
+
+    assert len(messages) == 20
+    for topic, payload, retained, qos in messages:
+        path = topic[len("homie/boiler/"):]
+        message = device.getter_message(path)
+        assert (message.topic, message.payload) == (topic, payload)
+        assert payload == _naiveMessage(device, path)
+        assert retained and qos == 1
+
+def test_getter_messages_filters_by_node():
+    device = _device(nodes=3, props=2)
+    assert [t for t, *_ in device.getter_messages("node2")] == ["homie/boiler/node2/prop0", "homie/boiler/node2/prop1"]
+
+def test_register_node_replaces_its_topics():
+    device = _device(nodes=2, props=3)
+    device.register_node("node1", Node(name="Node 1", typeOf="pump", properties={
+        "only": Property(name="Only", datatype=Datatype.STRING, get=lambda: "x"),
+    }))
+
+    assert [t for t, *_ in device.getter_messages("node1")] == ["homie/boiler/node1/only"]
+    with pytest.raises(ValueError):
+        device.getter_message("node1/prop0")
+
+def test_nodes_changed_directly_are_picked_up():
+    device = _device(nodes=1, props=1)
+    device.nodes["extra"] = Node(name="Extra", typeOf="pump", properties={
+        "p": Property(name="P", datatype=Datatype.STRING, get=lambda: "late"),
+    })
+
+    assert device.getter_message("extra/p").payload == "late"
+
+# Several boilers and pumps modelled as extra nodes
+@pytest.mark.benchmark(group="homie-publish-pass")
+def test_bench_getter_messages_many_nodes(benchmark):
+    device = _device(nodes=40, props=25)
+    messages = benchmark(lambda: list(device.getter_messages()))
+    assert len(messages) == 1000
+
+@pytest.mark.benchmark(group="homie-publish-pass")
+def test_bench_naive_lookup_many_nodes(benchmark):
+    device = _device(nodes=40, props=25)
+    paths = [f"node{n}/prop{p}" for n in range(40) for p in range(25)]
+    # One pass of the old per property lookup, quadratic in the property count
+    payloads = benchmark.pedantic(lambda: [_naiveMessage(device, path) for path in paths], rounds=3)
+    assert len(payloads) == 1000
+
+@pytest.mark.benchmark(group="homie-lookup")
+def test_bench_getter_message_many_nodes(benchmark):
+    device = _device(nodes=40, props=25)
+    message = benchmark(device.getter_message, "node39/prop24")
+    assert message.payload == "39.24"
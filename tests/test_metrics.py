@@ -0,0 +1,98 @@
+import re
+import urllib.error
+import urllib.request
+
+import pytest
+
+from Models.config import Config
+from Utils import Boiler as BoilerModule
+from Utils import Controller as ControllerModule
+from Utils.Boiler import Boiler
+from Utils.Emulator import Emulator
+from Utils.Metrics import Histogram, Metrics
+
+@pytest.fixture
+def enabled() -> Metrics:
+    fresh = Metrics()
+    fresh.enable()
+    return fresh
+
+def test_disabled_metrics_record_nothing():
+    m = Metrics()
+    m.observe("boiler_cycle_seconds", 0.1)
+    m.inc("boiler_logins_total")
+    m.set("boiler_nav_clicks_max", 3)
+    with m.timer("boiler_cycle_seconds"):
+        pass
+    assert m.summary() == {"uptime": m.summary()["uptime"]}
+    assert "boiler_cycle_seconds" not in m.render()
+
+def test_histogram_buckets():
+    h = Histogram()
+    for value in (0.0005, 0.001, 0.003, 100.0):
+        h.observe(value)
+    counts, total, count = h.snapshot()
+    assert count == 4
+    assert total == pytest.approx(100.0045)
+    # Upper bounds are inclusive, the last slot is +Inf
+    assert counts[0] == 2
+    assert counts[Histogram.buckets.index(0.005)] == 1
+    assert counts[-1] == 1
+
+def test_render_is_prometheus_text(enabled):
+    enabled.observe("boiler_request_seconds", 0.002, controller="a", command="GETVARS")
+    enabled.observe("boiler_request_seconds", 0.2, controller="a", command="GETVARS")
+    enabled.inc("boiler_logins_total", controller="a")
+    enabled.inc("boiler_logins_total", 2, controller="a")
+    text = enabled.render()
+
+    assert "# TYPE boiler_request_seconds histogram" in text
+    assert 'boiler_request_seconds_bucket{command="GETVARS",controller="a",le="0.0025"} 1' in text
+    assert 'boiler_request_seconds_bucket{command="GETVARS",controller="a",le="+Inf"} 2' in text
+    assert 'boiler_request_seconds_count{command="GETVARS",controller="a"} 2' in text
+    assert "# TYPE boiler_logins_total counter" in text
+    assert 'boiler_logins_total{controller="a"} 3' in text
+    assert text.count("# HELP boiler_request_seconds ") == 1
+    # Every sample line is name{labels} value
+    for line in text.splitlines():
+        assert line.startswith("#") or re.fullmatch(r'[a-z_]+(\{[^}]*\})? \S+', line), line
+
+def test_summary_ids_and_controller_filter(enabled):
+    enabled.observe("boiler_phase_seconds", 0.5, controller="a", phase="read")
+    enabled.observe("boiler_phase_seconds", 1.5, controller="a", phase="read")
+    enabled.observe("boiler_phase_seconds", 1.0, controller="b", phase="read")
+    enabled.inc("boiler_commands_total", result="applied")
+    summary = enabled.summary(controller="a")
+    assert summary["phase-read-avg-ms"] == "1000.00"
+    assert summary["phase-read-count"] == "2"
+    assert summary["commands-applied"] == "1"
+    assert all(re.fullmatch(r'[a-z0-9-]+', key) for key in summary)
+    assert enabled.summary(controller="b")["phase-read-count"] == "1"
+
+def test_serves_metrics_over_http(enabled):
+    enabled.inc("boiler_logins_total", controller="a")
+    enabled.serve(0)
+    try:
+        port = enabled._server.server_address[1]
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as resp:
+            assert resp.headers["Content-Type"].startswith("text/plain")
+            assert 'boiler_logins_total{controller="a"} 1' in resp.read().decode()
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/other")
+    finally:
+        enabled.stop()
+
+def test_poll_cycle_is_instrumented(db, enabled, monkeypatch):
+    monkeypatch.setattr(BoilerModule, "metrics", enabled)
+    monkeypatch.setattr(ControllerModule, "metrics", enabled)
+    with Emulator(seed=0) as emulator:
+        boiler = Boiler(db=db, config=Config(HM_URL=emulator.url, HM_CLICK_DELAY_SECS=0), name="m")
+        boiler.getData(force=True)
+        boiler.close()
+
+    summary = enabled.summary(controller="m")
+    assert summary["cycle-count"] == "1"
+    assert summary["logins"] == "1"
+    for phase in ("login", "navigate", "read", "apply"):
+        assert summary[f"phase-{phase}-count"] == "1"
+    assert int(summary["request-getvars-count"]) >= 1
@@ -0,0 +1,140 @@
+import time
+
+import pytest
+
+from tests.broker import Broker
+from Utils.MQTT import MQTT
+from Utils.Spool import Spool
+
+@pytest.fixture
+def broker(monkeypatch):
+    with Broker() as b:
+        monkeypatch.setenv("MQTT_BROKER", b.host)
+        monkeypatch.setenv("MQTT_PORT", str(b.port))
+        yield b
+
+@pytest.fixture
+def spoolPath(tmp_path, monkeypatch):
+    path = str(tmp_path / "spool.jsonl")
+    monkeypatch.setenv("MQTT_SPOOL_PATH", path)
+    return path
+
+def _client(name: str) -> MQTT:
+    client = MQTT(clientId=name, onMessage=lambda *args: None)
+    client.begin()
+    _waitUntil(lambda: client._connected)
+    return client
+
+def _waitUntil(check, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while not check():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.02)
+
+def _values(broker: Broker, topic: str):
+    return [m.payload.decode() for m in broker.received if m.topic == topic]
+
+def test_spool_can_be_disabled(broker, spoolPath, monkeypatch, tmp_path):
+    # An empty MQTT_SPOOL_PATH is ignored like every other empty setting, so there is a switch
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("MQTT_SPOOL_PATH", "")
+    assert MQTT(clientId="test-enabled", onMessage=None).spool is not None
+    monkeypatch.setenv("MQTT_SPOOL_ENABLED", "false")
+    assert MQTT(clientId="test-disabled", onMessage=None).spool is None
+
+def test_outage_is_spooled_and_drained(broker, spoolPath):
+    client = _client("test-outage")
+    port = broker.port
+    broker.stop()
+    _waitUntil(lambda: not client._connected)
+
+    batch = client.publishMany([("t/a", "1", True, 1), ("t/a", "2", True, 1), ("t/b", "1", True, 1)])
+    assert batch.wait(1) and batch.spooled == 3
+
+    with Broker(port=port) as back:
+        _waitUntil(lambda: client.spool.empty)
+        # Only the newest value of a topic is sent
+        assert _values(back, "t/a") == ["2"]
+        assert _values(back, "t/b") == ["1"]
+    client.stop()
+
+def test_live_publishes_skip_the_spool_while_connected(broker, spoolPath, monkeypatch):
+    monkeypatch.setenv("MQTT_SPOOL_DRAIN_BATCH", "1")
+    monkeypatch.setenv("MQTT_SPOOL_DRAIN_RATE", "2")
+    client = _client("test-live")
+    port = broker.port
+    broker.stop()
+    _waitUntil(lambda: not client._connected)
+    client.publishMany([(f"t/{n}", "stale", True, 1) for n in range(4)])
+
+    with Broker(port=port) as back:
+        _waitUntil(lambda: client._connected)
+        assert not client.spool.empty
+        batch = client.publishMany([("t/3", "live", True, 1)])
+        assert batch.wait(5) and batch.delivered == 1 and batch.spooled == 0
+
+        _waitUntil(lambda: client.spool.empty)
+        # The stale value the live one replaced is never sent after it
+        assert _values(back, "t/3") == ["live"]
+        assert back.retained["t/3"] == b"live"
+    client.stop()
+
+def test_stalled_drain_is_retried(broker, spoolPath):
+    # A spool left over from before a restart, its first batch is not acknowledged in time
+    spool = Spool(spoolPath, 1024 * 1024)
+    spool.put("t/a", "1", True, 1)
+    spool.close()
+    broker.ackDelay = 1.0
+
+    client = MQTT(clientId="test-stall", onMessage=lambda *args: None)
+    client.publishTimeout = 0.2
+    client.drainRetrySecs = 0.1
+    client.begin()
+    _waitUntil(lambda: client._connected)
+    time.sleep(0.5)
+    assert not client.spool.empty
+    broker.ackDelay = 0.0
+
+    # Drained without another connect to wake the drain
+    _waitUntil(lambda: client.spool.empty)
+    assert broker.connects == 1
+    client.stop()
+
+def test_supersede_keeps_spooled_history_unretained(tmp_path):
+    spool = Spool(str(tmp_path / "spool.jsonl"), 1024 * 1024, history=["h/#"])
+    spool.put("t/a", "1", True, 1)
+    spool.put("h/a", "1", True, 1)
+    spool.put("t/b", "1", True, 1)
+    spool.supersede("t/a")
+    spool.supersede("h/a")
+    messages, position = spool.take(10)
+    assert messages == [("h/a", "1", False, 1), ("t/b", "1", True, 1)]
+    spool.close()
+
+    # The superseded value does not come back after a restart
+    spool = Spool(str(tmp_path / "spool.jsonl"), 1024 * 1024, history=["h/#"])
+    assert [m[0] for m in spool.take(10)[0]] == ["h/a", "t/b"]
+    spool.close()
+
+def test_live_publish_during_a_drain_batch_wins(broker, spoolPath):
+    spool = Spool(spoolPath, 1024 * 1024)
+    spool.put("t/a", "stale", True, 1)
+    spool.put("t/b", "stale", True, 1)
+    spool.close()
+
+    client = MQTT(clientId="test-interleave", onMessage=lambda *args: None)
+    take = client.spool.take
+
+    def takeThenPublishLive(limit):
+        taken = take(limit)
+        # The batch is taken, the poller publishes the same topic before it is sent
+        client.publishMany([("t/a", "live", True, 1)])
+        return taken
+
+    client.spool.take = takeThenPublishLive
+    client.begin()
+    _waitUntil(lambda: client.spool.empty)
+    assert _values(broker, "t/a") == ["live"]
+    assert broker.retained["t/a"] == b"live"
+    assert broker.retained["t/b"] == b"stale"
+    client.stop()
@@ -0,0 +1,80 @@
+import pytest
+
+from Models.config import Config
+from Utils import Navigator as NavigatorModule
+from Utils.Boiler import Boiler
+from Utils.Emulator import Emulator
+from Utils.Metrics import Metrics
+from Utils.Navigator import Navigator
+
+MENU = [title.lower() for title in Emulator.menu]
+
+@pytest.fixture
+def navMetrics(monkeypatch) -> Metrics:
+    fresh = Metrics()
+    fresh.enable()
+    monkeypatch.setattr(NavigatorModule, "metrics", fresh)
+    return fresh
+
+def _navigate(nav: Navigator, start: int) -> int:
+    """Walk the emulator's menu ring from `start` to the status screen, returns the clicks it took."""
+    screen, clicks = start, 0
+    while MENU[screen] != nav.target:
+        move = nav.nextMove(MENU[screen])
+        before = MENU[screen]
+        screen = (screen + (1 if move == Navigator.DOWN else -1)) % len(MENU)
+        nav.observe(before, move, MENU[screen])
+        clicks += 1
+        assert clicks < 2 * len(MENU)
+    nav.record(clicks, 0.0)
+    return clicks
+
+def test_learns_the_shortest_way_back():
+    nav = Navigator()
+    # Up goes to the previous screen, the first trip explores upwards through the whole menu
+    assert _navigate(nav, len(MENU) - 1) == len(MENU) - 1
+    for start in range(1, len(MENU)):
+        assert _navigate(nav, start) == min(start, len(MENU) - start)
+
+def test_up_only_without_a_down_command():
+    nav = Navigator(useDown=False)
+    for start in range(1, len(MENU)):
+        assert _navigate(nav, start) == start
+
+def test_stats(navMetrics):
+    nav = Navigator(controller="a")
+    nav.record(3, 1.5)
+    nav.record(1, 0.5)
+    nav.record(0, 0.0)
+    assert nav.stats["avg_clicks"] == pytest.approx(4 / 3)
+    assert nav.stats["max_clicks"] == 3
+    assert nav.stats["max_secs"] == 1.5
+
+def test_exports_clicks_per_cycle(navMetrics):
+    nav = Navigator(controller="a")
+    nav.record(3, 0.0)
+    nav.record(1, 0.0)
+
+    text = navMetrics.render()
+    assert '# TYPE boiler_nav_clicks_avg gauge' in text
+    assert 'boiler_nav_clicks_avg{controller="a"} 2.0' in text
+    assert 'boiler_nav_clicks_max{controller="a"} 3' in text
+    assert 'boiler_nav_clicks_total{controller="a"} 4' in text
+    assert 'boiler_nav_cycles_total{controller="a"} 2' in text
+
+    summary = navMetrics.summary(controller="a")
+    assert summary["nav-clicks-avg"] == "2"
+    assert summary["nav-clicks-max"] == "3"
+    assert "nav-clicks-avg" not in navMetrics.summary(controller="b")
+
+def test_boiler_records_its_navigation(db, navMetrics):
+    with Emulator(seed=0) as emulator:
+        emulator.screen = 3
+        boiler = Boiler(db=db, config=Config(HM_URL=emulator.url, HM_CLICK_DELAY_SECS=0, HM_CLICK_DOWN_CMD=emulator.downCommand), name="nav")
+        boiler.getData(force=True)
+        boiler.getData(force=True)
+        boiler.close()
+
+    assert boiler._nav.stats["cycles"] == 2
+    assert 'boiler_nav_clicks_max{controller="nav"} 3' in navMetrics.render()
+    assert 'boiler_nav_clicks_avg{controller="nav"} 1.5' in navMetrics.render()
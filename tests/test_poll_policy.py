@@ -0,0 +1,74 @@
+import pytest
+
+from Models.BoilerData import BoilerData, BoilerStatus
+from Models.config import Config
+from Utils.Boiler import Boiler
+from Utils.Emulator import Emulator
+from Utils.PollPolicy import PollPolicy
+
+def _policy(**settings) -> PollPolicy:
+    return PollPolicy(Config(POLL_ADAPTIVE=True, UPDATE_BOILER_SECS=15, POLL_MIN_SECS=5, POLL_MAX_SECS=120, POLL_BACKOFF=2, **settings))
+
+def _data(status: BoilerStatus = BoilerStatus.HEATING, **fields) -> BoilerData:
+    bd = BoilerData(status=status)
+    for name, value in fields.items():
+        if name in PollPolicy.flags:
+            getattr(bd, name).value = value
+        else:
+            setattr(bd, name, value)
+    return bd
+
+def test_fixed_interval_by_default():
+    policy = PollPolicy(Config(UPDATE_BOILER_SECS=15))
+    assert policy.nextInterval(_data(BoilerStatus.IDLE)) == (15.0, "fixed interval")
+
+def test_missing_data_keeps_the_base_interval():
+    assert _policy().nextInterval(None) == (15.0, "no data")
+
+def test_quiet_boiler_backs_off_to_the_maximum():
+    policy = _policy()
+    intervals = [policy.nextInterval(_data(BoilerStatus.IDLE))[0] for _ in range(5)]
+    assert intervals == [30.0, 60.0, 120.0, 120.0, 120.0]
+    assert policy.nextInterval(_data(BoilerStatus.HEATING)) == (5.0, "status changed IDLE -> HEATING")
+    assert policy.nextInterval(_data(BoilerStatus.HEATING))[0] == 15.0
+
+def test_flag_flip_polls_at_the_minimum_once():
+    policy = _policy()
+    bd = _data(bypass=False)
+    assert policy.nextInterval(bd)[0] == 15.0
+    bd.bypass.value = True
+    assert policy.nextInterval(bd) == (5.0, "bypass changed to True")
+    # A cycle that does not read the flag leaves TrackedBool.changed set, that is not another flip
+    assert bd.bypass.changed
+    assert policy.nextInterval(bd)[0] == 15.0
+
+def test_offline_data_is_not_a_flip():
+    policy = _policy()
+    policy.nextInterval(_data(bypass=True))
+    assert policy.nextInterval(_data(BoilerStatus.OFFLINE, bypass=False))[0] == 15.0
+    assert policy.nextInterval(_data(bypass=True))[1].startswith("status changed")
+    assert policy.nextInterval(_data(bypass=True))[0] == 15.0
+
+@pytest.mark.parametrize("field, value, reason", [
+    ("waterSlope", 0.5, "water temp moving"),  # 0.5°F per 15s sample is 2°F/min
+    ("o2Slope", -0.2, "O2 moving"),
+])
+def test_fast_moving_values_poll_at_the_minimum(field, value, reason):
+    policy = _policy()
+    policy.nextInterval(_data())
+    interval, why = policy.nextInterval(_data(**{field: value}))
+    assert interval == 5.0 and why.startswith(reason)
+
+def test_slow_tier_flip_is_reported_once(db):
+    # Unbatched, otherwise the slow variables share a request with bypass and are read every cycle
+    with Emulator(seed=0) as emulator:
+        boiler = Boiler(db=db, config=Config(HM_URL=emulator.url, HM_CLICK_DELAY_SECS=0, HM_SLOW_VARS_EVERY=4, HM_BATCH_READS=False, POLL_ADAPTIVE=True))
+        policy = PollPolicy(boiler.config)
+        reasons = []
+        for cycle in range(12):
+            if cycle == 2:
+                emulator.setValues(coldStart=1)
+            reasons.append(policy.nextInterval(boiler.getData(force=True))[1])
+        boiler.close()
+
+    assert sum(r.startswith("coldStart changed") for r in reasons) == 1
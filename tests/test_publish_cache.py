@@ -0,0 +1,39 @@
+import threading
+
+import Utils.PublishCache as PublishCacheModule
+from Utils.Metrics import Metrics
+from Utils.PublishCache import PublishCache
+
+def test_counts_every_call_across_threads():
+    cache = PublishCache()
+    threads, calls = 8, 5000
+
+    def publish(n: int):
+        for i in range(calls):
+            cache.changed(f"topic/{i % 10}", str(n))
+
+    workers = [threading.Thread(target=publish, args=(n,)) for n in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    stats = cache.stats
+    assert stats["sent"] + stats["suppressed"] == threads * calls
+
+def test_counters_are_per_instance():
+    first, second = PublishCache(), PublishCache()
+    first.changed("a", "1")
+    first.changed("a", "1")
+    assert first.stats == {"sent": 1, "suppressed": 1}
+    assert second.stats == {"sent": 0, "suppressed": 0}
+
+def test_results_are_counted_in_metrics(monkeypatch):
+    enabled = Metrics()
+    enabled.enable()
+    monkeypatch.setattr(PublishCacheModule, "metrics", enabled)
+    cache = PublishCache()
+    for payload in ("1", "1", "1", "2"):
+        cache.changed("a", payload)
+    text = enabled.render()
+    assert 'boiler_mqtt_messages_total{result="sent"} 2' in text
+    assert 'boiler_mqtt_messages_total{result="suppressed"} 2' in text
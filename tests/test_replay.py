@@ -0,0 +1,98 @@
+import json
+import os
+
+import arrow
+import pytest
+
+from Database.Database import Dbase
+from Models.config import Config
+from Utils.Boiler import Boiler
+from Utils.Emulator import Emulator
+from Utils.Replay import Recorder, Replayer
+
+RECORDING = os.path.join(os.path.dirname(__file__), "fixtures", "boiler-emulator.jsonl")
+
+@pytest.fixture(autouse=True)
+def cleanup():
+    yield
+    Dbase._listeners.clear()
+    Dbase._latest.clear()
+
+def _record(path, tmp_path, cycles: int = 12):
+    with Emulator(seed=3) as emulator:
+        emulator.setValues(o2=lambda secs: 300 + int(secs * 1000) % 400)
+        db = Dbase(str(tmp_path / "recorded.sqlite"))
+        db.connect()
+        db.create_tables()
+        db.scoped("boiler").eventWoodFilled(ts=arrow.get("2024-01-01T06:00:00"))
+        boiler = Boiler(db=db, config=Config(HM_URL=emulator.url, HM_CLICK_DELAY_SECS=0, HM_PASSWORD=emulator.password))
+        recorder = Recorder(str(path), boiler)
+        for cycle in range(cycles):
+            if cycle == 3:
+                emulator.screen = 4
+            if cycle == 5:
+                emulator.inject("drop", command="GETVARS")
+            if cycle == 7:
+                emulator.inject("logout")
+                boiler.addWoodFill(arrow.utcnow().shift(minutes=-5))
+            if cycle == 9:
+                emulator.status = "Idle"
+            try:
+                boiler.getData(force=True)
+            except Exception:
+                pass
+        recorder.close()
+        boiler.close()
+        db.close()
+    Dbase._listeners.clear()
+    Dbase._latest.clear()
+
+def test_fixture_replays_without_mismatches():
+    result = Replayer(RECORDING).run()
+    assert result.mismatches == []
+    assert result.cycles == 40
+
+def test_live_recording_round_trips(tmp_path):
+    path = tmp_path / "boiler.jsonl"
+    _record(path, tmp_path)
+    result = Replayer(str(path)).run()
+    assert result.mismatches == []
+    assert result.cycles == 12
+    assert result.recordedSeconds > 0
+
+def test_recording_leaves_out_secrets(tmp_path):
+    path = tmp_path / "boiler.jsonl"
+    _record(path, tmp_path, cycles=2)
+    text = path.read_text()
+    header = json.loads(text.splitlines()[0])
+    assert "HM_PASSWORD" not in header["config"] and "MQTT_PASSWORD" not in header["config"]
+    assert "heatmaster" not in text
+    for line in text.splitlines()[1:]:
+        for command, _, _ in json.loads(line).get("exchanges", []):
+            if command.startswith(("UAMCHAL", "UAMLOGIN")):
+                assert command in ("UAMCHAL", "UAMLOGIN")
+
+def test_changed_reply_is_reported(tmp_path):
+    lines = open(RECORDING).read().splitlines()
+    cycle = json.loads(lines[5])
+    for exchange in cycle["exchanges"]:
+        if exchange[0].startswith("GETVARS:v0,18,"):
+            # Different water temp and O2 from the controller
+            exchange[2] = '<d><r v="' + "0" * (len(exchange[2]) - 16) + '"/></d>'
+    lines[5] = json.dumps(cycle)
+    path = tmp_path / "changed.jsonl"
+    path.write_text("\n".join(lines) + "\n")
+
+    result = Replayer(str(path)).run()
+    assert any(m.startswith("cycle 4: BoilerData differs in") for m in result.mismatches)
+
+def test_missing_exchange_is_reported(tmp_path):
+    lines = open(RECORDING).read().splitlines()
+    cycle = json.loads(lines[3])
+    cycle["exchanges"] = [e for e in cycle["exchanges"] if not e[0].startswith("MSGGET")]
+    lines[3] = json.dumps(cycle)
+    path = tmp_path / "missing.jsonl"
+    path.write_text("\n".join(lines) + "\n")
+
+    result = Replayer(str(path)).run()
+    assert any("No recorded reply for MSGGET" in m for m in result.mismatches)
@@ -0,0 +1,77 @@
+from collections import deque
+
+import numpy as np
+import pytest
+
+from Utils.RollingStats import RollingStats
+
+def _expected(window):
+    values = np.asarray(window, dtype=np.float64)
+    x = np.arange(values.size) - (values.size - 1) / 2
+    return {
+        "mean": values.mean(),
+        "variance": values.var(),
+        "slope": np.dot(x, values) / np.dot(x, x),
+        "min": values.min(),
+        "max": values.max(),
+    }
+
+def _check(stats: RollingStats, window, rel: float = 1e-9, abs: float = 1e-9):
+    np.testing.assert_array_equal(stats.values, np.asarray(window))
+    for name, value in _expected(window).items():
+        assert getattr(stats, name) == pytest.approx(value, rel=rel, abs=abs), name
+
+@pytest.mark.parametrize("length", [2, 8, 1000])
+def test_matches_numpy_over_a_long_sequence(length):
+    rng = np.random.default_rng(length)
+    stats = RollingStats(length, fill=165.0)
+    window = deque([165.0] * length, maxlen=length)
+    # A wandering signal with repeats, so the min / max queues see ties
+    samples = np.round(165 + np.cumsum(rng.normal(0, 0.5, 5 * length + 997)), 1)
+    for value in samples:
+        stats.push(float(value))
+        window.append(float(value))
+        _check(stats, window, abs=1e-7)
+
+def test_too_short_window_is_refused():
+    with pytest.raises(ValueError):
+        RollingStats(1)
+
+def test_fill_resets_the_window():
+    stats = RollingStats(8)
+    for value in range(13):
+        stats.push(float(value))
+    stats.fill(3.0)
+    window = deque([3.0] * 8, maxlen=8)
+    _check(stats, window)
+    assert stats.slope == 0.0 and stats.variance == 0.0
+    for value in (5.0, 1.0, 9.0):
+        stats.push(value)
+        window.append(value)
+        _check(stats, window)
+
+@pytest.mark.parametrize("pushes", [7, 8, 9, 15, 16, 17])
+def test_around_the_periodic_resum(pushes):
+    # The sums are recomputed after every `length` pushes, values either side of that must agree
+    rng = np.random.default_rng(pushes)
+    stats = RollingStats(8, fill=1.0)
+    window = deque([1.0] * 8, maxlen=8)
+    for value in rng.uniform(-5, 5, pushes):
+        stats.push(float(value))
+        window.append(float(value))
+    assert stats._sinceSum == pushes % 8
+    _check(stats, window)
+
+def test_resum_stops_float_drift():
+    # Rounding errors picked up while the signal was large stay in running sums after it comes back down
+    rng = np.random.default_rng(7)
+    stats = RollingStats(8)
+    window = deque([0.0] * 8, maxlen=8)
+    ramp = np.concatenate((np.linspace(0, 1e6, 10000), np.linspace(1e6, 0, 10000), np.zeros(100)))
+    for value in ramp + rng.normal(0, 1, ramp.size):
+        stats.push(float(value))
+        window.append(float(value))
+    expected = _expected(window)
+    assert stats.variance == pytest.approx(expected["variance"], rel=1e-6)
+    assert stats.slope == pytest.approx(expected["slope"], rel=1e-6, abs=1e-9)
+    assert stats.mean == pytest.approx(expected["mean"], rel=1e-6, abs=1e-9)
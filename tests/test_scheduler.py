@@ -0,0 +1,137 @@
+import threading
+import time
+
+from Utils.Scheduler import Scheduler
+
+def _run(scheduler: Scheduler, seconds: float):
+    thread = threading.Thread(target=scheduler.run, daemon=True)
+    thread.start()
+    time.sleep(seconds)
+    scheduler.stop()
+    thread.join(5)
+
+def _recorder(starts: list, name: str = "", busy: float = 0.0):
+    def task():
+        starts.append((name, time.monotonic()))
+        if busy:
+            time.sleep(busy)
+    return task
+
+def test_wake_runs_a_task_early():
+    scheduler = Scheduler()
+    ran = threading.Event()
+    scheduler.addTask("poll", 60, ran.set)
+    thread = threading.Thread(target=scheduler.run, daemon=True)
+    thread.start()
+    scheduler.wake("poll")
+    assert ran.wait(5)
+    assert scheduler.stats()["poll"].wakes == 1
+    scheduler.stop()
+    thread.join(5)
+
+def test_wake_of_an_unknown_task_is_ignored():
+    # e.g. a command arriving before main.py registered the poll task
+    scheduler = Scheduler()
+    scheduler.wake("boiler/nope")
+    assert scheduler.stats() == {}
+
+def test_tasks_run_in_deadline_order():
+    scheduler = Scheduler()
+    starts = []
+    for name, interval in (("slow", 0.35), ("fast", 0.1), ("middle", 0.25)):
+        scheduler.addTask(name, interval, _recorder(starts, name))
+    _run(scheduler, 0.4)
+    assert [name for name, _ in starts][:5] == ["fast", "fast", "middle", "fast", "slow"]
+
+def test_cadence_does_not_drift_with_the_run_time():
+    scheduler = Scheduler()
+    starts = []
+    # Each run takes a third of the interval, the next deadline still counts from the last one
+    scheduler.addTask("poll", 0.1, _recorder(starts, busy=0.03), runNow=True)
+    _run(scheduler, 1.05)
+    times = [t for _, t in starts]
+    assert len(times) >= 10
+    for k, t in enumerate(times[:10]):
+        assert abs(t - times[0] - k * 0.1) < 0.05, k
+
+def test_overrun_is_not_caught_up_in_a_burst():
+    scheduler = Scheduler()
+    starts = []
+
+    def task():
+        starts.append(time.monotonic())
+        if len(starts) == 1:
+            time.sleep(0.45)  # Misses four deadlines
+
+    scheduler.addTask("poll", 0.1, task, runNow=True)
+    _run(scheduler, 0.9)
+    gaps = [b - a for a, b in zip(starts, starts[1:])]
+    # Straight after the overrun, then back to the interval from there
+    assert 0.4 < gaps[0] < 0.55
+    assert all(gap > 0.07 for gap in gaps[1:])
+    assert len(starts) <= 7
+
+def test_set_interval_applies_from_the_next_run():
+    scheduler = Scheduler()
+    starts = []
+    scheduler.addTask("poll", 10, _recorder(starts), runNow=True)
+    scheduler.setInterval("poll", 0.05)
+    _run(scheduler, 0.32)
+    assert 5 <= len(starts) <= 8
+
+def test_pooled_task_never_overlaps_itself():
+    scheduler = Scheduler(workers=4)
+    state = {"now": 0, "peak": 0, "runs": 0}
+    lock = threading.Lock()
+
+    def task():
+        with lock:
+            state["now"] += 1
+            state["peak"] = max(state["peak"], state["now"])
+        time.sleep(0.05)
+        with lock:
+            state["now"] -= 1
+            state["runs"] += 1
+
+    scheduler.addTask("poll", 0.01, task, runNow=True, pooled=True)
+    thread = threading.Thread(target=scheduler.run, daemon=True)
+    thread.start()
+    for _ in range(20):
+        scheduler.wake("poll")
+        time.sleep(0.01)
+    time.sleep(0.1)
+    scheduler.stop()
+    thread.join(5)
+    assert state["peak"] == 1
+    assert state["runs"] >= 3
+
+def test_pooled_tasks_do_not_hold_each_other_up():
+    scheduler = Scheduler(workers=2)
+    starts = []
+    scheduler.addTask("slow", 10, _recorder(starts, "slow", busy=0.5), runNow=True, pooled=True)
+    scheduler.addTask("fast", 0.05, _recorder(starts, "fast"), pooled=True)
+    _run(scheduler, 0.3)
+    assert sum(name == "fast" for name, _ in starts) >= 3
+
+def test_stats_count_runs_wakes_and_times():
+    scheduler = Scheduler()
+    scheduler.addTask("poll", 0.1, _recorder([], busy=0.02), runNow=True)
+    scheduler.addTask("idle", 60, _recorder([]))
+    thread = threading.Thread(target=scheduler.run, daemon=True)
+    thread.start()
+    time.sleep(0.05)
+    scheduler.wake("poll")
+    time.sleep(0.3)
+    scheduler.stop()
+    thread.join(5)
+
+    stats = scheduler.stats()
+    assert set(stats) == {"poll", "idle"}
+    poll = stats["poll"]
+    assert poll.wakes == 1
+    assert 3 <= poll.runs <= 6
+    assert poll.runMax >= 0.02 and 0.02 <= poll.runAvg <= poll.runMax
+    assert poll.runTotal >= poll.runs * 0.02
+    assert 0 <= poll.lateAvg <= poll.lateMax < 0.1
+    assert stats["idle"].runs == 0 and stats["idle"].runAvg == 0.0
+    assert "runs=" in str(poll)
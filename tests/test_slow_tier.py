@@ -0,0 +1,96 @@
+import pytest
+
+from Models.config import Config
+from Utils.Boiler import Boiler
+from Utils.Emulator import Emulator
+
+@pytest.fixture
+def emulator():
+    with Emulator(seed=0) as e:
+        yield e
+
+def _boiler(db, emulator: Emulator, **settings) -> Boiler:
+    settings.setdefault("HM_BATCH_READS", False)
+    return Boiler(db=db, config=Config(HM_URL=emulator.url, HM_CLICK_DELAY_SECS=0, **settings))
+
+def _plans(boiler: Boiler):
+    """GETVARS requests of a full cycle and of a cycle without the slow variables."""
+    return len(boiler._readPlan.reads), len(boiler._fastPlan.reads)
+
+def _reads(emulator: Emulator, boiler: Boiler, cycles: int):
+    """GETVARS requests of each of the next `cycles` poll cycles."""
+    counts = []
+    for _ in range(cycles):
+        emulator.resetStats()
+        boiler.getData(force=True)
+        counts.append(emulator.stats.get("GETVARS", 0))
+    return counts
+
+def test_slow_variables_are_read_every_n_cycles(db, emulator):
+    boiler = _boiler(db, emulator, HM_SLOW_VARS_EVERY=4)
+    full, fast = _plans(boiler)
+    assert fast == full - 3  # lowWater, coldStart and highLimit
+    assert _reads(emulator, boiler, 8) == [full, fast, fast, fast, full, fast, fast, fast]
+    boiler.close()
+
+def test_every_cycle_reads_everything_when_set_to_one(db, emulator):
+    boiler = _boiler(db, emulator, HM_SLOW_VARS_EVERY=1)
+    assert _reads(emulator, boiler, 3) == [_plans(boiler)[0]] * 3
+    boiler.close()
+
+def test_skipped_variables_keep_their_last_value(db, emulator):
+    boiler = _boiler(db, emulator, HM_SLOW_VARS_EVERY=4)
+    boiler.getData(force=True)
+    lowWater = boiler.boilerData.lowWater
+    emulator.setValues(lowWater=1 - emulator.defaults["lowWater"])
+    boiler.getData(force=True)
+    assert boiler.boilerData.lowWater == lowWater
+    boiler.getData(force=True)
+    boiler.getData(force=True)
+    boiler.getData(force=True)  # Fifth cycle reads the slow tier again
+    assert boiler.boilerData.lowWater != lowWater
+    boiler.close()
+
+def test_status_change_reads_everything(db, emulator):
+    boiler = _boiler(db, emulator, HM_SLOW_VARS_EVERY=4)
+    full, fast = _plans(boiler)
+    _reads(emulator, boiler, 2)
+    emulator.status = "Idle"
+    assert _reads(emulator, boiler, 2) == [full, fast]
+    boiler.close()
+
+def test_alarm_reads_everything(db, emulator):
+    boiler = _boiler(db, emulator, HM_SLOW_VARS_EVERY=4)
+    full, fast = _plans(boiler)
+    _reads(emulator, boiler, 2)
+    emulator.setValues(alarmLt=1)
+    # The slow tier is read straight after the fast one, in the same cycle, for as long as the alarm is on
+    assert _reads(emulator, boiler, 2) == [full, full]
+    emulator.setValues(alarmLt=0)
+    # Then back to the schedule, where the fifth cycle reads everything anyway
+    assert _reads(emulator, boiler, 3) == [full, fast, fast]
+    boiler.close()
+
+def test_full_refresh_on_request(db, emulator):
+    boiler = _boiler(db, emulator, HM_SLOW_VARS_EVERY=4)
+    full, fast = _plans(boiler)
+    _reads(emulator, boiler, 2)
+    boiler.requestFullRefresh()
+    assert _reads(emulator, boiler, 2) == [full, fast]
+    boiler.close()
+
+def test_batched_reads_do_not_skip(db, emulator):
+    # The slow variables share their GETVARS request with bypass, skipping them would save nothing
+    boiler = _boiler(db, emulator, HM_BATCH_READS=True, HM_SLOW_VARS_EVERY=4)
+    counts = _reads(emulator, boiler, 4)
+    assert len(set(counts)) == 1
+    boiler.getData(force=True)
+    assert boiler.boilerData.lowWater is not None
+    boiler.close()
+
+def test_unknown_slow_variables_are_ignored(db, emulator):
+    boiler = _boiler(db, emulator, HM_SLOW_VARS="lowWater,nope", HM_SLOW_VARS_EVERY=4)
+    full, fast = _plans(boiler)
+    assert fast == full - 1
+    assert _reads(emulator, boiler, 2) == [full, fast]
+    boiler.close()
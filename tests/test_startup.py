@@ -0,0 +1,28 @@
+import pytest
+
+import startup
+
+# Budgets with headroom over a typical run (about 0.6s of imports and 66 MiB) so slower machines still pass
+MAX_IMPORT_SECS = 3.0
+MAX_RSS_MIB = 150.0
+MAX_FIRST_PUBLISH_SECS = 10.0
+
+def test_parse_import_times_sums_top_level_only():
+    lines = [
+        "import time: self [us] | cumulative | imported package",
+        "import time:       100 |        100 |   _io",
+        "import time:       200 |        300 | io",
+        "import time:        50 |         50 |     nested",
+        "import time:       400 |       1000 | Utils.Boiler",
+        "INFO some log line",
+    ]
+    total, slowest = startup.parseImportTimes(lines)
+    assert total == pytest.approx(0.0013)
+    assert slowest == [("Utils.Boiler", 0.001), ("io", 0.0003)]
+
+def test_main_starts_within_budget():
+    result = startup.measure(timeout=30.0)
+    assert result["published"], "\n".join(result["log"][-20:])
+    assert result["import_secs"] < MAX_IMPORT_SECS, result["slowest_imports"]
+    assert result["first_publish_secs"] < MAX_FIRST_PUBLISH_SECS
+    assert result["peak_rss_mib"] < MAX_RSS_MIB
@@ -0,0 +1,80 @@
+import json
+import struct
+
+import arrow
+import pytest
+
+from Models.BoilerData import BoilerData, BoilerStatus
+from Utils.StateEncoder import StateEncoder
+
+def _unpack(data: bytes, pos: int = 0):
+    """Decoder for the MessagePack subset StateEncoder writes. Returns (value, next position)."""
+    kind = data[pos]
+    if kind < 0x80:
+        return kind, pos + 1
+    if kind & 0xf0 == 0x80 or kind == 0xde:
+        count, pos = (kind & 0x0f, pos + 1) if kind != 0xde else (struct.unpack_from('>H', data, pos + 1)[0], pos + 3)
+        result = {}
+        for _ in range(count):
+            key, pos = _unpack(data, pos)
+            result[key], pos = _unpack(data, pos)
+        return result, pos
+    if kind & 0xe0 == 0xa0 or kind in (0xd9, 0xda, 0xdb):
+        if kind & 0xe0 == 0xa0:
+            n, pos = kind & 0x1f, pos + 1
+        else:
+            size = {0xd9: 'B', 0xda: '>H', 0xdb: '>I'}[kind]
+            n = struct.unpack_from(size, data, pos + 1)[0]
+            pos += 1 + struct.calcsize(size)
+        return data[pos:pos + n].decode(), pos + n
+    if kind == 0xcb:
+        return struct.unpack_from('>d', data, pos + 1)[0], pos + 9
+    if kind == 0xd3:
+        return struct.unpack_from('>q', data, pos + 1)[0], pos + 9
+    return {0xc0: None, 0xc2: False, 0xc3: True}[kind], pos + 1
+
+def _decode(encoder: StateEncoder, payload: bytes):
+    if encoder.format == "json":
+        return json.loads(payload)
+    value, end = _unpack(payload)
+    assert end == len(payload)
+    return value
+
+def _data(now: arrow.Arrow) -> BoilerData:
+    bd = BoilerData(status=BoilerStatus.HEATING, waterTemp=165.5, o2=8.25, ts=now)
+    bd.bypass.value = True
+    bd.fieldTs = {"status": now, "waterTemp": now.shift(seconds=-15), "lowWater": now.shift(seconds=-62.5)}
+    return bd
+
+@pytest.mark.parametrize("format", StateEncoder.formats)
+def test_encodes_every_field(format):
+    now = arrow.get("2024-01-01T12:00:00")
+    encoder = StateEncoder("boiler", format)
+    state = _decode(encoder, encoder.encode(_data(now), now=now))
+    assert state["controller"] == "boiler"
+    assert state["status"] == BoilerStatus.HEATING.value
+    assert state["waterTemp"] == 165.5 and state["o2"] == 8.25
+    assert state["bypass"] is True
+    assert "fieldTs" not in state
+    assert set(state) == set(encoder.names) | {"controller", "age"}
+
+@pytest.mark.parametrize("format", StateEncoder.formats)
+def test_ages_are_seconds_since_each_read(format):
+    now = arrow.get("2024-01-01T12:00:00")
+    encoder = StateEncoder("boiler", format)
+    bd = _data(now)
+    state = _decode(encoder, encoder.encode(bd, now=now.shift(seconds=5)))
+    assert state["age"] == {"status": 5.0, "waterTemp": 20.0, "lowWater": 67.5}
+    # Encoded keys are reused, a new variable still gets one
+    bd.fieldTs["coldStart"] = now
+    state = _decode(encoder, encoder.encode(bd, now=now))
+    assert state["age"] == {"status": 0.0, "waterTemp": 15.0, "lowWater": 62.5, "coldStart": 0.0}
+
+@pytest.mark.parametrize("format", StateEncoder.formats)
+def test_nothing_read_yet_is_an_empty_age_map(format):
+    encoder = StateEncoder("boiler", format)
+    assert _decode(encoder, encoder.encode(BoilerData()))["age"] == {}
+
+def test_unknown_format_is_rejected():
+    with pytest.raises(ValueError):
+        StateEncoder("boiler", "xml")
@@ -0,0 +1,101 @@
+import os
+
+import arrow
+import numpy as np
+
+from Database.Telemetry import TelemetryStore
+from Models.BoilerData import BoilerData, BoilerStatus
+
+START = arrow.get("2024-03-01T22:00:00")
+
+def _sample(n: int, ts: arrow.Arrow) -> BoilerData:
+    bd = BoilerData(status=BoilerStatus.HEATING if n % 3 else BoilerStatus.IDLE, ts=ts)
+    bd.waterTemp = 150 + n * 0.5
+    bd.o2 = 8 + (n % 7) * 0.25
+    bd.woodLow = n % 5 == 0
+    bd.bypass.value = n % 2 == 0
+    return bd
+
+def _fill(store: TelemetryStore, count: int, stepMins: int = 30):
+    samples = [_sample(n, START.shift(minutes=n * stepMins)) for n in range(count)]
+    for bd in samples:
+        store.append(bd)
+    return samples
+
+def _micros(ts: arrow.Arrow) -> int:
+    return int(ts.timestamp()) * 1000000 + ts.microsecond
+
+def test_round_trip(tmp_path):
+    store = TelemetryStore(str(tmp_path))
+    samples = _fill(store, 4, stepMins=10)
+    store.close()
+
+    data = TelemetryStore(str(tmp_path)).read(START, START.shift(hours=1))
+    assert data["ts"].tolist() == [_micros(bd.ts) for bd in samples]
+    assert [TelemetryStore.statuses[i] for i in data["status"]] == [bd.status for bd in samples]
+    np.testing.assert_allclose(data["waterTemp"], [bd.waterTemp for bd in samples])
+    np.testing.assert_allclose(data["o2"], [bd.o2 for bd in samples])
+    assert data["woodLow"].tolist() == [int(bd.woodLow) for bd in samples]
+    assert data["bypass"].tolist() == [int(bd.bypass.value) for bd in samples]
+    assert set(data) == {name for name, _ in TelemetryStore.columns}
+
+def test_single_day_reads_are_memory_mapped_views(tmp_path):
+    store = TelemetryStore(str(tmp_path))
+    _fill(store, 4, stepMins=10)
+    data = store.read(START, START.shift(minutes=25))
+    assert data["ts"].size == 3
+    for column in data.values():
+        assert isinstance(column, np.memmap)
+    store.close()
+
+def test_reads_span_several_days(tmp_path):
+    store = TelemetryStore(str(tmp_path))
+    # 22:00 on the first to 23:30 on the third of March, one file set per UTC day
+    samples = _fill(store, 100)
+    store.close()
+    assert sorted(os.listdir(tmp_path)) == ["2024-03-01", "2024-03-02", "2024-03-03"]
+
+    data = store.read(START.shift(hours=1), START.shift(days=2))
+    expected = [_micros(bd.ts) for bd in samples if START.shift(hours=1) <= bd.ts < START.shift(days=2)]
+    assert data["ts"].tolist() == expected
+    assert np.all(np.diff(data["ts"]) > 0)
+    np.testing.assert_allclose(data["waterTemp"], [bd.waterTemp for bd in samples if START.shift(hours=1) <= bd.ts < START.shift(days=2)])
+
+def test_range_without_samples_is_empty(tmp_path):
+    store = TelemetryStore(str(tmp_path))
+    _fill(store, 3)
+    data = store.read(START.shift(days=10), START.shift(days=11))
+    assert all(column.size == 0 for column in data.values())
+    store.close()
+
+def test_partial_row_from_a_crash_is_trimmed(tmp_path):
+    store = TelemetryStore(str(tmp_path))
+    _fill(store, 3, stepMins=10)
+    store.close()
+
+    # Died part way through a fourth append: ts was written, o2 only half
+    day = tmp_path / "2024-03-01"
+    with open(day / "ts.bin", "ab") as f:
+        f.write(np.array(_micros(START.shift(minutes=30)), dtype="<i8").tobytes())
+    with open(day / "o2.bin", "ab") as f:
+        f.write(b"\x00\x00")
+
+    store = TelemetryStore(str(tmp_path))
+    # Reads ignore the partial row
+    assert store.read(START, START.shift(hours=1))["ts"].size == 3
+
+    # The next append trims it first, so the columns stay aligned
+    bd = _sample(9, START.shift(minutes=40))
+    store.append(bd)
+    store.close()
+    sizes = {name: os.path.getsize(day / f"{name}.bin") // np.dtype(dtype).itemsize for name, dtype in TelemetryStore.columns}
+    assert set(sizes.values()) == {4}
+    data = store.read(START, START.shift(hours=1))
+    assert data["ts"][-1] == _micros(bd.ts)
+    assert data["o2"][-1] == np.float32(bd.o2)
+
+def test_missing_samples_are_skipped(tmp_path):
+    store = TelemetryStore(str(tmp_path))
+    store.append(None)
+    store.append(BoilerData(ts=None))
+    assert not os.listdir(tmp_path)
@@ -0,0 +1,110 @@
+import random
+
+import arrow
+import numpy as np
+import pandas as pd
+import pytest
+
+from Utils.WoodForecaster import WoodForecaster
+
+OFFSET_HOURS = -3
+
+def _pandasNextFill(db, limit: int) -> arrow.Arrow:
+    """Boiler._calcNextWoodFill before the forecaster, kept as the reference it must match."""
+    df = pd.read_sql_query(f"SELECT ts as ds FROM event WHERE eventType == 'wood_filled' ORDER BY id DESC LIMIT {limit}", db.connection)
+
+    # Add a y column
+    df.insert(1, 'y', 0, True)
+
+    # Convert column ds to datetimes
+    for idx, row in df.iterrows():
+        df.loc[idx, 'ds'] = arrow.get(row['ds']).naive
+
+    df['ds'] = pd.DatetimeIndex(df['ds'])
+
+    # Convert y to floats
+    df = df.astype({"y": float})
+
+    # Calculate total seconds between events
+    for idx, row in df.iterrows():
+        if idx != 0:
+            cur = arrow.get(row['ds'])
+            prev = arrow.get(df.iloc[idx - 1]['ds'])
+            secs = (prev - cur).total_seconds()
+            df.loc[idx, 'y'] = secs / 60
+
+    # Index 0's y value
+    df.loc[0, 'y'] = df.loc[1, 'y']
+
+    # Drop the upper and lower 1% outliers
+    df_sub = df.loc[:, ['ds', 'y']]
+    lim = np.logical_and(df_sub['y'] < df_sub['y'].quantile(0.99),
+                         df_sub['y'] > df_sub['y'].quantile(0.01))
+
+    df.loc[:, ['y']] = df_sub.where(lim, np.nan)
+    df.dropna(inplace=True)
+
+    meanMins = np.mean(df.loc[:, 'y'])
+
+    lastFill = db.lastWoodFilled().ts
+    return lastFill.shift(minutes=meanMins).shift(hours=OFFSET_HOURS)
+
+def _history(rng: random.Random, count: int):
+    """Fill times about 8 hours apart with noise, some outliers and the odd fill logged out of order."""
+    fills = []
+    ts = arrow.get("2024-01-01T06:00:00")
+    for _ in range(count):
+        gap = rng.gauss(8 * 60, 40)
+        roll = rng.random()
+        if roll < 0.05:
+            gap = rng.uniform(1, 20)  # Bypass opened twice
+        elif roll < 0.1:
+            gap = rng.uniform(20 * 60, 40 * 60)  # Away for a day
+        ts = ts.shift(minutes=gap, microseconds=rng.randrange(1000000))
+        fills.append(ts)
+
+    for _ in range(count // 10):
+        i = rng.randrange(count - 1)
+        fills[i], fills[i + 1] = fills[i + 1], fills[i]
+    return fills
+
+def _assertSame(forecast: arrow.Arrow, reference: arrow.Arrow):
+    assert forecast is not None
+    assert abs((forecast - reference).total_seconds()) < 1e-3
+
+@pytest.mark.parametrize("seed", range(25))
+def test_load_matches_pandas(db, seed):
+    rng = random.Random(seed)
+    limit = rng.choice([4, 5, 10, 20, 40])
+    for ts in _history(rng, rng.randint(4, 60)):
+        db.eventWoodFilled(ts=ts)
+
+    forecaster = WoodForecaster(db.scoped(db.defaultController), limit=limit)
+    forecaster.load()
+
+    _assertSame(forecaster.nextFill(OFFSET_HOURS), _pandasNextFill(db, limit))
+
+@pytest.mark.parametrize("seed", range(10))
+def test_incremental_matches_pandas(db, seed):
+    rng = random.Random(1000 + seed)
+    limit = rng.choice([5, 20])
+    scoped = db.scoped(db.defaultController)
+    forecaster = WoodForecaster(scoped, limit=limit)
+    forecaster.load()
+    scoped.addListener(forecaster.onEvent)
+
+    for i, ts in enumerate(_history(rng, 40), start=1):
+        db.eventWoodFilled(ts=ts)
+        # The pandas version averages nothing and fails below 4 fills
+        if i >= 4:
+            _assertSame(forecaster.nextFill(OFFSET_HOURS), _pandasNextFill(db, limit))
+
+def test_too_few_fills(db):
+    forecaster = WoodForecaster(db.scoped(db.defaultController), limit=20)
+    forecaster.load()
+    assert forecaster.count == 0
+    assert forecaster.nextFill(OFFSET_HOURS) is None
+
+    db.eventWoodFilled(ts=arrow.get("2024-01-01T06:00:00"))
+    forecaster.load()
+    assert forecaster.nextFill(OFFSET_HOURS) is None